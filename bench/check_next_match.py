@@ -0,0 +1,137 @@
+"""
+Сверка VCron.get_next_match (арифметическое решение) с эталонным перебором croniter.
+
+Запуск из корня проекта:
+    python -m bench.check_next_match [--cases 300] [--seed 1] [--modes hourly,exact]
+
+Для случайных cron-выражений, модификаторов (d/N, w/N, m/N, с датой отсчёта и без,
+а также некорректных), временных зон и моментов начала поиска сравниваются
+get_next_match и _get_next_match_iterative. Перебор ограничен 9999 шагами croniter
+(без TLCR_EXACT_MINUTES поле минут заменяется на *, и шаг — минута подходящего часа), поэтому
+для редких правил он возвращает None, а арифметическое решение находит срабатывание дальше.
+Такие случаи считаются отдельно и проверяются просмотром всех дней до найденного
+момента (scan_days): ответ должен подходить под cron и модификатор, и раньше него
+срабатываний быть не должно.
+Любое другое расхождение печатается вместе с данными для воспроизведения; код выхода 1.
+Перебор медленный (до секунды на случай), поэтому прогон занимает несколько минут.
+"""
+import argparse
+import random
+import sys
+import time
+from datetime import datetime, timedelta
+
+from lib.cron_utils import VCron, compile_cron
+
+TIMEZONES = ("Europe/Moscow", "Europe/Berlin", "America/New_York", "Asia/Kolkata", "UTC")
+
+
+def random_field(rnd: random.Random, low: int, high: int) -> str:
+    roll = rnd.random()
+    if roll < 0.4:
+        return "*"
+    if roll < 0.6:
+        return f"*/{rnd.randint(2, 5)}"
+    if roll < 0.8:
+        return ",".join(str(value) for value in sorted(rnd.sample(range(low, high + 1), rnd.randint(1, 3))))
+    start = rnd.randint(low, high - 1)
+    return f"{start}-{rnd.randint(start + 1, high)}"
+
+
+def random_cron(rnd: random.Random) -> str:
+    minute = rnd.choice([str(rnd.randint(0, 59)), random_field(rnd, 0, 59)])
+    day = random_field(rnd, 1, 31) if rnd.random() < 0.5 else "*"
+    month = random_field(rnd, 1, 12) if rnd.random() < 0.3 else "*"
+    return f"{minute} {random_field(rnd, 0, 23)} {day} {month} {random_field(rnd, 0, 6)}"
+
+
+def random_modifier(rnd: random.Random) -> str:
+    roll = rnd.random()
+    if roll < 0.15:
+        return ""
+    if roll > 0.97:
+        return "20241301>d/2"  # некорректная дата отсчёта
+    if roll > 0.95:
+        return "19900515"  # правило без периода
+    anchor = "" if roll < 0.4 else (datetime(2020, 1, 1) + timedelta(days=rnd.randrange(3650))).strftime("%Y%m%d") + ">"
+    return f"{anchor}{rnd.choice('dwm')}/{rnd.choice([1, 2, 3, 4, 7, 10, 30])}"
+
+
+def iterative(vcron: VCron, cron: str, modifier: str, start: datetime) -> datetime | None:
+    try:
+        return vcron._get_next_match_iterative(cron, modifier, start_time=start)
+    except (ValueError, OverflowError):
+        # croniter не находит срабатываний невозможного правила (например, 30 февраля)
+        return None
+
+
+def scan_days(vcron: VCron, cron: str, modifier: str, start: datetime, until: datetime) -> datetime | None:
+    """
+    Первое срабатывание в [start, until]: каждый день, подходящий под модификатор и поля дней cron,
+    просматривается по часам (в режиме exact_minutes — по минутам) через check_cron.
+    """
+    days = compile_cron(cron)
+    day = start.date()
+    while day <= until.date():
+        noon = vcron.timezone.localize(datetime(day.year, day.month, day.day, 12))
+        if days.match_day(day) and vcron.check_modifier(modifier, noon):
+            moments = [start] if day == start.date() else []
+            for hour in range(24):
+                for minute in range(60) if vcron.exact_minutes else (0,):
+                    moment = vcron.timezone.localize(datetime(day.year, day.month, day.day, hour, minute))
+                    moments.append(vcron.timezone.normalize(moment))
+            for moment in moments:
+                if start <= moment <= until and vcron.check_cron(cron, moment):
+                    return moment
+        day += timedelta(days=1)
+    return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--cases", type=int, default=300, help="случаев на каждый режим")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--modes", default="hourly,exact", help="hourly (по часам), exact (TLCR_EXACT_MINUTES)")
+    args = parser.parse_args()
+
+    mismatches = 0
+    for mode in (value.strip() for value in args.modes.split(",")):
+        rnd = random.Random(args.seed)
+        vcrons = {zone: VCron(zone, exact_minutes=mode == "exact") for zone in TIMEZONES}
+        equal = beyond = 0
+        solver_seconds = iterative_seconds = 0.0
+        for _ in range(args.cases):
+            vcron = vcrons[rnd.choice(TIMEZONES)]
+            cron, modifier = random_cron(rnd), random_modifier(rnd)
+            start = datetime(2025, 1, 1) + timedelta(seconds=rnd.randrange(3 * 365 * 86400))
+            start = vcron.timezone.normalize(vcron.timezone.localize(start))
+
+            started = time.perf_counter()
+            solved = vcron.get_next_match(cron, modifier, start_time=start)
+            solver_seconds += time.perf_counter() - started
+            started = time.perf_counter()
+            reference = iterative(vcron, cron, modifier, start)
+            iterative_seconds += time.perf_counter() - started
+
+            if solved == reference:
+                equal += 1
+            elif reference is None and solved is not None and scan_days(vcron, cron, modifier, start, solved) == solved:
+                beyond += 1
+            else:
+                mismatches += 1
+                print(
+                    f"РАСХОЖДЕНИЕ [{mode}] {vcron.timezone.zone} cron={cron!r} modifier={modifier!r} "
+                    f"start={start.isoformat()}: решение {solved}, перебор {reference}"
+                )
+        print(
+            f"{mode}: случаев {args.cases}, совпало {equal}, найдено за пределом перебора {beyond}; "
+            f"решение {solver_seconds / args.cases * 1e6:.1f} мкс, перебор {iterative_seconds / args.cases * 1e3:.2f} мс"
+        )
+
+    if mismatches:
+        print(f"Расхождений: {mismatches}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,224 @@
+"""
+Проверка lib.backup_replication без удалённого хоста.
+
+Запуск из корня проекта:
+    python -m bench.check_replication
+
+Во временном каталоге создаётся заглушка scp (исполняемый файл, который копирует файлы
+локально, отбрасывая префикс host:) и ставится первой в PATH; BackupReplicator запускает
+её как обычный scp. Проверяются отправка в каталог и в файл, повторные попытки с удвоением
+задержки, сохранение очереди в JSON и её восстановление после перезапуска, отправка бэкапа,
+удалённого ротацией, исчерпание попыток, ограничение времени scp и проверка отправленного
+файла (verify).
+Печатает результат каждой проверки; код выхода 1, если какая-то не прошла.
+"""
+import json
+import os
+import stat
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+from lib.backup_replication import BackupReplicator, file_sha256
+
+FAKE_SCP = """#!{python}
+import os, shutil, sys, time
+
+state = os.environ.get("FAKE_SCP_FAILS")
+if state and os.path.exists(state):
+    with open(state) as f:
+        left = int(f.read() or 0)
+    if left > 0:
+        with open(state, "w") as f:
+            f.write(str(left - 1))
+        sys.exit("ssh: connect to host example port 22: Connection refused")
+if os.environ.get("FAKE_SCP_SLEEP"):
+    time.sleep(float(os.environ["FAKE_SCP_SLEEP"]))
+
+args, paths = sys.argv[1:], []
+while args:
+    arg = args.pop(0)
+    if arg in ("-o", "-i", "-P"):
+        args.pop(0)
+    elif not arg.startswith("-"):
+        paths.append(arg)
+*sources, destination = paths
+upload = ":" in destination
+for source in sources:
+    target = destination.split(":", 1)[-1]
+    if os.path.isdir(target):
+        target = os.path.join(target, os.path.basename(source))
+    shutil.copy(source.split(":", 1)[-1], target)
+    if upload and os.environ.get("FAKE_SCP_CORRUPT"):
+        with open(target, "ab") as f:
+            f.write(b"x")
+"""
+
+failures = []
+
+
+def check(name: str, condition: bool, details: str = ""):
+    print(f"{'ok  ' if condition else 'FAIL'} {name}{': ' + details if details and not condition else ''}")
+    if not condition:
+        failures.append(name)
+
+
+def install_fake_scp(directory: Path):
+    scp = directory / "scp"
+    scp.write_text(FAKE_SCP.format(python=sys.executable), encoding="utf-8")
+    scp.chmod(scp.stat().st_mode | stat.S_IXUSR)
+    os.environ["PATH"] = f"{directory}{os.pathsep}{os.environ.get('PATH', '')}"
+
+
+def set_failures(state: Path, count: int):
+    state.write_text(str(count), encoding="utf-8")
+
+
+def main():
+    if os.name != "posix":
+        raise SystemExit("заглушка scp рассчитана на POSIX")
+
+    with tempfile.TemporaryDirectory(prefix="tlcr-replication-") as tmp:
+        work = Path(tmp)
+        (work / "bin").mkdir()
+        install_fake_scp(work / "bin")
+        state = work / "fails"
+        os.environ["FAKE_SCP_FAILS"] = str(state)
+
+        backup = work / "settings_20260101_000000.db"
+        backup.write_bytes(os.urandom(64 * 1024))
+        remote = work / "remote"
+        remote.mkdir()
+        queue_path = work / "replication_queue.json"
+
+        def replicator(**kwargs) -> BackupReplicator:
+            options = {"scp_bin": "scp", "backoff": 0.2, "max_attempts": 3, "timeout": 5}
+            options.update(kwargs)
+            return BackupReplicator(queue_path, work / "outgoing", **options)
+
+        # Цель-каталог: бэкап и .sha256 под своими именами
+        replication = replicator()
+        replication.put(str(backup), f"backup@example:{remote}/", 22)
+        replication.run_pending()
+        sidecar = remote / f"{backup.name}.sha256"
+        check("каталог: бэкап отправлен", (remote / backup.name).read_bytes() == backup.read_bytes())
+        check(
+            "каталог: .sha256 в формате sha256sum",
+            sidecar.exists() and sidecar.read_text() == f"{file_sha256(backup)}  {backup.name}\n",
+        )
+        check("каталог: очередь пуста", replication.pending == 0 and json.loads(queue_path.read_text()) == [])
+
+        # Цель-файл (старый формат настройки): бэкап по указанному пути, .sha256 рядом
+        replication.put(str(backup), f"backup@example:{remote}/latest.db")
+        replication.run_pending()
+        sidecar = remote / "latest.db.sha256"
+        check("файл: бэкап отправлен", (remote / "latest.db").read_bytes() == backup.read_bytes())
+        check("файл: .sha256 рядом", sidecar.exists() and sidecar.read_text().split() == [file_sha256(backup), "latest.db"])
+
+        # Две неудачи подряд: удвоение задержки и очередь на диске
+        set_failures(state, 2)
+        replication.put(str(backup), f"backup@example:{remote}/retry/")
+        (remote / "retry").mkdir()
+        replication.run_pending()
+        saved = json.loads(queue_path.read_text())
+        check(
+            "повтор: попытка записана в очередь на диске",
+            len(saved) == 1 and saved[0]["attempts"] == 1 and "Connection refused" in saved[0]["error"],
+            str(saved),
+        )
+        check("повтор: до истечения задержки не отправляется", replication.run_pending() == 0)
+        first_delay = saved[0]["not_before"] - time.time()
+        time.sleep(max(0.0, first_delay) + 0.05)
+        replication.run_pending()
+        saved = json.loads(queue_path.read_text())
+        second_delay = saved[0]["not_before"] - time.time() if saved else 0
+        check(
+            "повтор: задержка удваивается",
+            len(saved) == 1 and saved[0]["attempts"] == 2 and 0.25 < second_delay <= 0.4,
+            f"{saved}, задержка {second_delay:.2f} с",
+        )
+
+        # Перезапуск: новая очередь читается из JSON и дожимается фоновым потоком
+        restarted = replicator()
+        check("перезапуск: очередь восстановлена", restarted.pending == 1)
+        restarted.start()
+        deadline = time.time() + 5
+        while restarted.pending and time.time() < deadline:
+            time.sleep(0.05)
+        restarted.stop()
+        check(
+            "перезапуск: отправлено после восстановления",
+            restarted.pending == 0 and restarted.replicated == 1 and (remote / "retry" / backup.name).exists(),
+        )
+
+        # Ротация удаляет бэкап, ожидающий повтора: в очереди — его жёсткая ссылка (копия)
+        rotated = work / "settings_20260102_000000.db"
+        rotated.write_bytes(os.urandom(1024))
+        content = rotated.read_bytes()
+        set_failures(state, 1)
+        replication = replicator(backoff=0.05)
+        replication.put(str(rotated), f"backup@example:{remote}/")
+        replication.run_pending()
+        rotated.unlink()
+        time.sleep(0.1)
+        replication.run_pending()
+        staged = work / "outgoing" / "queued" / rotated.name
+        check(
+            "ротация: бэкап отправлен после удаления оригинала",
+            replication.replicated == 1 and (remote / rotated.name).read_bytes() == content,
+        )
+        check("ротация: подготовленная копия удалена после отправки", not staged.exists())
+
+        # Исчерпание попыток: on_failure и удаление из очереди
+        failed = []
+        set_failures(state, 100)
+        exhausted = replicator(max_attempts=2, backoff=0.05, on_failure=failed.append)
+        exhausted.put(str(backup), f"backup@example:{remote}/")
+        exhausted.run_pending()
+        time.sleep(0.1)
+        exhausted.run_pending()
+        check(
+            "исчерпание попыток: on_failure и пустая очередь",
+            [job.attempts for job in failed] == [2] and exhausted.pending == 0 and exhausted.failed == 1,
+        )
+        set_failures(state, 0)
+
+        # Зависший scp прерывается по timeout и отправка откладывается
+        os.environ["FAKE_SCP_SLEEP"] = "3"
+        slow = replicator(timeout=0.5)
+        slow.put(str(backup), f"backup@example:{remote}/slow/")
+        started = time.monotonic()
+        slow.run_pending()
+        elapsed = time.monotonic() - started
+        del os.environ["FAKE_SCP_SLEEP"]
+        check(
+            "timeout: scp прерван, бэкап остался в очереди",
+            elapsed < 2 and slow.pending == 1 and "не завершился" in json.loads(queue_path.read_text())[0]["error"],
+        )
+        queue_path.unlink()
+
+        # verify: скачанная копия сверяется с локальной
+        verified = replicator(verify=True, compress=True)
+        verified.put(str(backup), f"backup@example:{remote}/")
+        verified.run_pending()
+        check("verify: совпадающая копия принята", verified.replicated == 1 and (remote / f"{backup.name}.gz").exists())
+        os.environ["FAKE_SCP_CORRUPT"] = "1"
+        verified.put(str(backup), f"backup@example:{remote}/")
+        verified.run_pending()
+        del os.environ["FAKE_SCP_CORRUPT"]
+        saved = json.loads(queue_path.read_text())
+        check(
+            "verify: повреждённая копия отправляется повторно",
+            len(saved) == 1 and "контрольная сумма" in saved[0]["error"],
+            str(saved),
+        )
+
+    if failures:
+        print(f"\nНе прошли: {', '.join(failures)}")
+        sys.exit(1)
+    print("\nВсе проверки прошли")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,68 @@
+"""
+Сравнение двух прогонов bench.suite.
+
+Запуск из корня проекта:
+    python -m bench.compare old.json new.json [--threshold 10]
+
+Для каждой общей метрики печатается старое и новое значение и изменение в процентах;
+метрики, ставшие хуже больше чем на threshold процентов, помечаются. Код выхода 1,
+если такие есть, — удобно для проверки в CI. Метрики без направления (better = null)
+выводятся справочно.
+"""
+import argparse
+import json
+import sys
+
+
+def load(path: str) -> dict:
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def change_percent(old: float, new: float) -> float | None:
+    if not old:
+        return None
+    return (new - old) / old * 100
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("old")
+    parser.add_argument("new")
+    parser.add_argument("--threshold", type=float, default=10.0, help="допустимое ухудшение, %%")
+    args = parser.parse_args()
+
+    old, new = load(args.old), load(args.new)
+    for label, report in (("было", old), ("стало", new)):
+        meta = report.get("meta", {})
+        print(f"{label}: {meta.get('commit') or '?'}{' (+изменения)' if meta.get('dirty') else ''}, "
+              f"{meta.get('started')}, python {meta.get('python')}, numpy {meta.get('numpy')}")
+    if old.get("meta", {}).get("platform") != new.get("meta", {}).get("platform"):
+        print("Внимание: прогоны выполнены на разных платформах")
+
+    regressions = []
+    print(f"\n{'метрика':<40} {'было':>14} {'стало':>14} {'изменение':>10}")
+    for name in sorted(old["results"].keys() & new["results"].keys()):
+        before, after = old["results"][name], new["results"][name]
+        change = change_percent(before["value"], after["value"])
+        mark = ""
+        if change is not None and after.get("better") in ("lower", "higher"):
+            worse = change if after["better"] == "lower" else -change
+            if worse > args.threshold:
+                mark = "  хуже"
+                regressions.append(name)
+            elif worse < -args.threshold:
+                mark = "  лучше"
+        change_text = f"{change:+.1f}%" if change is not None else "—"
+        print(f"{name:<40} {before['value']:>14} {after['value']:>14} {change_text:>10}{mark}  {after['unit']}")
+
+    only = sorted(old["results"].keys() ^ new["results"].keys())
+    if only:
+        print(f"\nМетрики только в одном из прогонов: {', '.join(only)}")
+    if regressions:
+        print(f"\nУхудшение больше {args.threshold:g}%: {', '.join(regressions)}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
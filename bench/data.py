@@ -0,0 +1,128 @@
+"""
+Синтетические SQLite-базы для бенчмарков.
+
+Набор cron-выражений и модификаторов повторяет типичное использование проекта:
+ежедневные и будничные напоминания, раз в несколько часов, по числам месяца,
+«через n дней/недель/месяцев» с датой отсчёта и без, дни рождения, часть расписаний
+с дублированием в ntfy. Половина расписаний уже срабатывала (last_fired заполнен).
+
+Базы создаются один раз и переиспользуются, пока не изменится DATA_VERSION.
+"""
+import argparse
+import random
+import tempfile
+from datetime import datetime, timedelta
+from pathlib import Path
+
+from lib.db_utils import (
+    add_schedules_many, close_connections, get_connection, migrate_add_next_fire,
+    migrate_add_ntfy, migrate_add_revisions, migrate_add_schedule_indexes, run_initialization,
+)
+
+# Меняется при изменении состава данных, чтобы старые базы не переиспользовались
+DATA_VERSION = 1
+
+# (cron, вес)
+CRONS = [
+    ("0 9 * * *", 20), ("30 8 * * 1-5", 15), ("0 * * * *", 5), ("0 */2 * * *", 5),
+    ("0 10 1,15 * *", 8), ("0 20 * * 0,6", 8), ("0 7 * 3-9 *", 5), ("0 12 * * 1", 10),
+    ("15 18 * * 2,4", 8), ("0 9 1 * *", 8), ("0 8 * * 1-5", 8),
+]
+# (modifier, вес)
+MODIFIERS = [
+    ("", 50), ("d/2", 6), ("d/3", 5), ("w/1", 4), ("w/2", 6), ("m/1", 3), ("m/3", 3),
+    ("20250101>d/5", 4), ("20250106>w/3", 4), ("20250115>m/2", 3),
+]
+CHATS = 20
+NTFY_CHANNELS = 3
+DEFAULT_WORKDIR = Path(tempfile.gettempdir()) / "tlcr-bench"
+
+
+def database_path(workdir: str | Path, count: int, seed: int = 1) -> Path:
+    return Path(workdir) / f"bench_v{DATA_VERSION}_{count}_{seed}.db"
+
+
+def synthetic_rows(count: int, seed: int = 1) -> list[tuple]:
+    """Строки (cron, message, modifier, chat_id, ntfy_id) для add_schedules_many."""
+    rnd = random.Random(seed)
+    crons, cron_weights = zip(*CRONS)
+    modifiers, modifier_weights = zip(*MODIFIERS)
+    rows = []
+    for n in range(count):
+        if rnd.random() < 0.05:
+            # День рождения: ежегодно, дата рождения в modifier
+            birth = datetime(1960, 1, 1) + timedelta(days=rnd.randrange(365 * 50))
+            cron = f"0 9 {birth.day} {birth.month} *"
+            rows.append((cron, f"ДР {n}", birth.strftime("%Y%m%d"), rnd.randint(1, CHATS), None))
+            continue
+        ntfy_id = rnd.randint(1, NTFY_CHANNELS) if rnd.random() < 0.2 else None
+        rows.append((
+            rnd.choices(crons, cron_weights)[0],
+            f"Напоминание {n}",
+            rnd.choices(modifiers, modifier_weights)[0],
+            rnd.randint(1, CHATS),
+            ntfy_id,
+        ))
+    return rows
+
+
+def make_database(workdir: str | Path, count: int, seed: int = 1, regenerate: bool = False) -> Path:
+    """Создаёт (или возвращает уже созданную) базу с count расписаниями."""
+    path = database_path(workdir, count, seed)
+    if path.exists() and not regenerate:
+        return path
+    path.parent.mkdir(parents=True, exist_ok=True)
+    for suffix in ("", "-wal", "-shm"):
+        Path(f"{path}{suffix}").unlink(missing_ok=True)
+
+    db_path = str(path)
+    with get_connection(db_path) as conn:
+        run_initialization(conn, False, db_path)
+    migrate_add_ntfy(db_path)
+    migrate_add_next_fire(db_path)
+    migrate_add_revisions(db_path)
+    migrate_add_schedule_indexes(db_path)
+
+    rnd = random.Random(seed)
+    with get_connection(db_path) as conn:
+        conn.executemany(
+            "INSERT INTO chats (name, chat_id) VALUES (?, ?)",
+            # Отрицательный chat_id — группа, положительный — личный чат
+            [(f"chat {n}", -100_000 - n if n % 3 == 0 else 100_000 + n) for n in range(1, CHATS + 1)],
+        )
+        conn.executemany(
+            "INSERT INTO ntfy_channels (name, url, title) VALUES (?, ?, ?)",
+            [(f"ntfy {n}", f"https://ntfy.example/bench-{n}", f"Bench {n}") for n in range(1, NTFY_CHANNELS + 1)],
+        )
+    add_schedules_many(synthetic_rows(count, seed), db_path)
+
+    now = datetime.now()
+    with get_connection(db_path) as conn:
+        conn.executemany(
+            "UPDATE schedules SET last_fired = ? WHERE id = ?",
+            [
+                (now - timedelta(minutes=rnd.randrange(60 * 24 * 90)), schedule_id)
+                for schedule_id in range(1, count + 1)
+                if rnd.random() < 0.5
+            ],
+        )
+    with get_connection(db_path) as conn:
+        conn.execute("ANALYZE")
+    with get_connection(db_path) as conn:
+        conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+    close_connections()
+    return path
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Создаёт (пересоздаёт) синтетические базы для бенчмарков")
+    parser.add_argument("--sizes", default="1000,10000,100000")
+    parser.add_argument("--workdir", default=str(DEFAULT_WORKDIR))
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+    for size in (int(value) for value in args.sizes.split(",")):
+        print(make_database(args.workdir, size, args.seed, regenerate=True))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,80 @@
+"""
+Сравнение VCron.match_many (numpy) с проверкой расписаний по одному.
+
+Запуск из корня проекта:
+    python -m bench.match_many [--sizes 10,100,1000] [--repeat 20] [--tz Europe/Moscow]
+
+Для каждого размера пачки печатается время скалярной проверки, векторной проверки
+с упаковкой (PackedSchedules создаётся на каждый вызов) и без неё (пачка упакована заранее),
+а также минимальный размер, с которого векторная проверка выгоднее, — ориентир для MATCH_MANY_MIN_ROWS.
+"""
+import argparse
+import random
+import time
+from datetime import datetime, timedelta
+
+from lib.cron_utils import PackedSchedules, VCron, np
+
+
+def synthetic_schedules(count: int, seed: int = 1) -> list[dict]:
+    """Расписания с типичным для проекта набором cron-выражений и модификаторов."""
+    rnd = random.Random(seed)
+    crons = ["0 9 * * *", "30 8 * * 1-5", "0 */2 * * *", "0 10 1,15 * *", "0 20 * * 0,6", "0 7 * 3-9 *"]
+    modifiers = ["", "", "d/2", "d/3", "w/1", "w/2", "m/1", "m/3", "20250101>d/5", "20250106>w/3"]
+    return [
+        {"id": n, "cron": rnd.choice(crons), "modifier": rnd.choice(modifiers)}
+        for n in range(count)
+    ]
+
+
+def timed(func, repeat: int) -> float:
+    """Среднее время вызова func в микросекундах."""
+    start = time.perf_counter()
+    for _ in range(repeat):
+        func()
+    return (time.perf_counter() - start) / repeat * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", default="10,30,100,200,300,1000,3000,10000,100000")
+    parser.add_argument("--repeat", type=int, default=20)
+    parser.add_argument("--tz", default="Europe/Moscow")
+    args = parser.parse_args()
+
+    if np is None:
+        raise SystemExit("numpy не установлен: сравнивать не с чем")
+
+    vcron = VCron(args.tz)
+    moments = [
+        vcron.timezone.localize(datetime(2026, 1, 1, 9) + timedelta(hours=7 * n))
+        for n in range(args.repeat)
+    ]
+    crossover = None
+    print(f"{'rows':>8} {'scalar, us':>12} {'numpy+pack, us':>15} {'numpy, us':>10} {'due':>6}")
+    for size in (int(value) for value in args.sizes.split(",")):
+        schedules = synthetic_schedules(size)
+        packed = PackedSchedules(schedules)
+        for now in moments:
+            expected = vcron.match_many(schedules, now, min_rows=size + 1)
+            assert vcron.match_many(packed, now) == expected, f"расхождение для {size} строк в {now}"
+
+        it = iter(moments * 3)
+        scalar = timed(lambda: vcron.match_many(schedules, next(it), min_rows=size + 1), args.repeat)
+        it = iter(moments * 3)
+        vector_pack = timed(lambda: vcron.match_many(schedules, next(it), min_rows=0), args.repeat)
+        it = iter(moments * 3)
+        vector = timed(lambda: vcron.match_many(packed, next(it)), args.repeat)
+        if crossover is None and vector_pack < scalar:
+            crossover = size
+        due = len(vcron.match_many(packed, moments[0]))
+        print(f"{size:>8} {scalar:>12.1f} {vector_pack:>15.1f} {vector:>10.1f} {due:>6}")
+
+    if crossover is None:
+        print("Векторная проверка с упаковкой не обогнала скалярную на заданных размерах")
+    else:
+        print(f"Векторная проверка с упаковкой выгоднее начиная с ~{crossover} строк")
+
+
+if __name__ == "__main__":
+    main()
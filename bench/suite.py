@@ -0,0 +1,210 @@
+"""
+Бенчмарки тика демона, VCron и слоя данных.
+
+Запуск из корня проекта:
+    python -m bench.suite [--sizes 1000,10000,100000] [--output results.json] [--min-time 0.5]
+
+Для каждого размера создаётся (или переиспользуется) синтетическая база (bench.data) и измеряются:
+    tick.*  — тик rund: снимок расписаний из БД (get_tick_snapshot) и проверка пулом
+              обработчиков с постановкой в очереди доставки (отправка заменена заглушками);
+    db.*    — задержка запросов lib.db_utils (медиана и p95, мс);
+    vcron.* — check_cron, check_modifier и get_next_match, операций в секунду (не зависит от размера базы).
+
+Результаты — JSON со сведениями о прогоне (коммит, версии, настройки) и плоским словарём
+метрика -> {value, unit, better}. Без --output JSON печатается в stdout, сводка — в stderr.
+Сравнить два прогона: python -m bench.compare old.json new.json
+"""
+import argparse
+import json
+import logging
+import platform
+import random
+import statistics
+import subprocess
+import sys
+import time
+from datetime import datetime, timedelta
+from pathlib import Path
+
+import rund
+from bench.data import DEFAULT_WORKDIR, make_database, synthetic_rows
+from lib import db_utils
+from lib.cron_utils import VCron, np
+
+SUITE_VERSION = 1
+
+
+def measure(func, min_time: float, min_runs: int = 3, max_runs: int = 10000) -> list[float]:
+    """Вызывает func, пока не пройдёт min_time секунд (не меньше min_runs раз); возвращает длительности вызовов."""
+    samples = []
+    started = time.perf_counter()
+    while len(samples) < min_runs or (time.perf_counter() - started < min_time and len(samples) < max_runs):
+        call_started = time.perf_counter()
+        func()
+        samples.append(time.perf_counter() - call_started)
+    return samples
+
+
+def latency(samples: list[float]) -> dict:
+    ordered = sorted(samples)
+    return {
+        "value": round(statistics.median(ordered) * 1000, 4),
+        "p95": round(ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))] * 1000, 4),
+        "runs": len(ordered),
+        "unit": "ms",
+        "better": "lower",
+    }
+
+
+def throughput(operations: int, samples: list[float]) -> dict:
+    return {
+        "value": round(operations / statistics.median(samples), 1),
+        "runs": len(samples),
+        "unit": "ops/s",
+        "better": "higher",
+    }
+
+
+def bench_vcron(vcron: VCron, min_time: float) -> dict:
+    """Пропускная способность VCron на смеси правил из bench.data (кэши прогреты)."""
+    rules = [(cron, modifier) for cron, _, modifier, _, _ in synthetic_rows(2000)]
+    start = vcron.timezone.localize(datetime(2026, 1, 5, 0, 0))
+    moments = [vcron.timezone.normalize(start + timedelta(hours=7 * n)) for n in range(len(rules))]
+    pairs = list(zip(rules, moments))
+
+    def check_cron():
+        for (cron, _), now in pairs:
+            vcron.check_cron(cron, now)
+
+    def check_modifier():
+        for (_, modifier), now in pairs:
+            vcron.check_modifier(modifier, now)
+
+    def get_next_match():
+        for (cron, modifier), now in pairs:
+            vcron.get_next_match(cron, modifier, start_time=now)
+
+    results = {}
+    for name, func in (("check_cron", check_cron), ("check_modifier", check_modifier), ("get_next_match", get_next_match)):
+        func()
+        results[f"vcron.{name}"] = throughput(len(pairs), measure(func, min_time))
+    return results
+
+
+def bench_db(db_path: str, count: int, min_time: float) -> dict:
+    """Задержка запросов lib.db_utils."""
+    rnd = random.Random(1)
+    window_until = int(time.time()) + 3600
+    queries = {
+        "get_revisions": lambda: db_utils.get_revisions(db_path),
+        "get_schedule": lambda: db_utils.get_schedule(rnd.randint(1, count), db_path),
+        "get_schedules_page": lambda: db_utils.get_schedules_page(
+            db_path, after_id=rnd.randint(0, count), limit=100
+        ),
+        "get_schedules_page_chat": lambda: db_utils.get_schedules_page(
+            db_path, chat_id=rnd.randint(1, 20), after_id=rnd.randint(0, count), limit=100
+        ),
+        "get_tick_snapshot_window": lambda: db_utils.get_tick_snapshot(db_path, until=window_until),
+        "get_schedules": lambda: db_utils.get_schedules(db_path),
+        "iter_schedules": lambda: sum(1 for _ in db_utils.iter_schedules(db_path)),
+    }
+    results = {}
+    for name, func in queries.items():
+        func()
+        results[f"db.{name}"] = latency(measure(func, min_time))
+    return results
+
+
+def bench_tick(db_path: str, min_time: float) -> dict:
+    """Тик rund на всех расписаниях базы; Telegram и ntfy заменены заглушками."""
+    rund.send_telegram_message = lambda text, chat_id: True
+    rund.send_ntfy_message = lambda url, message, title=None: True
+    rund.mark_fired = lambda schedule_id: None
+    rund.log.setLevel(logging.WARNING)
+
+    pool = rund.create_worker_pool()
+    try:
+        snapshot = db_utils.get_tick_snapshot(db_path)
+        evaluated, fired = rund.run_tick(pool, snapshot)
+        results = {
+            "tick.snapshot": latency(measure(lambda: db_utils.get_tick_snapshot(db_path), min_time)),
+            "tick.evaluate": latency(measure(lambda: rund.run_tick(pool, snapshot), min_time)),
+        }
+        results["tick.schedules_per_s"] = {
+            "value": round(evaluated / (results["tick.evaluate"]["value"] / 1000), 1),
+            "unit": "ops/s",
+            "better": "higher",
+        }
+        # Зависит от времени запуска — справочно, в сравнении не участвует
+        results["tick.fired"] = {"value": fired, "unit": "count", "better": None}
+    finally:
+        pool.shutdown()
+        for queue in (rund.telegram_queue, rund.ntfy_queue):
+            queue.stop(timeout=0)
+    return results
+
+
+def run_metadata(args) -> dict:
+    def git(*command):
+        try:
+            return subprocess.run(
+                ["git", *command], cwd=Path(__file__).resolve().parent.parent,
+                capture_output=True, text=True, check=True,
+            ).stdout.strip()
+        except (OSError, subprocess.CalledProcessError):
+            return None
+
+    return {
+        "suite_version": SUITE_VERSION,
+        "started": datetime.now().isoformat(timespec="seconds"),
+        "commit": git("rev-parse", "HEAD"),
+        "dirty": bool(git("status", "--porcelain", "--untracked-files=no")),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "numpy": np.__version__ if np is not None else None,
+        "timezone": rund.TIMEZONE,
+        "worker_mode": rund.WORKER_MODE,
+        "workers": rund.WORKERS,
+        "worker_batch": rund.WORKER_BATCH,
+        "sizes": args.sizes,
+        "min_time": args.min_time,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", default="1000,10000,100000")
+    parser.add_argument("--output", help="файл для результатов (по умолчанию stdout)")
+    parser.add_argument("--workdir", default=str(DEFAULT_WORKDIR), help="каталог синтетических баз")
+    parser.add_argument("--min-time", type=float, default=0.5, help="минимальное время измерения одной метрики, с")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--skip", default="", help="пропустить группы через запятую: tick,db,vcron")
+    args = parser.parse_args()
+    skip = {group.strip() for group in args.skip.split(",") if group.strip()}
+    sizes = [int(value) for value in args.sizes.split(",")]
+
+    results = {}
+    if "vcron" not in skip:
+        results.update(bench_vcron(VCron(db_utils.TIMEZONE), args.min_time))
+    for size in sizes:
+        db_path = str(make_database(args.workdir, size, args.seed))
+        if "db" not in skip:
+            results.update({f"{size}/{name}": value for name, value in bench_db(db_path, size, args.min_time).items()})
+        if "tick" not in skip:
+            results.update({f"{size}/{name}": value for name, value in bench_tick(db_path, args.min_time).items()})
+        db_utils.close_connections()
+
+    report = {"meta": run_metadata(args), "results": results}
+    for name, metric in results.items():
+        extra = f" (p95 {metric['p95']})" if "p95" in metric else ""
+        print(f"{name:<40} {metric['value']:>14} {metric['unit']}{extra}", file=sys.stderr)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+    else:
+        json.dump(report, sys.stdout, ensure_ascii=False, indent=2)
+        print()
+
+
+if __name__ == "__main__":
+    main()
@@ -1,6 +1,8 @@
 import os
 #import multiprocessing
+import tempfile
 from pathlib import Path
+from lib.metrics import clear_process_metrics
 from lib.utils import get_environment_name, load_env
 
 
@@ -17,6 +19,9 @@ WORKERS = os.getenv("GUNICORN_WORKERS", 2)
 TIMEOUT = os.getenv("GUNICORN_TIMEOUT", 120)
 LOG_PATH = os.path.abspath(os.getenv("TLCR_LOGPATH", "log"))
 LOG_LEVEL = os.getenv("TLCR_LOG_LEVEL", "DEBUG")
+# Воркеры сводят метрики через общий каталог (lib.metrics.ProcessMetricsDir); переменная наследуется воркерами
+METRICS_DIR = os.getenv("TLCR_METRICS_DIR", "").strip() or os.path.join(tempfile.gettempdir(), f"tlcr-metrics-{PORT}")
+os.environ["TLCR_METRICS_DIR"] = METRICS_DIR
 
 # Отладочный вывод
 print(f"""
@@ -25,6 +30,7 @@ print(f"""
   !>>> Host: 		  {HOST}
   !>>> Port: 		  {PORT}
   !>>> Logs dir: 	{LOG_PATH}
+  !>>> Metrics dir: {METRICS_DIR}
 """)
 
 # Настройки Gunicorn
@@ -33,6 +39,12 @@ workers = int(WORKERS)
 worker_class = "sync"
 timeout = int(TIMEOUT)
 
+
+def on_starting(server):
+    # Счётчики прошлого запуска сервиса не должны попасть в метрики нового
+    clear_process_metrics(METRICS_DIR)
+
+
 # Создаем директорию для логов, если её нет
 os.makedirs(LOG_PATH, exist_ok=True)
 
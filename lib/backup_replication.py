@@ -0,0 +1,347 @@
+import gzip
+import hashlib
+import json
+import os
+import shutil
+import subprocess
+import tempfile
+import threading
+import time
+from dataclasses import asdict, dataclass
+from pathlib import Path
+from typing import Callable
+
+from .metrics import Counter, Histogram
+from .utils import get_environment_name, init_log, load_env
+
+# Load environment variables
+environment = get_environment_name()
+load_env(environment)
+
+LOGPATH = os.getenv("TLCR_LOGPATH", ".")
+LOGLEVEL = os.getenv("TLCR_LOG_LEVEL", 'INFO').upper()
+
+# Исполняемый файл scp (для проверки можно подставить локальный скрипт с тем же интерфейсом)
+SCP_BIN = os.getenv("TLCR_BACKUP_SCP_BIN", "scp").strip() or "scp"
+# Ограничение времени одного запуска scp, секунды
+SCP_TIMEOUT = float(os.getenv("TLCR_BACKUP_SCP_TIMEOUT", "600"))
+# Сжимать бэкап gzip перед отправкой
+REPLICATION_COMPRESS = os.getenv("TLCR_BACKUP_SCP_COMPRESS", "false").strip().lower() in ("1", "true", "yes")
+# Скачивать отправленный файл обратно и сверять sha256 (удваивает трафик, хост должен разрешать чтение)
+REPLICATION_VERIFY = os.getenv("TLCR_BACKUP_SCP_VERIFY", "false").strip().lower() in ("1", "true", "yes")
+# Попыток отправки одного бэкапа и базовая задержка между ними (удваивается после каждой неудачи)
+REPLICATION_MAX_ATTEMPTS = max(1, int(os.getenv("TLCR_BACKUP_SCP_ATTEMPTS", "8")))
+REPLICATION_BACKOFF = float(os.getenv("TLCR_BACKUP_SCP_BACKOFF", "60"))
+REPLICATION_MAX_BACKOFF = 6 * 3600
+
+_CHUNK_SIZE = 1024 * 1024
+
+# Метрики (lib.metrics)
+REPLICATIONS = Counter(
+    "tlcr_backup_replications_total", "Попытки отправки бэкапов по результату: replicated, retried, failed", ("result",)
+)
+REPLICATION_SECONDS = Histogram(
+    "tlcr_backup_replication_duration_seconds", "Длительность успешной отправки бэкапа (с проверкой)",
+    buckets=(1, 5, 10, 30, 60, 120, 300, 600, 1800),
+)
+
+log = init_log('replication', LOGPATH, LOGLEVEL)
+
+
+class ReplicationError(Exception):
+    """Ошибка отправки бэкапа; отправка будет повторена."""
+
+
+@dataclass
+class ReplicationJob:
+    """Бэкап, ожидающий отправки на удалённый хост."""
+    file: str
+    target: str  # user@host:/dir/ (каталог) или user@host:/path/file (файл), см. is_directory_target
+    port: int | None = None
+    attempts: int = 0
+    not_before: float = 0.0
+    error: str = ""
+
+
+def file_sha256(path: str | Path) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        while chunk := f.read(_CHUNK_SIZE):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def is_directory_target(target: str) -> bool:
+    """
+    Цель, оканчивающаяся на "/" или ":" (user@host:/backups/, user@host:), — каталог:
+    бэкап и <имя>.sha256 кладутся в него под своими именами. Любая другая цель
+    передаётся scp как есть (как до появления очереди репликации): обычно это путь
+    к файлу, а <цель>.sha256 кладётся рядом с ним.
+    """
+    return target.endswith((":", "/"))
+
+
+def remote_path(target: str, name: str) -> str:
+    """Путь на удалённом хосте, по которому scp положит файл name при цели target."""
+    return f"{target}{name}" if is_directory_target(target) else target
+
+
+class BackupReplicator:
+    """
+    Фоновая отправка бэкапов по scp с повторными попытками.
+
+    Очередь отправки хранится в JSON-файле queue_path и переживает перезапуск демона;
+    бэкап удаляется из неё только после успешной отправки или исчерпания попыток.
+    При постановке в очередь бэкап жёстко связывается (при невозможности — копируется)
+    в staging_dir/queued, поэтому ротация каталога бэкапов не удаляет файл,
+    который ещё ждёт повторной отправки.
+    scp запускается через subprocess со списком аргументов и ограничением времени timeout,
+    поэтому медленный или недоступный хост задерживает только поток репликации.
+
+    Вместе с бэкапом (при compress — сжатым gzip) отправляется файл <имя>.sha256
+    в формате sha256sum (см. is_directory_target); при verify отправленный файл
+    скачивается обратно и его контрольная сумма сверяется с локальной.
+    """
+
+    def __init__(
+        self,
+        queue_path: str | Path,
+        staging_dir: str | Path,
+        scp_bin: str = SCP_BIN,
+        ssh_key_path: str = "",
+        timeout: float = SCP_TIMEOUT,
+        compress: bool = REPLICATION_COMPRESS,
+        verify: bool = REPLICATION_VERIFY,
+        max_attempts: int = REPLICATION_MAX_ATTEMPTS,
+        backoff: float = REPLICATION_BACKOFF,
+        on_failure: Callable[[ReplicationJob], None] | None = None,
+    ):
+        self.queue_path = Path(queue_path)
+        self.staging_dir = Path(staging_dir)
+        self.scp_bin = scp_bin
+        self.ssh_key_path = ssh_key_path
+        self.timeout = timeout
+        self.compress = compress
+        self.verify = verify
+        self.max_attempts = max(1, max_attempts)
+        self.backoff = backoff
+        self.on_failure = on_failure
+        self.replicated = 0
+        self.failed = 0
+        self._cond = threading.Condition()
+        self._stopping = False
+        self._worker: threading.Thread | None = None
+        self._jobs: list[ReplicationJob] = self._load()
+
+    @property
+    def pending(self) -> int:
+        """Количество бэкапов в очереди отправки."""
+        with self._cond:
+            return len(self._jobs)
+
+    def put(self, file: str, target: str, port: int | None = None):
+        """Ставит бэкап в очередь отправки; повторная постановка того же файла на ту же цель игнорируется."""
+        with self._cond:
+            file = self._stage(file)
+            if any(job.file == file and job.target == target for job in self._jobs):
+                return
+            self._jobs.append(ReplicationJob(file, target, port))
+            self._save()
+            self._cond.notify()
+
+    def _stage(self, file: str) -> str:
+        """
+        Связывает бэкап в staging_dir/queued и возвращает путь к связанному файлу
+        (вызывается под блокировкой). Если это не удалось, в очередь ставится исходный путь.
+        """
+        source = Path(file)
+        staged = self.staging_dir / "queued" / source.name
+        if any(job.file == str(staged) for job in self._jobs):
+            return str(staged)  # тот же бэкап уже ждёт отправки на другую цель
+        try:
+            staged.parent.mkdir(parents=True, exist_ok=True)
+            staged.unlink(missing_ok=True)
+            try:
+                os.link(source, staged)
+            except OSError:
+                shutil.copy2(source, staged)  # другая файловая система или ФС без жёстких ссылок
+        except OSError as e:
+            log.warning(f"Не удалось подготовить бэкап {file} к отправке, ротация может его удалить: {e}")
+            return file
+        return str(staged)
+
+    def start(self):
+        """Запускает поток отправки (в том числе для бэкапов, оставшихся в очереди с прошлого запуска)."""
+        with self._cond:
+            if self._worker is not None:
+                return
+            self._stopping = False
+            self._worker = threading.Thread(target=self._run, name="replication", daemon=True)
+            self._worker.start()
+
+    def stop(self, timeout: float = 1.0):
+        """
+        Останавливает поток отправки. Незавершённая отправка остаётся в очереди
+        и будет повторена после следующего запуска.
+        """
+        with self._cond:
+            self._stopping = True
+            self._cond.notify_all()
+            worker, self._worker = self._worker, None
+        if worker is not None:
+            worker.join(timeout=timeout)
+
+    def run_pending(self) -> int:
+        """Отправляет все бэкапы, время повторной попытки которых наступило; возвращает их количество."""
+        processed = 0
+        while (job := self._next_due(time.time())) is not None:
+            self._process(job)
+            processed += 1
+        return processed
+
+    def _next_due(self, now: float) -> ReplicationJob | None:
+        with self._cond:
+            return min((job for job in self._jobs if job.not_before <= now), key=lambda job: job.not_before, default=None)
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while not self._stopping:
+                    now = time.time()
+                    wait = min((job.not_before for job in self._jobs), default=None)
+                    if wait is not None and wait <= now:
+                        break
+                    self._cond.wait(None if wait is None else wait - now)
+                if self._stopping:
+                    return
+            self.run_pending()
+
+    def _process(self, job: ReplicationJob):
+        started = time.monotonic()
+        try:
+            self._replicate(job)
+        except ReplicationError as e:
+            job.attempts += 1
+            job.error = str(e)
+            if job.attempts >= self.max_attempts or not os.path.exists(job.file):
+                log.error(f"Бэкап {job.file} не отправлен на {job.target} ({job.attempts} попыток): {e}")
+                REPLICATIONS.inc(result="failed")
+                self._finish(job, delivered=False)
+                return
+            REPLICATIONS.inc(result="retried")
+            delay = min(self.backoff * 2 ** (job.attempts - 1), REPLICATION_MAX_BACKOFF)
+            job.not_before = time.time() + delay
+            log.warning(
+                f"Ошибка отправки бэкапа {job.file} на {job.target} (попытка {job.attempts}): {e}; "
+                f"повтор через {int(delay)} с"
+            )
+            with self._cond:
+                self._save()
+            return
+        log.info(f"Бэкап {job.file} отправлен на {job.target}")
+        REPLICATIONS.inc(result="replicated")
+        REPLICATION_SECONDS.observe(time.monotonic() - started)
+        self._finish(job, delivered=True)
+
+    def _finish(self, job: ReplicationJob, delivered: bool):
+        with self._cond:
+            if job in self._jobs:
+                self._jobs.remove(job)
+            self._save()
+            staged = Path(job.file)
+            if staged.parent == self.staging_dir / "queued" and all(other.file != job.file for other in self._jobs):
+                staged.unlink(missing_ok=True)
+            if delivered:
+                self.replicated += 1
+            else:
+                self.failed += 1
+        if not delivered and self.on_failure is not None:
+            try:
+                self.on_failure(job)
+            except Exception as e:
+                log.error(f"Ошибка обработчика неудачной отправки бэкапа: {e}")
+
+    def _replicate(self, job: ReplicationJob):
+        source = Path(job.file)
+        if not source.exists():
+            raise ReplicationError("файл бэкапа не найден")
+        self.staging_dir.mkdir(parents=True, exist_ok=True)
+        staged = []
+        try:
+            if self.compress:
+                upload = self.staging_dir / f"{source.name}.gz"
+                with open(source, "rb") as src, gzip.open(upload, "wb") as dst:
+                    shutil.copyfileobj(src, dst, _CHUNK_SIZE)
+                staged.append(upload)
+            else:
+                upload = source
+            destination = remote_path(job.target, upload.name)
+            digest = file_sha256(upload)
+            checksum = self.staging_dir / f"{upload.name}.sha256"
+            remote_name = destination.rsplit(":", 1)[-1].rsplit("/", 1)[-1]
+            checksum.write_text(f"{digest}  {remote_name}\n", encoding="utf-8")
+            staged.append(checksum)
+
+            started = time.monotonic()
+            if is_directory_target(job.target):
+                self._scp(job.port, str(upload), str(checksum), job.target)
+            else:
+                self._scp(job.port, str(upload), job.target)
+                self._scp(job.port, str(checksum), f"{job.target}.sha256")
+            log.info(
+                f"scp {upload.name} ({upload.stat().st_size} байт) на {job.target}: "
+                f"{time.monotonic() - started:.1f} с"
+            )
+            if self.verify:
+                with tempfile.TemporaryDirectory(dir=self.staging_dir) as tmp:
+                    copy = Path(tmp) / upload.name
+                    self._scp(job.port, destination, str(copy))
+                    if file_sha256(copy) != digest:
+                        raise ReplicationError("контрольная сумма отправленного файла не совпадает")
+        except OSError as e:
+            raise ReplicationError(str(e)) from e
+        finally:
+            for path in staged:
+                path.unlink(missing_ok=True)
+
+    def _scp(self, port: int | None, *paths: str):
+        args = [
+            self.scp_bin, "-q", "-B",
+            "-o", "StrictHostKeyChecking=no", "-o", "UserKnownHostsFile=/dev/null",
+        ]
+        if self.ssh_key_path:
+            args += ["-i", self.ssh_key_path]
+        if port:
+            args += ["-P", str(port)]
+        args += list(paths)
+        try:
+            result = subprocess.run(
+                args, stdin=subprocess.DEVNULL, capture_output=True, text=True, timeout=self.timeout
+            )
+        except subprocess.TimeoutExpired:
+            raise ReplicationError(f"scp не завершился за {self.timeout:g} с")
+        except OSError as e:
+            raise ReplicationError(f"не удалось запустить {self.scp_bin}: {e}")
+        if result.returncode != 0:
+            raise ReplicationError(f"scp завершился с кодом {result.returncode}: {result.stderr.strip()[-500:]}")
+
+    def _load(self) -> list[ReplicationJob]:
+        try:
+            with open(self.queue_path, "r", encoding="utf-8") as f:
+                return [ReplicationJob(**item) for item in json.load(f)]
+        except FileNotFoundError:
+            return []
+        except (OSError, ValueError, TypeError) as e:
+            log.error(f"Не удалось прочитать очередь репликации {self.queue_path}: {e}")
+            return []
+
+    def _save(self):
+        """Атомарно записывает очередь на диск (вызывается под блокировкой)."""
+        try:
+            self.queue_path.parent.mkdir(parents=True, exist_ok=True)
+            partial = self.queue_path.with_name(self.queue_path.name + ".tmp")
+            with open(partial, "w", encoding="utf-8") as f:
+                json.dump([asdict(job) for job in self._jobs], f, ensure_ascii=False, indent=2)
+            os.replace(partial, self.queue_path)
+        except OSError as e:
+            log.error(f"Не удалось сохранить очередь репликации {self.queue_path}: {e}")
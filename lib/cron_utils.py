@@ -1,21 +1,309 @@
+import calendar
+from collections import OrderedDict
 from croniter import croniter
-from datetime import datetime
+from datetime import date, datetime, timedelta
+from functools import lru_cache
+import threading
+from typing import NamedTuple
 import pytz
-from dateutil.relativedelta import relativedelta
 import re
 
+try:
+    import numpy as np
+except ImportError:  # numpy необязателен: без него VCron.match_many проверяет расписания по одному
+    np = None
+
+# Сколько скомпилированных cron-выражений держать в LRU-кэше
+CRON_CACHE_SIZE = 4096
+
+# Поле "день месяца" без L/W и прочих расширений, которые нельзя выразить битовой маской
+_PLAIN_DAY_FIELD = re.compile(r"^[\d*?,/-]+$")
+
+# Допустимый модификатор: [YYYYMMDD>]d/N, w/N или m/N
+_MODIFIER_PATTERN = re.compile(r"^(?:(?P<date>\d{8})>)?(?P<rule>[wdm])/(?P<interval>\d+)$")
+# Дата отсчёта модификатора по умолчанию
+_DEFAULT_ANCHOR = "20010101"
+# С какого размера пачки VCron.match_many переходит на numpy (меньшие пачки быстрее проверяются по одному)
+MATCH_MANY_MIN_ROWS = 1000
+
+# Коды правил модификатора в PackedSchedules.rule
+_RULE_NONE, _RULE_DAYS, _RULE_WEEKS, _RULE_MONTHS, _RULE_NEVER = range(5)
+_RULE_CODES = {"d": _RULE_DAYS, "w": _RULE_WEEKS, "m": _RULE_MONTHS}
+
+# Максимальное число дней в месяце (с 29 февраля)
+_MONTH_DAYS = (0, 31, 29, 31, 30, 31, 30, 31, 31, 30, 31, 30, 31)
+# Насколько далеко (в днях) искать срабатывание: за 28 лет повторяется сочетание дней недели и високосных лет
+NEXT_MATCH_HORIZON_DAYS = 28 * 366
+
+
+class CompiledCron(NamedTuple):
+    """
+    Cron-выражение, разложенное на битовые маски полей.
+    Бит n маски установлен, если значение n допустимо для поля.
+    """
+    minutes: int
+    hours: int
+    days: int
+    months: int
+    weekdays: int  # 0 - воскресенье, как в cron
+    day_or: bool  # день месяца и день недели объединяются по ИЛИ (оба поля заданы)
+
+    def match_day(self, date) -> bool:
+        day_ok = self.days >> date.day & 1
+        weekday_ok = self.weekdays >> (date.weekday() + 1) % 7 & 1
+        if not self.months >> date.month & 1:
+            return False
+        return bool(day_ok or weekday_ok) if self.day_or else bool(day_ok and weekday_ok)
+
+    def match_hour(self, date) -> bool:
+        return bool(self.hours >> date.hour & 1) and self.match_day(date)
+
+    def match_minute(self, date) -> bool:
+        return bool(self.minutes >> date.minute & 1) and self.match_hour(date)
+
+
+def _field_mask(values: list, low: int, high: int) -> int:
+    if values == ["*"]:
+        return sum(1 << n for n in range(low, high + 1))
+    mask = 0
+    for value in values:
+        mask |= 1 << (0 if value == 7 and high == 6 else value)
+    return mask
+
+
+def _lowest_bit(mask: int) -> int:
+    return (mask & -mask).bit_length() - 1
+
+
+def _add_months(anchor: date, months: int) -> date:
+    """Дата через months месяцев от anchor; день ограничивается концом месяца (31 января + 1 месяц = 28/29 февраля)."""
+    years, month = divmod(anchor.month - 1 + months, 12)
+    year = anchor.year + years
+    return date(year, month + 1, min(anchor.day, calendar.monthrange(year, month + 1)[1]))
+
+
+@lru_cache(maxsize=CRON_CACHE_SIZE)
+def compile_cron(cron_expression: str) -> CompiledCron | None:
+    """
+    Компилирует cron-выражение в битовые маски.
+    Разбор выполняет croniter, поэтому семантика полей совпадает с croniter.match.
+
+    Returns:
+        CompiledCron | None: None, если выражение использует расширения
+        (секунды, L, W, #), которые проверяются только через croniter.
+
+    Raises:
+        ValueError: выражение некорректно.
+    """
+    fields = cron_expression.split()
+    expanded, nth_weekday = croniter.expand(cron_expression)
+    if len(expanded) != 5 or nth_weekday or not _PLAIN_DAY_FIELD.match(fields[2]):
+        return None
+    if any(value != "*" and not isinstance(value, int) for field in expanded for value in field):
+        return None
+
+    minutes, hours, days, months, weekdays = expanded
+    return CompiledCron(
+        minutes=_field_mask(minutes, 0, 59),
+        hours=_field_mask(hours, 0, 23),
+        days=_field_mask(days, 1, 31),
+        months=_field_mask(months, 1, 12),
+        weekdays=_field_mask(weekdays, 0, 6),
+        day_or=days != ["*"] and weekdays != ["*"],
+    )
+
+
+class ParsedModifier(NamedTuple):
+    """Модификатор, разобранный один раз: дата отсчёта, тип правила ('d', 'w' или исходная строка) и интервал."""
+    anchor: date | None  # None — дата в модификаторе некорректна
+    rule: str
+    interval: int | None  # None — правило не d/, w/ или m/
+
+
+@lru_cache(maxsize=CRON_CACHE_SIZE)
+def parse_modifier(modifier: str) -> ParsedModifier:
+    """
+    Разбирает модификатор так же, как VCron.check_modifier.
+
+    Raises:
+        ValueError: интервал правила d/ или w/ не является числом.
+    """
+    parts = modifier.split(">")
+    start_date_str = parts[0] if len(parts) == 2 else _DEFAULT_ANCHOR
+    rule = parts[-1]
+    try:
+        anchor = datetime.strptime(start_date_str, "%Y%m%d").date()
+    except OverflowError:
+        anchor = date(2001, 1, 1)  # Fallback to a safe date
+    except ValueError:
+        return ParsedModifier(None, rule, None)  # Invalid date format
+    if rule.startswith(("w/", "d/", "m/")):
+        return ParsedModifier(anchor, rule[0], int(rule[2:]))
+    return ParsedModifier(anchor, rule, None)
+
+
+class PackedSchedules:
+    """
+    Расписания, упакованные в массивы numpy для VCron.match_many.
+
+    Одинаковые пары (cron, modifier) упаковываются один раз: для каждого уникального правила
+    хранятся битовые маски скомпилированного cron (минуты используются только в режиме
+    VCron.exact_minutes), код правила модификатора, интервал и дата
+    отсчёта (порядковый номер дня, номер месяца, день месяца), а для строки — номер её правила.
+    Строки, которые нельзя упаковать (расширенный синтаксис cron, некорректный модификатор),
+    перечислены в scalar и проверяются по одному.
+    """
+
+    def __init__(self, schedules: list[dict]):
+        if np is None:
+            raise ImportError("Для PackedSchedules требуется numpy")
+        self.schedules = schedules
+        self.scalar: list[int] = []
+        positions: dict[tuple, int] = {}
+        rules = []
+        rule_ids = []
+        for index, schedule in enumerate(schedules):
+            key = (schedule["cron"], schedule.get("modifier") or None)
+            position = positions.get(key)
+            if position is None:
+                rule = self._pack_rule(*key)
+                position = positions[key] = -1 if rule is None else len(rules)
+                if rule is not None:
+                    rules.append(rule)
+            if position < 0:
+                self.scalar.append(index)
+            rule_ids.append(position)
+
+        # -1 указывает на дополнительный элемент «не срабатывает» в конце результата _match_packed
+        self.rule_ids = np.array(rule_ids, dtype=np.int64)
+        table = np.array(rules, dtype=np.int64).reshape(len(rules), 11)
+        (self.minutes, self.hours, self.days, self.months, self.weekdays, day_or,
+         self.rule, self.interval, self.anchor_day_number, self.anchor_month_number, self.anchor_day) = table.T
+        self.day_or = day_or.astype(bool)
+
+    def __len__(self) -> int:
+        return len(self.schedules)
+
+    @staticmethod
+    def _pack_rule(cron_expression: str, modifier: str | None) -> tuple | None:
+        try:
+            return _pack_rule(cron_expression, modifier)
+        except ValueError:
+            return None
+
+
+@lru_cache(maxsize=CRON_CACHE_SIZE)
+def _pack_rule(cron_expression: str, modifier: str | None) -> tuple | None:
+    """Поля строки PackedSchedules для пары (cron, modifier); None — строку нельзя упаковать."""
+    compiled = compile_cron(cron_expression)
+    parsed = parse_modifier(modifier) if modifier else None
+    if compiled is None:
+        return None
+
+    if parsed is None:
+        rule, interval, anchor = _RULE_NONE, 1, date(2001, 1, 1)
+    elif parsed.anchor is None or parsed.interval is None:
+        rule, interval, anchor = _RULE_NEVER, 1, date(2001, 1, 1)
+    elif parsed.interval == 0:
+        return None  # check_modifier для такого интервала бросает исключение
+    else:
+        rule, interval, anchor = _RULE_CODES[parsed.rule], parsed.interval, parsed.anchor
+    return (
+        compiled.minutes, compiled.hours, compiled.days, compiled.months, compiled.weekdays, compiled.day_or,
+        rule, interval, anchor.toordinal(), anchor.year * 12 + anchor.month - 1, anchor.day,
+    )
+
+
 class VCron:
     """
     Класс для работы с cron выражениями и модификаторами.
+
+    По умолчанию поле минут cron игнорируется: расписание срабатывает один раз в подходящий час.
+    С exact_minutes=True учитываются и минуты, а шаг срабатываний — одна минута.
     """
 
-    def __init__(self, timezone: str = "UTC"):
+    def __init__(self, timezone: str = "UTC", exact_minutes: bool = False):
         self.timezone = pytz.timezone(timezone)
+        self.exact_minutes = exact_minutes
+
+    @property
+    def step(self) -> timedelta:
+        """Шаг срабатываний: минута в режиме exact_minutes, иначе час."""
+        return timedelta(minutes=1) if self.exact_minutes else timedelta(hours=1)
+
+    def period_start(self, moment: datetime) -> datetime:
+        """Начало минуты (exact_minutes) или часа, в которые попадает moment."""
+        if self.exact_minutes:
+            return moment.replace(second=0, microsecond=0)
+        return moment.replace(minute=0, second=0, microsecond=0)
 
     def check_cron(self, cron_expression: str, date: datetime) -> bool:
-        cron_expression = self._remove_minutes(cron_expression)
+        compiled = compile_cron(cron_expression)
+        if compiled is not None:
+            return compiled.match_minute(date) if self.exact_minutes else compiled.match_hour(date)
+        if not self.exact_minutes:
+            cron_expression = self._remove_minutes(cron_expression)
         return croniter.match(cron_expression, date)
 
+    def match_many(self, schedules: list[dict] | PackedSchedules, now: datetime, min_rows: int = MATCH_MANY_MIN_ROWS) -> list[int]:
+        """
+        Возвращает индексы расписаний, для которых в момент now выполняются check_cron и check_modifier.
+
+        Если установлен numpy и расписаний не меньше min_rows (или передан PackedSchedules),
+        все строки проверяются несколькими операциями над массивами. Иначе — по одному.
+        Строки, проверка которых завершается ошибкой, тоже возвращаются: вызывающий код
+        обработает и залогирует ошибку при разборе конкретного расписания.
+        """
+        if not isinstance(schedules, PackedSchedules):
+            if np is None or len(schedules) < min_rows:
+                return [index for index, schedule in enumerate(schedules) if self._match_one(schedule, now)]
+            schedules = PackedSchedules(schedules)
+
+        due = self._match_packed(schedules, now, self.exact_minutes).tolist()
+        due.extend(index for index in schedules.scalar if self._match_one(schedules.schedules[index], now))
+        return sorted(due)
+
+    def _match_one(self, schedule: dict, now: datetime) -> bool:
+        try:
+            return self.check_cron(schedule["cron"], now) and self.check_modifier(schedule.get("modifier"), now)
+        except Exception:
+            return True
+
+    @staticmethod
+    def _match_packed(packed: PackedSchedules, now: datetime, exact_minutes: bool = False):
+        today = now.date()
+        weekday = (today.weekday() + 1) % 7  # 0 - воскресенье, как в cron
+        dom_ok = (packed.days >> today.day) & 1 == 1
+        dow_ok = (packed.weekdays >> weekday) & 1 == 1
+        cron_ok = (
+            ((packed.hours >> now.hour) & 1 == 1)
+            & ((packed.months >> today.month) & 1 == 1)
+            & np.where(packed.day_or, dom_ok | dow_ok, dom_ok & dow_ok)
+        )
+        if exact_minutes:
+            cron_ok &= (packed.minutes >> now.minute) & 1 == 1
+
+        days_since = today.toordinal() - packed.anchor_day_number
+        months_since = today.year * 12 + today.month - 1 - packed.anchor_month_number
+        month_days = calendar.monthrange(today.year, today.month)[1]
+        modifier_ok = np.select(
+            [
+                packed.rule == _RULE_NONE,
+                packed.rule == _RULE_DAYS,
+                packed.rule == _RULE_WEEKS,
+                packed.rule == _RULE_MONTHS,
+            ],
+            [
+                True,
+                days_since % packed.interval == 0,
+                (days_since % 7 == 0) & ((days_since // 7) % packed.interval == 0),
+                (months_since % packed.interval == 0) & (np.minimum(packed.anchor_day, month_days) == today.day),
+            ],
+            default=False,
+        )
+        rule_ok = np.append(cron_ok & modifier_ok, False)
+        return np.flatnonzero(rule_ok[packed.rule_ids])
+
     def _remove_minutes(self, cron: str)->str:
         cron_parts = cron.split()
         cron_parts[0] = "*" 
@@ -23,63 +311,44 @@ class VCron:
 
     def valid(self, cron_expression: str) -> bool:
         try:
-            croniter(cron_expression)  # Directly check with croniter
+            if compile_cron(cron_expression) is None:
+                croniter(cron_expression)  # Расширенный синтаксис проверяем самим croniter
             return True
         except ValueError:
             return False
 
+
+    def valid_modifier(self, modifier: str) -> bool:
+        """
+        Проверяет синтаксис модификатора: пусто, d/N, w/N, m/N или YYYYMMDD>... с N > 0
+        и корректной датой отсчёта. В отличие от check_modifier, не зависит от текущей даты.
+        """
         if not modifier:
             return True
-        pattern = r'^(?:(?P<date>\d{8})>?)?(?P<period>[wdm]\/\d+)$' # Added 'm' for month support
-
-        match = re.match(pattern, modifier)
-        if not match:
+        match = _MODIFIER_PATTERN.match(modifier)
+        if not match or int(match["interval"]) == 0:
             return False
-
-        period_part = match['period']
-
-        if date_part := match['date']:
-            try:
-                year = int(date_part[:4])
-                month = int(date_part[4:6])
-                day = int(date_part[6:])
-
-                # Проверка на корректность даты
-                if not (1900 <= year <= 9999 and 1 <= month <= 12 and 1 <= day <= 31):
-                    return False
-            except ValueError:
-                return False
-
-        # Проверка периода
-        period_match = re.match(r'[wdm]\/\d+$', period_part) # Added 'm' for month support
-        return bool(period_match)
+        return parse_modifier(modifier).anchor is not None
 
     def check_modifier(self, modifier: str, now: datetime) -> bool:
-        now = now.replace(tzinfo=self.timezone) # Ensure now has the correct timezone
         if not modifier:
             return True
 
-        parts = modifier.split(">")
-        start_date_str = parts[0] if len(parts) == 2 else "20010101"
-        rule = parts[-1]
-
-        try:
-            start_datetime = self.timezone.localize(datetime.combine(datetime.strptime(start_date_str, "%Y%m%d").date(), datetime.min.time()))
-        except OverflowError:
-            start_datetime = self.timezone.localize(datetime(2001, 1, 1)) # Fallback to a safe date
-        except ValueError:
-            return False # Invalid date format
-
-        if rule.startswith(("w/", "d/")):  # Handle all three types
-            interval = int(rule[2:])
-            delta = relativedelta(now, start_datetime)
-            days_since = self.days_since(now.date(), start_datetime.date(), )
+        parsed = parse_modifier(modifier)
+        if parsed.anchor is None:
+            return False  # Invalid date format
 
-            if rule.startswith("w/"):
-                weeks = int(days_since/7)
-                return (weeks % interval == 0) and (days_since%7 == 0)
-            elif rule.startswith("d/"):
-                return days_since % interval == 0
+        days_since = self.days_since(now.date(), parsed.anchor)
+        if parsed.rule == "w":
+            weeks = int(days_since/7)
+            return (weeks % parsed.interval == 0) and (days_since%7 == 0)
+        elif parsed.rule == "d":
+            return days_since % parsed.interval == 0
+        elif parsed.rule == "m":
+            # Каждые N месяцев в тот же день месяца, что и дата отсчёта (с ограничением концом месяца)
+            today = now.date()
+            months_since = self.months_since(today, parsed.anchor)
+            return months_since % parsed.interval == 0 and today == _add_months(parsed.anchor, months_since)
 
         return False
 
@@ -87,12 +356,130 @@ class VCron:
         delta = today_date - base_date
         return delta.days
 
+    def months_since(self, today_date: date, base_date: date) -> int:
+        return (today_date.year - base_date.year) * 12 + today_date.month - base_date.month
+
     def get_next_match(self, cron_expression: str, modifier: str = None, start_time: datetime = None) -> datetime or None:
+        """
+        Возвращает ближайший момент не раньше start_time, подходящий под cron и модификатор.
+        Минуты cron учитываются только в режиме exact_minutes.
+
+        Для обычных cron-выражений и модификаторов d/N, w/N, m/N ответ вычисляется арифметически
+        (_solve_next_match): перебираются только дни, удовлетворяющие модификатору.
+        Остальные случаи обрабатывает _get_next_match_iterative.
+        """
         current_time = start_time or datetime.now(tz=self.timezone).replace(microsecond=0)
-        cron_expression = self._remove_minutes(cron_expression) 
+        if getattr(current_time.tzinfo, "zone", None) == self.timezone.zone:
+            try:
+                compiled = compile_cron(cron_expression if self.exact_minutes else self._remove_minutes(cron_expression))
+                parsed = parse_modifier(modifier) if modifier else None
+            except ValueError:
+                compiled = None
+            if compiled is not None and self._solvable(parsed):
+                return self._solve_next_match(compiled, parsed, current_time)
+        return self._get_next_match_iterative(cron_expression, modifier, current_time)
+
+    @staticmethod
+    def _solvable(parsed: ParsedModifier | None) -> bool:
+        if parsed is None:
+            return True
+        # Некорректная дата или правило без d/, w/, m/ никогда не срабатывают
+        return parsed.anchor is None or parsed.interval is None or bool(parsed.interval)
+
+    def _solve_next_match(self, compiled: CompiledCron, parsed: ParsedModifier | None, current_time: datetime) -> datetime | None:
+        if parsed is None:
+            anchor, period = date(2001, 1, 1), 1
+        elif parsed.anchor is None or parsed.interval is None:
+            return None
+        elif parsed.rule == "m":
+            return self._solve_monthly(compiled, parsed.anchor, abs(parsed.interval), current_time)
+        else:
+            anchor = parsed.anchor
+            period = abs(parsed.interval) * (7 if parsed.rule == "w" else 1)
+
+        if not self._can_match(compiled, anchor, period):
+            return None
+
+        day = current_time.date()
+        if (day - anchor).days % period == 0 and compiled.match_day(day):
+            if (next_match := self._match_later_today(compiled, current_time)) is not None:
+                return next_match
+
+        # Следующий после day день, удовлетворяющий модификатору
+        day += timedelta(days=(anchor - day).days % period or period)
+        first_hour, first_minute = _lowest_bit(compiled.hours), _lowest_bit(compiled.minutes)
+        limit = current_time.date() + timedelta(days=NEXT_MATCH_HORIZON_DAYS)
+        while day <= limit:
+            if not compiled.months >> day.month & 1:
+                # Переходим к первому подходящему дню следующего месяца
+                month_start = date(day.year + day.month // 12, day.month % 12 + 1, 1)
+                day = month_start + timedelta(days=(anchor - month_start).days % period)
+                continue
+            if compiled.match_day(day):
+                return self._localize(day, first_hour, first_minute)
+            day += timedelta(days=period)
+        return None
+
+    def _solve_monthly(self, compiled: CompiledCron, anchor: date, interval: int, current_time: datetime) -> datetime | None:
+        """Модификатор m/N: в каждом N-м месяце от даты отсчёта подходит ровно один день."""
+        today = current_time.date()
+        months = self.months_since(today, anchor)
+        months -= months % interval  # последний подходящий месяц не позже текущего
+        first_hour, first_minute = _lowest_bit(compiled.hours), _lowest_bit(compiled.minutes)
+        limit = today + timedelta(days=NEXT_MATCH_HORIZON_DAYS)
+        while (day := _add_months(anchor, months)) <= limit:
+            if day == today and compiled.match_day(day):
+                if (next_match := self._match_later_today(compiled, current_time)) is not None:
+                    return next_match
+            elif day > today and compiled.match_day(day):
+                return self._localize(day, first_hour, first_minute)
+            months += interval
+        return None
+
+    def _match_later_today(self, compiled: CompiledCron, current_time: datetime) -> datetime | None:
+        """
+        Ближайший подходящий момент в день current_time (день уже проверен), начиная с него самого.
+        Без exact_minutes маска минут полная, и подходит любой момент подходящего часа.
+        """
+        if compiled.hours >> current_time.hour & 1:
+            if compiled.minutes >> current_time.minute & 1:
+                return current_time.replace(microsecond=0)
+            later_minutes = compiled.minutes >> (current_time.minute + 1)
+            if later_minutes:
+                minute = current_time.minute + 1 + _lowest_bit(later_minutes)
+                return self._localize(current_time.date(), current_time.hour, minute)
+        later_hours = compiled.hours >> (current_time.hour + 1)
+        if later_hours:
+            hour = current_time.hour + 1 + _lowest_bit(later_hours)
+            return self._localize(current_time.date(), hour, _lowest_bit(compiled.minutes))
+        return None
+
+    @staticmethod
+    def _can_match(compiled: CompiledCron, anchor: date, period: int) -> bool:
+        """Быстро отсекает невозможные сочетания (например, 31 февраля или w/N в неподходящий день недели)."""
+        dom_possible = any(
+            compiled.days & ((2 << _MONTH_DAYS[month]) - 1)
+            for month in range(1, 13)
+            if compiled.months >> month & 1
+        )
+        if period % 7:
+            dow_possible = bool(compiled.weekdays)
+        else:
+            # При периоде, кратном неделе, все подходящие дни приходятся на один день недели
+            dow_possible = bool(compiled.weekdays >> (anchor.weekday() + 1) % 7 & 1)
+        return (dom_possible or dow_possible) if compiled.day_or else (dom_possible and dow_possible)
+
+    def _localize(self, day: date, hour: int, minute: int = 0) -> datetime:
+        return self.timezone.normalize(self.timezone.localize(datetime(day.year, day.month, day.day, hour, minute)))
+
+    def _get_next_match_iterative(self, cron_expression: str, modifier: str = None, start_time: datetime = None) -> datetime or None:
+        """Поиск перебором срабатываний croniter (до 9999 шагов). Эталон для _solve_next_match."""
+        current_time = start_time or datetime.now(tz=self.timezone).replace(microsecond=0)
+        if not self.exact_minutes:
+            cron_expression = self._remove_minutes(cron_expression)
         iterator = croniter(cron_expression, current_time)
 
-        if croniter.match(cron_expression, current_time): # Check if current_time matches cron expression
+        if self.check_cron(cron_expression, current_time): # Check if current_time matches cron expression
             next_match = current_time
         else:
             next_match = iterator.get_next(datetime)
@@ -107,3 +494,65 @@ class VCron:
 
         return None
 
+
+
+class NextMatchCache:
+    """
+    Кэш результатов VCron.get_next_match с ключом (cron, modifier, час начала поиска).
+
+    Результат для момента t внутри часа h выводится из результата для h:00:
+    если час h подходит — это сам момент t, иначе — найденное срабатывание.
+    Поэтому все запросы в пределах часа обслуживаются одной записью.
+    В режиме VCron.exact_minutes то же справедливо для минуты, и ключом служит минута.
+    Потокобезопасен; при превышении maxsize вытесняются давно не использованные записи.
+    """
+
+    def __init__(self, vcron: VCron, maxsize: int = 10000):
+        self.vcron = vcron
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self._entries: OrderedDict[tuple, datetime | None] = OrderedDict()
+        self._lock = threading.Lock()
+        self._revision = None
+
+    def get_next_match(self, cron_expression: str, modifier: str = None, start_time: datetime = None) -> datetime | None:
+        current_time = start_time or datetime.now(tz=self.vcron.timezone).replace(microsecond=0)
+        bucket = self.vcron.timezone.normalize(self.vcron.period_start(current_time))
+        key = (cron_expression, modifier or None, int(bucket.timestamp()))
+        with self._lock:
+            if key in self._entries:
+                self.hits += 1
+                self._entries.move_to_end(key)
+                next_match = self._entries[key]
+                return max(next_match, current_time.replace(microsecond=0)) if next_match else None
+            self.misses += 1
+
+        next_match = self.vcron.get_next_match(cron_expression, modifier, start_time=bucket)
+        with self._lock:
+            self._entries[key] = next_match
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+        return max(next_match, current_time.replace(microsecond=0)) if next_match else None
+
+    def sync(self, revision):
+        """Сбрасывает кэш, если ревизия расписаний в БД изменилась."""
+        with self._lock:
+            if revision != self._revision:
+                self._revision = revision
+                self._entries.clear()
+
+    def invalidate(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> dict:
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "size": len(self._entries),
+                "maxsize": self.maxsize,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / total, 4) if total else 0.0,
+            }
@@ -1,8 +1,13 @@
 import os
 import sqlite3
+import threading
+import time
+from contextlib import closing
 from datetime import datetime
 from pathlib import Path
 
+from .cron_utils import VCron
+from .metrics import Gauge, Histogram, timed
 from .utils import MyError, get_environment_name, init_log, load_env
 
 # Load environment variables
@@ -13,9 +18,95 @@ DB_PATH = os.getenv("TLCR_DB_PATH", "settings.db")
 LOGPATH = os.getenv("TLCR_LOGPATH", ".")
 LOGLEVEL = os.getenv("TLCR_LOG_LEVEL", 'INFO').upper()
 BACKUP_DIR = os.getenv("TLCR_BACKUP_PATH", "static/db.bak")
+TIMEZONE = os.getenv("TLCR_TZ", "UTC")
+# Учитывать минуты cron при расчёте next_fire (как TLCR_EXACT_MINUTES демона)
+EXACT_MINUTES = os.getenv("TLCR_EXACT_MINUTES", "false").strip().lower() in ("1", "true", "yes")
+
+# Настройки соединений SQLite
+DB_BUSY_TIMEOUT_MS = int(os.getenv("TLCR_DB_BUSY_TIMEOUT_MS", "5000"))
+DB_SYNCHRONOUS = os.getenv("TLCR_DB_SYNCHRONOUS", "NORMAL").upper()
+DB_CACHE_SIZE = int(os.getenv("TLCR_DB_CACHE_SIZE", "-16000"))  # < 0 — размер в КиБ
+DB_MMAP_SIZE = int(os.getenv("TLCR_DB_MMAP_SIZE", str(64 * 1024 * 1024)))
+DB_TEMP_STORE = os.getenv("TLCR_DB_TEMP_STORE", "MEMORY").upper()
+DB_STATEMENT_CACHE = int(os.getenv("TLCR_DB_STATEMENT_CACHE", "128"))
+
+# Резервное копирование: страниц за шаг и пауза между шагами (секунды)
+BACKUP_PAGES = int(os.getenv("TLCR_BACKUP_PAGES", "256"))
+BACKUP_SLEEP = float(os.getenv("TLCR_BACKUP_SLEEP", "0.01"))
+# Сколько раз порционное копирование может начаться заново из-за записи в БД,
+# прежде чем копия будет снята за один шаг
+BACKUP_MAX_RESTARTS = int(os.getenv("TLCR_BACKUP_MAX_RESTARTS", "3"))
 
 log = init_log('db_utils', LOGPATH, LOGLEVEL)
 
+# Расчёт next_fire при добавлении/изменении расписаний
+_vcron = VCron(TIMEZONE, EXACT_MINUTES)
+
+# Соединения с БД: отдельные для каждого потока и процесса
+_connections = threading.local()
+
+# Метрики (lib.metrics)
+DB_QUERY_SECONDS = Histogram(
+    "tlcr_db_query_duration_seconds", "Длительность функций lib.db_utils, обращающихся к БД", ("query",)
+)
+BACKUP_SECONDS = Histogram(
+    "tlcr_backup_duration_seconds", "Длительность создания резервной копии БД",
+    buckets=(0.1, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600),
+)
+BACKUP_SIZE = Gauge("tlcr_backup_size_bytes", "Размер последней резервной копии БД")
+BACKUP_LAST_SUCCESS = Gauge("tlcr_backup_last_success_timestamp_seconds", "Время создания последней резервной копии БД")
+
+
+def _query_timed(func):
+    """Записывает длительность вызова функции в tlcr_db_query_duration_seconds{query=<имя функции>}."""
+    return timed(DB_QUERY_SECONDS, query=func.__name__)(func)
+
+
+# Счётчики ревизий (таблица revisions): увеличиваются при каждом изменении данных
+REV_SCHEDULES = "schedules"  # правила и тексты расписаний
+REV_CHANNELS = "channels"  # чаты и ntfy-каналы
+REV_FIRED = "fired"  # last_fired/next_fire, которые пишет демон
+
+
+def _open_connection(db_path) -> sqlite3.Connection:
+    """Открывает соединение и применяет PRAGMA-настройки из TLCR_DB_*."""
+    synchronous = DB_SYNCHRONOUS if DB_SYNCHRONOUS in ("OFF", "NORMAL", "FULL", "EXTRA") else "NORMAL"
+    temp_store = DB_TEMP_STORE if DB_TEMP_STORE in ("DEFAULT", "FILE", "MEMORY") else "MEMORY"
+    conn = sqlite3.connect(
+        db_path, timeout=DB_BUSY_TIMEOUT_MS / 1000, cached_statements=DB_STATEMENT_CACHE
+    )
+    conn.execute(f"PRAGMA busy_timeout = {DB_BUSY_TIMEOUT_MS}")
+    conn.execute("PRAGMA journal_mode = WAL")
+    conn.execute(f"PRAGMA synchronous = {synchronous}")
+    conn.execute(f"PRAGMA cache_size = {DB_CACHE_SIZE}")
+    conn.execute(f"PRAGMA mmap_size = {DB_MMAP_SIZE}")
+    conn.execute(f"PRAGMA temp_store = {temp_store}")
+    return conn
+
+
+def get_connection(db_path) -> sqlite3.Connection:
+    """
+    Возвращает долгоживущее соединение с БД для текущего потока.
+    Соединение открывается один раз на поток и процесс (после fork — заново)
+    и используется как контекстный менеджер транзакции: `with get_connection(db_path) as conn:`.
+    """
+    if getattr(_connections, "pid", None) != os.getpid():
+        _connections.pid = os.getpid()
+        _connections.by_path = {}
+    conn = _connections.by_path.get(db_path)
+    if conn is None:
+        conn = _connections.by_path[db_path] = _open_connection(db_path)
+    return conn
+
+
+def close_connections():
+    """Закрывает соединения текущего потока."""
+    if getattr(_connections, "pid", None) != os.getpid():
+        return
+    for conn in _connections.by_path.values():
+        conn.close()
+    _connections.by_path = {}
+
 
 def init_db(db_path=DB_PATH, drop_table=True):
     """
@@ -29,7 +120,7 @@ def init_db(db_path=DB_PATH, drop_table=True):
         return
 
     try:
-        with sqlite3.connect(db_path) as conn:
+        with get_connection(db_path) as conn:
             run_initialization(conn, drop_table, db_path)
         log.info(
             f"Таблицы базы данных '{db_path}.schedules,chats' "
@@ -64,6 +155,11 @@ def run_initialization(conn, drop_table, db_path):
         conn.commit()
         log.info(f'удалена таблица "schedules" из БД "{db_path}"')
 
+    # Таблица ревизий не пересоздаётся, чтобы счётчики только росли
+    cursor.execute(
+        "CREATE TABLE IF NOT EXISTS revisions (name TEXT PRIMARY KEY, value INTEGER NOT NULL, updated INTEGER)"
+    )
+
     run_create_table(
         f'''{'' if drop_table else 'IF NOT EXISTS'} schedules (
                         id INTEGER PRIMARY KEY AUTOINCREMENT,
@@ -73,6 +169,8 @@ def run_initialization(conn, drop_table, db_path):
                         last_fired TIMESTAMP,
                         chat_id INTEGER NOT NULL,
                         ntfy_id INTEGER,
+                        next_fire INTEGER,
+                        revision INTEGER NOT NULL DEFAULT 0,
                         FOREIGN KEY (chat_id) REFERENCES chats(id)
                     )''',
         cursor,
@@ -97,12 +195,15 @@ def run_initialization(conn, drop_table, db_path):
         cursor,
         conn,
     )
+    if drop_table:
+        bump_revision(cursor, REV_SCHEDULES)
+        conn.commit()
 
 
 def migrate_add_ntfy(db_path=DB_PATH):
     """Добавляет столбец ntfy_id в schedules и таблицу ntfy_channels, если их нет."""
     try:
-        with sqlite3.connect(db_path) as conn:
+        with get_connection(db_path) as conn:
             cursor = conn.cursor()
             # Таблица ntfy_channels
             cursor.execute("""
@@ -125,11 +226,308 @@ def migrate_add_ntfy(db_path=DB_PATH):
         log.error("Ошибка миграции ntfy: %s", str(e))
 
 
+def migrate_add_next_fire(db_path=DB_PATH):
+    """Добавляет в schedules столбец next_fire и индекс по нему, если их нет."""
+    try:
+        with get_connection(db_path) as conn:
+            cursor = conn.cursor()
+            cursor.execute("PRAGMA table_info(schedules)")
+            columns = [row[1] for row in cursor.fetchall()]
+            if "next_fire" not in columns:
+                cursor.execute("ALTER TABLE schedules ADD COLUMN next_fire INTEGER")
+            cursor.execute("CREATE INDEX IF NOT EXISTS idx_schedules_next_fire ON schedules(next_fire)")
+            conn.commit()
+            log.info("Миграция next_fire выполнена успешно")
+    except sqlite3.Error as e:
+        log.error("Ошибка миграции next_fire: %s", str(e))
+
+
+def migrate_add_revisions(db_path=DB_PATH):
+    """Добавляет таблицу revisions (со столбцом updated) и столбец schedules.revision с индексом, если их нет."""
+    try:
+        with get_connection(db_path) as conn:
+            cursor = conn.cursor()
+            cursor.execute(
+                "CREATE TABLE IF NOT EXISTS revisions (name TEXT PRIMARY KEY, value INTEGER NOT NULL, updated INTEGER)"
+            )
+            cursor.execute("PRAGMA table_info(revisions)")
+            if "updated" not in [row[1] for row in cursor.fetchall()]:
+                cursor.execute("ALTER TABLE revisions ADD COLUMN updated INTEGER")
+            cursor.execute("PRAGMA table_info(schedules)")
+            columns = [row[1] for row in cursor.fetchall()]
+            if "revision" not in columns:
+                cursor.execute("ALTER TABLE schedules ADD COLUMN revision INTEGER NOT NULL DEFAULT 0")
+            cursor.execute("CREATE INDEX IF NOT EXISTS idx_schedules_revision ON schedules(revision)")
+            conn.commit()
+            log.info("Миграция revisions выполнена успешно")
+    except sqlite3.Error as e:
+        log.error("Ошибка миграции revisions: %s", str(e))
+
+
+def migrate_add_schedule_indexes(db_path=DB_PATH):
+    """Создаёт индексы schedules для фильтров GET /schedules (chat_id, ntfy_id, last_fired)."""
+    try:
+        with get_connection(db_path) as conn:
+            cursor = conn.cursor()
+            # Индексы SQLite неявно содержат rowid (= id), поэтому подходят и для выборки по id > ?
+            cursor.execute("CREATE INDEX IF NOT EXISTS idx_schedules_chat_id ON schedules(chat_id)")
+            cursor.execute("CREATE INDEX IF NOT EXISTS idx_schedules_ntfy_id ON schedules(ntfy_id)")
+            cursor.execute("CREATE INDEX IF NOT EXISTS idx_schedules_last_fired ON schedules(last_fired)")
+            conn.commit()
+            log.info("Миграция индексов schedules выполнена успешно")
+    except sqlite3.Error as e:
+        log.error("Ошибка миграции индексов schedules: %s", str(e))
+
+
+def bump_revision(cursor, name) -> int:
+    """
+    Увеличивает счётчик ревизии name в текущей транзакции и возвращает новое значение;
+    время изменения (unix timestamp) записывается в updated.
+    Вызывается всеми функциями, изменяющими данные.
+    """
+    cursor.execute(
+        "INSERT INTO revisions (name, value, updated) VALUES (?, 1, CAST(strftime('%s', 'now') AS INTEGER)) "
+        "ON CONFLICT(name) DO UPDATE SET value = value + 1, updated = excluded.updated",
+        (name,),
+    )
+    cursor.execute("SELECT value FROM revisions WHERE name = ?", (name,))
+    return cursor.fetchone()[0]
+
+
+@_query_timed
+def get_revisions(db_path) -> dict:
+    """
+    Возвращает текущие значения счётчиков ревизий {имя: значение}.
+    Дешёвый запрос, по которому демон и веб-приложение определяют, изменились ли данные.
+    """
+    revisions = dict.fromkeys((REV_SCHEDULES, REV_CHANNELS, REV_FIRED), 0)
+    try:
+        with get_connection(db_path) as conn:
+            cursor = conn.cursor()
+            cursor.execute("SELECT name, value FROM revisions")
+            revisions.update(cursor.fetchall())
+    except sqlite3.Error as e:
+        log.error("Ошибка при получении ревизий: %s", str(e))
+    return revisions
+
+
+@_query_timed
+def get_revisions_modified(db_path) -> tuple[dict, int | None]:
+    """
+    Возвращает счётчики ревизий (как get_revisions) и время последнего изменения
+    данных (unix timestamp, None — неизвестно) одним запросом.
+    """
+    revisions = dict.fromkeys((REV_SCHEDULES, REV_CHANNELS, REV_FIRED), 0)
+    modified = None
+    try:
+        with get_connection(db_path) as conn:
+            for name, value, updated in conn.execute("SELECT name, value, updated FROM revisions"):
+                revisions[name] = value
+                if updated is not None:
+                    modified = max(modified or 0, updated)
+    except sqlite3.Error as e:
+        log.error("Ошибка при получении ревизий: %s", str(e))
+    return revisions, modified
+
+
+@_query_timed
+def get_schedule_ids(db_path) -> set:
+    """Возвращает множество id всех расписаний (для обнаружения удалённых)."""
+    try:
+        with get_connection(db_path) as conn:
+            cursor = conn.cursor()
+            cursor.execute("SELECT id FROM schedules")
+            return {row[0] for row in cursor.fetchall()}
+    except sqlite3.Error as e:
+        log.error("Ошибка при получении id расписаний: %s", str(e))
+        return set()
+
+
+def compute_next_fire(cron, modifier, after: datetime | None = None) -> int | None:
+    """
+    Вычисляет время следующего срабатывания (unix timestamp) в зоне TLCR_TZ.
+    Возвращает None, если срабатывание не найдено или выражение некорректно.
+    """
+    try:
+        next_match = _vcron.get_next_match(cron, modifier, start_time=after)
+    except ValueError:
+        return None
+    return int(next_match.timestamp()) if next_match else None
+
+
+def backfill_next_fire(db_path=DB_PATH, only_missing=True) -> int:
+    """
+    Заполняет next_fire для существующих расписаний.
+
+    Args:
+        db_path (str): Путь к файлу базы данных.
+        only_missing (bool): Пересчитывать только строки с пустым или прошедшим next_fire.
+
+    Returns:
+        int: количество обновлённых строк.
+    """
+    now = datetime.now(_vcron.timezone)
+    period_start = int(_vcron.period_start(now).timestamp())
+    try:
+        with get_connection(db_path) as conn:
+            cursor = conn.cursor()
+            if only_missing:
+                cursor.execute(
+                    "SELECT id, cron, modifier FROM schedules WHERE next_fire IS NULL OR next_fire < ?",
+                    (period_start,),
+                )
+            else:
+                cursor.execute("SELECT id, cron, modifier FROM schedules")
+            updates = [
+                (compute_next_fire(cron, modifier, now), schedule_id)
+                for schedule_id, cron, modifier in cursor.fetchall()
+            ]
+            conn.executemany("UPDATE schedules SET next_fire = ? WHERE id = ?", updates)
+            bump_revision(cursor, REV_FIRED)
+            log.info(f"next_fire пересчитан для {len(updates)} расписаний")
+            return len(updates)
+    except sqlite3.Error as e:
+        log.error("Ошибка при заполнении next_fire: %s", str(e))
+        return 0
+
+
+# Поля расписания, возвращаемые get_schedules/iter_schedules
+SCHEDULE_FIELDS = ("id", "cron", "message", "modifier", "last_fired", "chat_id", "ntfy_id", "next_fire")
+
+
+@_query_timed
 def get_schedules(db_path) -> list:
     try:
-        with sqlite3.connect(db_path) as conn:
+        with get_connection(db_path) as conn:
             cursor = conn.cursor()
-            cursor.execute("SELECT id, cron, message, modifier, last_fired, chat_id, ntfy_id FROM schedules")
+            cursor.execute(f"SELECT {', '.join(SCHEDULE_FIELDS)} FROM schedules")
+            return [dict(zip(SCHEDULE_FIELDS, row)) for row in cursor.fetchall()]
+    except sqlite3.Error as e:
+        log.error("Ошибка при получении расписаний: %s", str(e))
+        return []
+
+
+@_query_timed
+def get_schedules_page(
+    db_path,
+    after_id: int | None = None,
+    limit: int | None = None,
+    chat_id: int | None = None,
+    ntfy_id: int | None = None,
+    fired_from: datetime | None = None,
+    fired_to: datetime | None = None,
+    fields=SCHEDULE_FIELDS,
+) -> tuple[list, int | None]:
+    """
+    Возвращает страницу расписаний в порядке id (keyset-пагинация: id > after_id).
+
+    Args:
+        db_path (str): Путь к файлу базы данных.
+        after_id (int | None): id последнего расписания предыдущей страницы.
+        limit (int | None): размер страницы; None — все подходящие расписания.
+        chat_id, ntfy_id (int | None): фильтры по чату и ntfy-каналу.
+        fired_from, fired_to (datetime | None): диапазон last_fired (включительно, локальное время).
+        fields (Iterable[str]): возвращаемые поля из SCHEDULE_FIELDS; id возвращается всегда.
+
+    Returns:
+        tuple[list, int | None]: расписания и курсор следующей страницы (None — страница последняя).
+    """
+    columns = ["id"] + [field for field in SCHEDULE_FIELDS if field in fields and field != "id"]
+    conditions, params = [], []
+    for condition, value in (
+        ("id > ?", after_id),
+        ("chat_id = ?", chat_id),
+        ("ntfy_id = ?", ntfy_id),
+        ("last_fired >= ?", fired_from),
+        ("last_fired <= ?", fired_to),
+    ):
+        if value is not None:
+            conditions.append(condition)
+            params.append(value)
+    sql = f"SELECT {', '.join(columns)} FROM schedules"
+    if conditions:
+        sql += " WHERE " + " AND ".join(conditions)
+    sql += " ORDER BY id"
+    if limit is not None:
+        # Лишняя строка показывает, есть ли следующая страница
+        sql += " LIMIT ?"
+        params.append(limit + 1)
+    try:
+        with get_connection(db_path) as conn:
+            rows = conn.execute(sql, params).fetchall()
+    except sqlite3.Error as e:
+        log.error("Ошибка при получении расписаний: %s", str(e))
+        return [], None
+    next_cursor = None
+    if limit is not None and len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = rows[-1][0] if rows else None
+    return [dict(zip(columns, row)) for row in rows], next_cursor
+
+
+def iter_schedules(db_path, batch_size: int = 500):
+    """
+    Возвращает расписания (в порядке id) по одному, читая их из курсора пачками по batch_size,
+    чтобы не держать всю таблицу в памяти. Курсор закрывается, когда генератор исчерпан или закрыт.
+
+    Raises:
+        MyError: ошибка БД.
+    """
+    try:
+        cursor = get_connection(db_path).execute(f"SELECT {', '.join(SCHEDULE_FIELDS)} FROM schedules ORDER BY id")
+        try:
+            while rows := cursor.fetchmany(batch_size):
+                for row in rows:
+                    yield dict(zip(SCHEDULE_FIELDS, row))
+        finally:
+            cursor.close()
+    except sqlite3.Error as e:
+        log.error("Ошибка при выгрузке расписаний: %s", str(e))
+        raise MyError(f"Ошибка при выгрузке расписаний: {e}")
+
+
+@_query_timed
+def get_tick_snapshot(
+    db_path, until: int | None = None, since: int | None = None, changed_since: int | None = None
+) -> list:
+    """
+    Загружает расписания для демона одним запросом, сразу с Telegram chat_id
+    (из таблицы chats) и url/title ntfy-канала, чтобы срабатывание не требовало
+    дополнительных обращений к БД.
+
+    Args:
+        db_path (str): Путь к файлу базы данных.
+        until (int | None): Если задан — только расписания с next_fire <= until
+            (по индексу); без since — также с ещё не вычисленным next_fire.
+        since (int | None): Если задан — только расписания с next_fire > since.
+        changed_since (int | None): Если задан — только расписания, изменённые
+            после ревизии REV_SCHEDULES с этим значением (остальные фильтры не применяются).
+
+    Returns:
+        list: словари расписаний с дополнительными ключами tg_chat_id, ntfy_url, ntfy_title
+            и revision (ревизия строки — с ней записывается вычисленный демоном next_fire).
+    """
+    sql = (
+        "SELECT s.id, s.cron, s.message, s.modifier, s.last_fired, s.chat_id, s.ntfy_id, "
+        "c.chat_id, n.url, n.title, s.next_fire, s.revision "
+        "FROM schedules s "
+        "LEFT JOIN chats c ON c.id = s.chat_id "
+        "LEFT JOIN ntfy_channels n ON n.id = s.ntfy_id"
+    )
+    params = ()
+    if changed_since is not None:
+        sql += " WHERE s.revision > ?"
+        params = (changed_since,)
+    elif since is not None:
+        sql += " WHERE s.next_fire > ?" + (" AND s.next_fire <= ?" if until is not None else "")
+        params = (since,) if until is None else (since, until)
+    elif until is not None:
+        sql += " WHERE s.next_fire <= ? OR s.next_fire IS NULL"
+        params = (until,)
+    try:
+        with get_connection(db_path) as conn:
+            cursor = conn.cursor()
+            cursor.execute(sql, params)
             return [
                 {
                     "id": row[0],
@@ -139,20 +537,26 @@ def get_schedules(db_path) -> list:
                     "last_fired": row[4],
                     "chat_id": row[5],
                     "ntfy_id": row[6],
+                    "tg_chat_id": row[7],
+                    "ntfy_url": row[8],
+                    "ntfy_title": row[9],
+                    "next_fire": row[10],
+                    "revision": row[11],
                 }
                 for row in cursor.fetchall()
             ]
     except sqlite3.Error as e:
-        log.error("Ошибка при получении расписаний: %s", str(e))
+        log.error("Ошибка при получении снимка расписаний: %s", str(e))
         return []
 
 
+@_query_timed
 def get_schedule(schedule_id, db_path) -> dict | None:
     try:
-        with sqlite3.connect(db_path) as conn:
+        with get_connection(db_path) as conn:
             cursor = conn.cursor()
             cursor.execute(
-                "SELECT id, cron, message, modifier, last_fired, chat_id, ntfy_id "
+                "SELECT id, cron, message, modifier, last_fired, chat_id, ntfy_id, next_fire "
                 "FROM schedules WHERE id = ?",
                 (schedule_id,),
             )
@@ -166,6 +570,7 @@ def get_schedule(schedule_id, db_path) -> dict | None:
                     "last_fired": row[4],
                     "chat_id": row[5],
                     "ntfy_id": row[6],
+                    "next_fire": row[7],
                 }
             return None
     except sqlite3.Error as e:
@@ -173,17 +578,19 @@ def get_schedule(schedule_id, db_path) -> dict | None:
         return None
 
 
+@_query_timed
 def add_schedule(cron, message, modifier, chat_id, db_path, ntfy_id=None):
     try:
-        with sqlite3.connect(db_path) as conn:
+        with get_connection(db_path) as conn:
             cursor = conn.cursor()
             cursor.execute("SELECT COUNT(*) FROM chats")
             if cursor.fetchone()[0] == 0:
                 raise MyError("Нельзя добавить расписание: таблица chats пуста.")
+            revision = bump_revision(cursor, REV_SCHEDULES)
             cursor.execute(
-                "INSERT INTO schedules (cron, message, modifier, chat_id, ntfy_id) "
-                "VALUES (?, ?, ?, ?, ?)",
-                (cron, message, modifier, chat_id, ntfy_id or None),
+                "INSERT INTO schedules (cron, message, modifier, chat_id, ntfy_id, next_fire, revision) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (cron, message, modifier, chat_id, ntfy_id or None, compute_next_fire(cron, modifier), revision),
             )
             conn.commit()
     except sqlite3.Error as e:
@@ -193,6 +600,49 @@ def add_schedule(cron, message, modifier, chat_id, db_path, ntfy_id=None):
         raise
 
 
+@_query_timed
+def add_schedules_many(rows, db_path) -> int:
+    """
+    Добавляет расписания одной транзакцией (executemany): при ошибке не добавляется ни одно.
+    Данные должны быть проверены заранее; все строки получают одну ревизию REV_SCHEDULES.
+
+    Args:
+        rows (Iterable[tuple]): кортежи (cron, message, modifier, chat_id, ntfy_id).
+        db_path (str): Путь к файлу базы данных.
+
+    Returns:
+        int: количество добавленных расписаний.
+
+    Raises:
+        MyError: ошибка БД.
+    """
+    # next_fire вычисляется один раз для каждой пары cron/modifier
+    next_fire = {}
+
+    def values(revision):
+        for cron, message, modifier, chat_id, ntfy_id in rows:
+            if (cron, modifier) not in next_fire:
+                next_fire[cron, modifier] = compute_next_fire(cron, modifier)
+            yield cron, message, modifier, chat_id, ntfy_id or None, next_fire[cron, modifier], revision
+
+    try:
+        with get_connection(db_path) as conn:
+            cursor = conn.cursor()
+            revision = bump_revision(cursor, REV_SCHEDULES)
+            cursor.executemany(
+                "INSERT INTO schedules (cron, message, modifier, chat_id, ntfy_id, next_fire, revision) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                values(revision),
+            )
+            count = cursor.rowcount
+        log.info("Добавлено расписаний: %d", count)
+        return count
+    except sqlite3.Error as e:
+        log.error("Ошибка при добавлении расписаний: %s", str(e))
+        raise MyError(f"Ошибка при добавлении расписаний: {e}")
+
+
+@_query_timed
 def delete_schedule(schedule_id, db_path):
     """
     Удаляет расписание с id=schedule_id из базы данных.
@@ -202,18 +652,20 @@ def delete_schedule(schedule_id, db_path):
         db_path (str): Путь к файлу базы данных.
     """
     try:
-        with sqlite3.connect(db_path) as conn:
+        with get_connection(db_path) as conn:
             cursor = conn.cursor()
             cursor.execute("DELETE FROM schedules WHERE id = ?", (schedule_id,))
+            bump_revision(cursor, REV_SCHEDULES)
             conn.commit()
             log.info("Удалено расписание с ID: %d", schedule_id)
     except sqlite3.Error as e:
         log.error("Ошибка при удалении расписания: %s", str(e))
 
 
+@_query_timed
 def get_chats(db_path) -> list:
     try:
-        with sqlite3.connect(db_path) as conn:
+        with get_connection(db_path) as conn:
             cursor = conn.cursor()
             cursor.execute("SELECT id, name, chat_id FROM chats")
             return [{"id": row[0], "name": row[1], "chat_id": row[2]} for row in cursor.fetchall()]
@@ -222,28 +674,33 @@ def get_chats(db_path) -> list:
         return []
 
 
+@_query_timed
 def add_chat(name, chat_id, db_path):
     try:
-        with sqlite3.connect(db_path) as conn:
+        with get_connection(db_path) as conn:
             cursor = conn.cursor()
             cursor.execute("INSERT INTO chats (name, chat_id) VALUES (?, ?)", (name, chat_id))
+            bump_revision(cursor, REV_CHANNELS)
             conn.commit()
             log.info("Добавлен новый чат: %s, %s", name, chat_id)
     except sqlite3.Error as e:
         log.error("Ошибка при добавлении чата: %s", str(e))
 
 
+@_query_timed
 def delete_chat(chat_id, db_path):
     """
     Удаляет чат по ID и все связанные с ним расписания.
     """
     try:
-        with sqlite3.connect(db_path) as conn:
+        with get_connection(db_path) as conn:
             cursor = conn.cursor()
             # Сначала удаляем все связанные расписания
             cursor.execute("DELETE FROM schedules WHERE chat_id = ?", (chat_id,))
             # Затем удаляем сам чат
             cursor.execute("DELETE FROM chats WHERE id = ?", (chat_id,))
+            bump_revision(cursor, REV_SCHEDULES)
+            bump_revision(cursor, REV_CHANNELS)
             conn.commit()
             log.info("Удалён чат с ID: %s и все связанные с ним расписания", chat_id)
     except sqlite3.Error as e:
@@ -251,28 +708,157 @@ def delete_chat(chat_id, db_path):
         raise MyError(f"Ошибка при удалении чата: {e}")
 
 
+@_query_timed
 def update_last_fired(schedule_id, db_path):
     """
     Обновляет поле last_fired для расписания с id=schedule_id.
     """
     try:
-        with sqlite3.connect(db_path) as conn:
+        with get_connection(db_path) as conn:
             cursor = conn.cursor()
             now = datetime.now()
             cursor.execute("UPDATE schedules SET last_fired = ? WHERE id = ?", (now, schedule_id))
+            bump_revision(cursor, REV_FIRED)
             conn.commit()
             log.debug(f"last_fired updated for schedule ID: {schedule_id}")
     except sqlite3.Error as e:
         log.error("Ошибка при обновлении last_fired: %s", str(e))
 
 
+@_query_timed
+def update_last_fired_many(items, db_path, next_fire_items=()) -> int:
+    """
+    Обновляет last_fired (и next_fire) для нескольких расписаний одной транзакцией.
+
+    next_fire записывается, только если ревизия строки не изменилась: если расписание
+    отредактировали после вычисления, update_schedule уже записал next_fire нового правила.
+
+    Args:
+        items (list[tuple[int, datetime]]): пары (id расписания, время срабатывания).
+        db_path (str): Путь к файлу базы данных.
+        next_fire_items (list[tuple[int, int | None, int]]): тройки
+            (id расписания, next_fire, ревизия строки, для которой next_fire вычислен).
+
+    Returns:
+        int: количество записанных обновлений.
+    """
+    if not items and not next_fire_items:
+        return 0
+    try:
+        with get_connection(db_path) as conn:
+            conn.executemany(
+                "UPDATE schedules SET last_fired = ? WHERE id = ?",
+                [(fired_at, schedule_id) for schedule_id, fired_at in items],
+            )
+            conn.executemany(
+                "UPDATE schedules SET next_fire = ? WHERE id = ? AND revision = ?",
+                [(next_fire, schedule_id, revision) for schedule_id, next_fire, revision in next_fire_items],
+            )
+            bump_revision(conn.cursor(), REV_FIRED)
+            log.debug(f"last_fired/next_fire updated for {len(items)}/{len(next_fire_items)} schedules")
+            return len(items) + len(next_fire_items)
+    except sqlite3.Error as e:
+        log.error("Ошибка при пакетном обновлении last_fired: %s", str(e))
+        return 0
+
+
+class LastFiredWriter:
+    """
+    Отложенная (write-behind) запись last_fired и next_fire.
+
+    Срабатывания копятся в памяти и записываются одной транзакцией
+    update_last_fired_many, когда накопится max_pending записей или пройдёт
+    flush_seconds с первой незаписанной. close() гарантирует запись остатка.
+    next_fire запоминается вместе с ревизией расписания и не перезаписывает
+    значение, сохранённое веб-приложением после редактирования.
+    """
+
+    def __init__(self, db_path=DB_PATH, max_pending: int = 100, flush_seconds: float = 5.0):
+        self.db_path = db_path
+        self.max_pending = max(1, max_pending)
+        self.flush_seconds = flush_seconds
+        self._pending: dict[int, datetime] = {}
+        # id расписания -> (next_fire, ревизия строки)
+        self._next_fire: dict[int, tuple[int | None, int]] = {}
+        self._first_pending_at: float | None = None
+        self._cond = threading.Condition()
+        self._closed = False
+        self._thread: threading.Thread | None = None
+
+    def add(self, schedule_id: int, fired_at: datetime | None = None):
+        with self._cond:
+            self._pending[schedule_id] = fired_at or datetime.now()
+            self._mark_pending()
+
+    def add_next_fire(self, schedule_id: int, next_fire: int | None, revision: int):
+        """
+        Запоминает новое время следующего срабатывания расписания (unix timestamp),
+        вычисленное для ревизии revision строки schedules.
+        """
+        with self._cond:
+            self._next_fire[schedule_id] = (next_fire, revision)
+            self._mark_pending()
+
+    def _mark_pending(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="last-fired-writer", daemon=True)
+            self._thread.start()
+        if self._first_pending_at is None:
+            self._first_pending_at = time.monotonic()
+        self._cond.notify()
+
+    def flush(self) -> int:
+        """Записывает накопленные изменения; возвращает их количество."""
+        with self._cond:
+            items = list(self._pending.items())
+            next_fire_items = [
+                (schedule_id, next_fire, revision) for schedule_id, (next_fire, revision) in self._next_fire.items()
+            ]
+            self._pending.clear()
+            self._next_fire.clear()
+            self._first_pending_at = None
+        return update_last_fired_many(items, self.db_path, next_fire_items)
+
+    def close(self) -> int:
+        """Останавливает фоновую запись и сбрасывает остаток в БД."""
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+        if self._thread is not None:
+            self._thread.join(timeout=5)
+            self._thread = None
+        self._closed = False
+        return self.flush()
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while not self._closed:
+                    if self._first_pending_at is None:
+                        self._cond.wait()
+                        continue
+                    if len(self._pending) + len(self._next_fire) >= self.max_pending:
+                        break
+                    remaining = self._first_pending_at + self.flush_seconds - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    self._cond.wait(remaining)
+                if self._closed:
+                    return
+            self.flush()
+
+
+@_query_timed
 def update_schedule(schedule_id, cron, message, modifier, chat_id, db_path, ntfy_id=None):
     try:
-        with sqlite3.connect(db_path) as conn:
+        with get_connection(db_path) as conn:
             cursor = conn.cursor()
+            revision = bump_revision(cursor, REV_SCHEDULES)
             cursor.execute(
-                "UPDATE schedules SET cron=?, message=?, modifier=?, chat_id=?, ntfy_id=? WHERE id=?",
-                (cron, message, modifier, chat_id, ntfy_id or None, schedule_id),
+                "UPDATE schedules SET cron=?, message=?, modifier=?, chat_id=?, ntfy_id=?, next_fire=?, "
+                "revision=? WHERE id=?",
+                (cron, message, modifier, chat_id, ntfy_id or None,
+                 compute_next_fire(cron, modifier), revision, schedule_id),
             )
             conn.commit()
         return None
@@ -280,29 +866,90 @@ def update_schedule(schedule_id, cron, message, modifier, chat_id, db_path, ntfy
         log.error("Ошибка при обновлении расписания: %s", str(e))
 
 
-def backup_database(db_path=DB_PATH, backup_dir=BACKUP_DIR):
+class _BackupRestarted(Exception):
+    """Порционное копирование слишком часто начинается заново из-за записи в БД."""
+
+
+def _backup_revisions(backup_file: Path) -> dict | None:
+    """Читает счётчики ревизий из файла резервной копии (только чтение); None — прочитать не удалось."""
+    try:
+        with closing(sqlite3.connect(f"{backup_file.resolve().as_uri()}?mode=ro", uri=True)) as conn:
+            revisions = dict.fromkeys((REV_SCHEDULES, REV_CHANNELS, REV_FIRED), 0)
+            revisions.update(conn.execute("SELECT name, value FROM revisions").fetchall())
+            return revisions
+    except sqlite3.Error:
+        return None
+
+
+def backup_database(
+    db_path=DB_PATH, backup_dir=BACKUP_DIR, pages=BACKUP_PAGES, sleep=BACKUP_SLEEP, force=False
+) -> Path | None:
     """
     Создает резервную копию базы данных 
     и удаляет старые копии, оставляя только 3 последних.
 
+    Копия не создаётся, если счётчики ревизий БД совпадают с сохранёнными в последней копии.
+    Данные копируются порциями по pages страниц с паузой sleep секунд между ними,
+    чтобы не блокировать запись в БД. Если БД всё время меняется и копирование больше
+    BACKUP_MAX_RESTARTS раз начинается заново, копия снимается за один шаг (в режиме WAL
+    это не блокирует запись). Копия пишется во временный файл и переименовывается
+    только после завершения, поэтому прерванное копирование не оставляет неполный бэкап.
+
     Args:
         db_path (str): Путь к файлу базы данных
         backup_dir (str): Путь к директории для резервных копий
+        pages (int): Страниц за один шаг копирования (<= 0 — вся БД за один шаг)
+        sleep (float): Пауза между шагами, секунды
+        force (bool): Создать копию, даже если БД не изменилась
 
     Returns:
-        Path: путь к созданному файлу бэкапа
+        Path | None: путь к созданному файлу бэкапа или None, если БД не изменилась
     """
     backup_path = Path(backup_dir)
     backup_path.mkdir(parents=True, exist_ok=True)
 
+    revisions = get_revisions(db_path)
+    backup_files = sorted(backup_path.glob("settings_*.db"), key=lambda x: x.stat().st_mtime, reverse=True)
+    if not force and backup_files and _backup_revisions(backup_files[0]) == revisions:
+        log.info(f"БД ({db_path}) не изменилась с последней резервной копии {backup_files[0]}, копирование пропущено")
+        return None
+
     timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
     backup_file = backup_path / f"settings_{timestamp}.db"
+    partial_file = backup_path / f"settings_{timestamp}.db.part"
+
+    progress = {"remaining": None, "restarts": 0}
+
+    def pause(status, remaining, total):
+        # SQLite начинает копирование заново, если БД изменена другим соединением
+        if progress["remaining"] is not None and remaining >= progress["remaining"]:
+            progress["restarts"] += 1
+            if progress["restarts"] > BACKUP_MAX_RESTARTS:
+                raise _BackupRestarted()
+        progress["remaining"] = remaining
+        if remaining and sleep > 0:
+            time.sleep(sleep)
 
     try:
-        with sqlite3.connect(db_path) as source:
-            with sqlite3.connect(str(backup_file)) as backup:
+        started = time.monotonic()
+        source = get_connection(db_path)
+        with closing(sqlite3.connect(str(partial_file))) as backup:
+            try:
+                source.backup(backup, pages=pages, progress=pause)
+            except _BackupRestarted:
+                log.info(f"БД ({db_path}) изменяется во время копирования, копия снимается за один шаг")
                 source.backup(backup)
-                log.info(f"Создана резервная копия БД ({db_path}): {backup_file}")
+            # Копия должна быть одним файлом, без -wal/-shm рядом
+            backup.execute("PRAGMA journal_mode = DELETE")
+        partial_file.replace(backup_file)
+        elapsed = time.monotonic() - started
+        BACKUP_SECONDS.observe(elapsed)
+        BACKUP_SIZE.set(backup_file.stat().st_size)
+        BACKUP_LAST_SUCCESS.set(int(time.time()))
+        log.info(
+            f"Создана резервная копия БД ({db_path}): {backup_file}, "
+            f"{backup_file.stat().st_size} байт за {elapsed:.2f} с"
+        )
 
         # Удаление старых бэкапов, оставляем только 3 последних
         backup_files = sorted(
@@ -323,11 +970,16 @@ def backup_database(db_path=DB_PATH, backup_dir=BACKUP_DIR):
     except sqlite3.Error as e:
         log.error(f"Ошибка при создании резервной копии БД: {e}")
         raise MyError(f"Ошибка при создании резервной копии БД: {e}")
+    finally:
+        # Незавершённая копия (ошибка, остановка процесса) не должна оставаться в каталоге
+        partial_file.unlink(missing_ok=True)
+        partial_file.with_name(partial_file.name + "-journal").unlink(missing_ok=True)
 
 
+@_query_timed
 def get_ntfy_channels(db_path) -> list:
     try:
-        with sqlite3.connect(db_path) as conn:
+        with get_connection(db_path) as conn:
             cursor = conn.cursor()
             cursor.execute("SELECT id, name, url, title FROM ntfy_channels")
             return [
@@ -339,52 +991,59 @@ def get_ntfy_channels(db_path) -> list:
         return []
 
 
+@_query_timed
 def add_ntfy_channel(name, url, title, db_path):
     try:
-        with sqlite3.connect(db_path) as conn:
+        with get_connection(db_path) as conn:
             cursor = conn.cursor()
             cursor.execute(
                 "INSERT INTO ntfy_channels (name, url, title) VALUES (?, ?, ?)",
                 (name, url, title or None),
             )
+            bump_revision(cursor, REV_CHANNELS)
             conn.commit()
     except sqlite3.Error as e:
         log.error("Ошибка при добавлении ntfy канала: %s", str(e))
 
 
+@_query_timed
 def update_ntfy_channel(channel_id, name, url, title, db_path):
     """
     Обновляет ntfy-канал.
     """
     try:
-        with sqlite3.connect(db_path) as conn:
+        with get_connection(db_path) as conn:
             cursor = conn.cursor()
             cursor.execute(
                 "UPDATE ntfy_channels SET name=?, url=?, title=? WHERE id=?",
                 (name, url, title or None, channel_id),
             )
+            bump_revision(cursor, REV_CHANNELS)
             conn.commit()
     except sqlite3.Error as e:
         log.error("Ошибка при обновлении ntfy канала: %s", str(e))
         raise MyError(f"Ошибка при обновлении ntfy канала: {e}")
 
 
+@_query_timed
 def delete_ntfy_channel(channel_id, db_path):
     try:
-        with sqlite3.connect(db_path) as conn:
+        with get_connection(db_path) as conn:
             cursor = conn.cursor()
             # Обнуляем ссылки в расписаниях
             cursor.execute("UPDATE schedules SET ntfy_id=NULL WHERE ntfy_id=?", (channel_id,))
             cursor.execute("DELETE FROM ntfy_channels WHERE id=?", (channel_id,))
+            bump_revision(cursor, REV_CHANNELS)
             conn.commit()
     except sqlite3.Error as e:
         log.error("Ошибка при удалении ntfy канала: %s", str(e))
         raise MyError(f"Ошибка при удалении ntfy канала: {e}")
 
 
+@_query_timed
 def get_ntfy_channel(channel_id, db_path) -> dict | None:
     try:
-        with sqlite3.connect(db_path) as conn:
+        with get_connection(db_path) as conn:
             cursor = conn.cursor()
             cursor.execute(
                 "SELECT id, name, url, title FROM ntfy_channels WHERE id=?",
@@ -395,3 +1054,16 @@ def get_ntfy_channel(channel_id, db_path) -> dict | None:
     except sqlite3.Error as e:
         log.error("Ошибка при получении ntfy канала: %s", str(e))
         return None
+
+
+if __name__ == "__main__":
+    # python -m lib.db_utils backfill_next_fire [--all]
+    import sys
+
+    if len(sys.argv) >= 2 and sys.argv[1] == "backfill_next_fire":
+        migrate_add_next_fire(DB_PATH)
+        migrate_add_revisions(DB_PATH)
+        backfill_next_fire(DB_PATH, only_missing="--all" not in sys.argv[2:])
+    else:
+        print("usage: python -m lib.db_utils backfill_next_fire [--all]")
+        sys.exit(2)
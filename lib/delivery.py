@@ -0,0 +1,344 @@
+import heapq
+import itertools
+import os
+import threading
+import time
+from dataclasses import dataclass, field
+from typing import Callable
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from .metrics import Counter, Gauge, Histogram
+from .utils import get_environment_name, load_env
+
+# Load environment variables
+environment = get_environment_name()
+load_env(environment)
+
+HTTP_CONNECT_TIMEOUT = float(os.getenv("TLCR_HTTP_CONNECT_TIMEOUT", "5"))
+HTTP_READ_TIMEOUT = float(os.getenv("TLCR_HTTP_READ_TIMEOUT", "15"))
+HTTP_POOL_HOSTS = int(os.getenv("TLCR_HTTP_POOL_HOSTS", "4"))
+HTTP_POOL_SIZE = int(os.getenv("TLCR_HTTP_POOL_SIZE", "10"))
+
+# Метрики очередей доставки (метка channel — имя очереди)
+DELIVERY_LATENCY = Histogram(
+    "tlcr_delivery_latency_seconds",
+    "Время от постановки уведомления в очередь до доставки (с ожиданием лимитов и повторами)",
+    ("channel",), buckets=(0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 900),
+)
+DELIVERY_SEND_SECONDS = Histogram(
+    "tlcr_delivery_send_duration_seconds", "Длительность одной попытки отправки", ("channel",)
+)
+DELIVERIES = Counter(
+    "tlcr_deliveries_total",
+    "Попытки доставки по результату: delivered, retried, deferred (отложено по retry_after), dropped",
+    ("channel", "result"),
+)
+DELIVERY_QUEUE_DEPTH = Gauge("tlcr_delivery_queue_depth", "Уведомлений в очереди доставки", ("channel",))
+
+
+class DeliveryClient:
+    """
+    HTTP-клиент для доставки уведомлений (Telegram, ntfy).
+
+    Держит один requests.Session с пулом keep-alive соединений на каждый хост,
+    поэтому повторные отправки не платят за новое TCP+TLS рукопожатие.
+    Для каждого запроса задаются таймауты подключения и чтения.
+    После fork (режим process пула обработчиков) сессия создаётся заново.
+    """
+
+    def __init__(
+        self,
+        connect_timeout: float = HTTP_CONNECT_TIMEOUT,
+        read_timeout: float = HTTP_READ_TIMEOUT,
+        pool_hosts: int = HTTP_POOL_HOSTS,
+        pool_size: int = HTTP_POOL_SIZE,
+    ):
+        self.timeout = (connect_timeout, read_timeout)
+        self.pool_hosts = pool_hosts
+        self.pool_size = pool_size
+        self._session: requests.Session | None = None
+        self._pid: int | None = None
+        self._lock = threading.Lock()
+
+    @property
+    def session(self) -> requests.Session:
+        if self._session is None or self._pid != os.getpid():
+            with self._lock:
+                if self._session is None or self._pid != os.getpid():
+                    self._session = self._create_session()
+                    self._pid = os.getpid()
+        return self._session
+
+    def _create_session(self) -> requests.Session:
+        session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=self.pool_hosts, pool_maxsize=self.pool_size)
+        session.mount("https://", adapter)
+        session.mount("http://", adapter)
+        return session
+
+    def post(self, url: str, **kwargs) -> requests.Response:
+        """Выполняет POST через общий пул соединений с таймаутами по умолчанию."""
+        kwargs.setdefault("timeout", self.timeout)
+        return self.session.post(url, **kwargs)
+
+    def close(self):
+        with self._lock:
+            if self._session is not None:
+                self._session.close()
+            self._session = None
+
+
+# Общий клиент процесса
+client = DeliveryClient()
+
+
+class RetryAfter(Exception):
+    """
+    Доставку нужно повторить позже.
+    seconds — сколько ждать по просьбе сервиса (retry_after из ответа Telegram 429):
+    такая отсрочка не считается неудачной попыткой;
+    None — ошибка: попытка засчитывается, задержка экспоненциальная.
+    """
+
+    def __init__(self, seconds: float | None = None):
+        super().__init__(f"retry after {seconds} s" if seconds is not None else "retry")
+        self.seconds = seconds
+
+
+class TokenBucket:
+    """
+    Token bucket: rate токенов в секунду, не больше capacity накопленных.
+    Не потокобезопасен — используется под блокировкой DeliveryQueue.
+    """
+
+    def __init__(self, rate: float, capacity: float | None = None):
+        self.rate = rate
+        self.capacity = capacity if capacity is not None else max(1.0, rate)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.blocked_until = 0.0
+
+    def _refill(self, now: float):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self, now: float) -> float:
+        """Сколько секунд ждать до появления токена (0 — токен есть)."""
+        self._refill(now)
+        if now < self.blocked_until:
+            return self.blocked_until - now
+        return 0.0 if self.tokens >= 1 else (1 - self.tokens) / self.rate
+
+    def consume(self, now: float):
+        self._refill(now)
+        self.tokens -= 1
+
+    def block(self, now: float, seconds: float):
+        """Запрещает выдачу токенов на seconds секунд (например, по retry_after)."""
+        self.blocked_until = max(self.blocked_until, now + seconds)
+
+    def idle(self, now: float) -> bool:
+        """Bucket полон и не заблокирован — его можно удалить и создать заново без потери состояния."""
+        self._refill(now)
+        return self.tokens >= self.capacity and now >= self.blocked_until
+
+
+@dataclass(order=True)
+class _QueueItem:
+    not_before: float
+    seq: int
+    send: Callable[[], bool] = field(compare=False)
+    key: object = field(compare=False, default=None)
+    on_success: Callable[[], None] | None = field(compare=False, default=None)
+    attempts: int = field(compare=False, default=0)
+    enqueued: float = field(compare=False, default=0.0)
+
+
+class DeliveryQueue:
+    """
+    Очередь доставки уведомлений с ограничением скорости и повторными попытками.
+
+    Элемент очереди — функция send(), которая возвращает True при успешной доставке,
+    False при окончательной ошибке и бросает RetryAfter (или любое исключение),
+    если доставку нужно повторить. Скорость ограничивается общим token bucket
+    и отдельным bucket для каждого ключа (например, chat_id).
+    Задержка из RetryAfter блокирует и bucket ключа, и общий bucket; такие отсрочки
+    не ограничены max_attempts — попытки считаются только для ошибок (исключения, 5xx).
+    Отложенные сообщения возвращаются в очередь, а не теряются.
+    """
+
+    # Как часто удалять bucket ключей, которые давно не использовались, секунды
+    PRUNE_INTERVAL = 60.0
+
+    def __init__(
+        self,
+        name: str,
+        global_rate: float | None = None,
+        key_bucket: Callable[[object], TokenBucket] | None = None,
+        threads: int = 1,
+        max_attempts: int = 5,
+        backoff: float = 2.0,
+    ):
+        self.name = name
+        self.global_bucket = TokenBucket(global_rate) if global_rate else None
+        self.key_bucket = key_bucket
+        self.threads = max(1, threads)
+        self.max_attempts = max_attempts
+        self.backoff = backoff
+        self.dropped = 0
+        self.delivered = 0
+        self.deferred = 0
+        self._buckets: dict[object, TokenBucket] = {}
+        self._pruned = time.monotonic()
+        self._heap: list[_QueueItem] = []
+        self._seq = itertools.count()
+        self._cond = threading.Condition()
+        self._in_flight = 0
+        self._stopping = False
+        self._workers: list[threading.Thread] = []
+        DELIVERY_QUEUE_DEPTH.set_function(lambda: self.depth, channel=name)
+
+    @property
+    def depth(self) -> int:
+        """Количество сообщений в очереди, включая отправляемые прямо сейчас."""
+        with self._cond:
+            return len(self._heap) + self._in_flight
+
+    def put(self, send: Callable[[], bool], key=None, on_success: Callable[[], None] | None = None):
+        """Ставит доставку в очередь. Потоки отправки запускаются при первом вызове."""
+        with self._cond:
+            if not self._workers:
+                self._start()
+            now = time.monotonic()
+            heapq.heappush(
+                self._heap,
+                _QueueItem(now, next(self._seq), send, key, on_success, enqueued=now),
+            )
+            self._cond.notify()
+
+    def stop(self, timeout: float = 10.0) -> int:
+        """
+        Ждёт опустошения очереди не дольше timeout секунд и останавливает потоки.
+
+        Returns:
+            int: количество недоставленных сообщений.
+        """
+        deadline = time.monotonic() + timeout
+        with self._cond:
+            while self._heap or self._in_flight:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                self._cond.wait(remaining)
+            self._stopping = True
+            left = len(self._heap) + self._in_flight
+            self._heap.clear()
+            self._cond.notify_all()
+        for worker in self._workers:
+            worker.join(timeout=1)
+        self._workers = []
+        self._stopping = False
+        return left
+
+    def _start(self):
+        for n in range(self.threads):
+            worker = threading.Thread(target=self._run, name=f"{self.name}-{n}", daemon=True)
+            worker.start()
+            self._workers.append(worker)
+
+    def _bucket_for(self, key) -> TokenBucket | None:
+        if self.key_bucket is None or key is None:
+            return None
+        now = time.monotonic()
+        if now - self._pruned >= self.PRUNE_INTERVAL:
+            # Чатов может быть много: полные bucket не хранят ничего, кроме capacity
+            self._buckets = {k: b for k, b in self._buckets.items() if not b.idle(now)}
+            self._pruned = now
+        if key not in self._buckets:
+            self._buckets[key] = self.key_bucket(key)
+        return self._buckets[key]
+
+    def _reserve(self, item: _QueueItem, now: float) -> float:
+        """Забирает токены для item; возвращает время ожидания, если токенов нет."""
+        buckets = [b for b in (self.global_bucket, self._bucket_for(item.key)) if b is not None]
+        wait = max((bucket.wait_time(now) for bucket in buckets), default=0.0)
+        if wait <= 0:
+            for bucket in buckets:
+                bucket.consume(now)
+        return wait
+
+    def _next_item(self) -> _QueueItem | None:
+        with self._cond:
+            while True:
+                if self._stopping:
+                    return None
+                if not self._heap:
+                    self._cond.wait()
+                    continue
+                now = time.monotonic()
+                item = self._heap[0]
+                if item.not_before > now:
+                    self._cond.wait(item.not_before - now)
+                    continue
+                heapq.heappop(self._heap)
+                wait = self._reserve(item, now)
+                if wait > 0:
+                    item.not_before = now + wait
+                    heapq.heappush(self._heap, item)
+                    continue
+                self._in_flight += 1
+                return item
+
+    def _run(self):
+        while (item := self._next_item()) is not None:
+            delivered, retry, delay = False, False, None
+            started = time.monotonic()
+            try:
+                delivered = item.send()
+            except RetryAfter as e:
+                retry, delay = True, e.seconds
+            except Exception:
+                retry = True
+            finished = time.monotonic()
+            DELIVERY_SEND_SECONDS.observe(finished - started, channel=self.name)
+
+            if delivered and item.on_success is not None:
+                try:
+                    item.on_success()
+                except Exception:
+                    pass  # ошибка обработчика не должна приводить к повторной отправке
+
+            with self._cond:
+                self._in_flight -= 1
+                if not retry:
+                    if delivered:
+                        self.delivered += 1
+                        DELIVERIES.inc(channel=self.name, result="delivered")
+                        DELIVERY_LATENCY.observe(finished - item.enqueued, channel=self.name)
+                    else:
+                        self.dropped += 1
+                        DELIVERIES.inc(channel=self.name, result="dropped")
+                elif delay is not None:
+                    # retry_after — сервис просит подождать, это не ошибка доставки:
+                    # попытку не засчитываем, иначе напоминание потеряется в час пик.
+                    # Ограничение действует на весь сервис, а не только на чат, поэтому
+                    # останавливаем и общий bucket, чтобы не получить 429 на других ключах
+                    self.deferred += 1
+                    DELIVERIES.inc(channel=self.name, result="deferred")
+                    now = time.monotonic()
+                    for bucket in (self.global_bucket, self._bucket_for(item.key)):
+                        if bucket is not None:
+                            bucket.block(now, delay)
+                    item.not_before = now + delay
+                    heapq.heappush(self._heap, item)
+                elif item.attempts + 1 >= self.max_attempts:
+                    self.dropped += 1
+                    DELIVERIES.inc(channel=self.name, result="dropped")
+                else:
+                    DELIVERIES.inc(channel=self.name, result="retried")
+                    item.not_before = time.monotonic() + self.backoff ** item.attempts
+                    item.attempts += 1
+                    heapq.heappush(self._heap, item)
+                self._cond.notify_all()
@@ -0,0 +1,179 @@
+import json
+import os
+import threading
+from collections import OrderedDict
+from typing import Iterator, NamedTuple
+
+from .utils import get_environment_name, load_env
+
+# Load environment variables
+environment = get_environment_name()
+load_env(environment)
+
+# Сколько разобранных файлов держать в памяти
+MESSAGE_FILE_CACHE_SIZE = int(os.getenv("TLCR_MESSAGE_FILE_CACHE_SIZE", "32"))
+# Файлы от этого размера (байт) разбираются потоково, без чтения целиком в память
+MESSAGE_FILE_STREAM_BYTES = int(os.getenv("TLCR_MESSAGE_FILE_STREAM_BYTES", str(8 * 1024 * 1024)))
+
+_CHUNK_SIZE = 64 * 1024
+_DELIMITERS = frozenset(" \t\r\n,]")
+
+
+class MessageFile(NamedTuple):
+    """
+    Индекс JSON-файла shebang-сообщений. Сами элементы массива не хранятся:
+    для просмотра файла их читает MessageFileCache.iter_rows.
+    """
+    by_date: dict  # 'YYYY-MM-DD' -> text (первая запись с этой датой)
+    count: int  # элементов в массиве
+    valid: bool  # все элементы — словари со строкой 'date' и ключом 'text'
+    mtime_ns: int
+    size: int
+
+
+def iter_json_array(f, chunk_size: int = _CHUNK_SIZE) -> Iterator:
+    """
+    Потоково разбирает JSON-массив из текстового файла, возвращая элементы по одному.
+
+    Raises:
+        ValueError: содержимое не является JSON-массивом.
+        json.JSONDecodeError: ошибка синтаксиса JSON.
+    """
+    decoder = json.JSONDecoder()
+    buffer = ""
+    pos = 0
+    eof = False
+
+    def fill() -> bool:
+        nonlocal buffer, pos, eof
+        chunk = f.read(chunk_size)
+        buffer = buffer[pos:] + chunk
+        pos = 0
+        eof = not chunk
+        return bool(chunk)
+
+    def skip_ws():
+        nonlocal pos
+        while True:
+            while pos < len(buffer) and buffer[pos].isspace():
+                pos += 1
+            if pos < len(buffer) or not fill():
+                return
+
+    skip_ws()
+    if buffer[pos:pos + 1] != "[":
+        raise ValueError("содержимое файла должно быть массивом")
+    pos += 1
+    skip_ws()
+    if buffer[pos:pos + 1] == "]":
+        return
+
+    while True:
+        skip_ws()
+        while True:
+            try:
+                item, end = decoder.raw_decode(buffer, pos)
+                # Значение может быть обрезано на границе блока (например, число 1.5|e3) —
+                # принимаем его, только если за ним видно разделитель
+                if eof or (end < len(buffer) and buffer[end] in _DELIMITERS):
+                    break
+            except json.JSONDecodeError:
+                if eof:
+                    raise
+            fill()
+        pos = end
+        yield item
+
+        skip_ws()
+        sep = buffer[pos:pos + 1]
+        pos += 1
+        if sep == "]":
+            return
+        if sep != ",":
+            raise json.JSONDecodeError("Ожидалась ',' или ']'", buffer, pos - 1)
+
+
+class MessageFileCache:
+    """
+    LRU-кэш разобранных JSON-файлов shebang-сообщений.
+
+    Файл разбирается один раз в индекс дата -> текст и хранится, пока не изменятся
+    его mtime или размер. Большие файлы разбираются потоково (iter_json_array):
+    в памяти одновременно находятся только индекс и очередной элемент.
+    """
+
+    def __init__(self, maxsize: int = MESSAGE_FILE_CACHE_SIZE, stream_bytes: int = MESSAGE_FILE_STREAM_BYTES):
+        self.maxsize = maxsize
+        self.stream_bytes = stream_bytes
+        self._files: OrderedDict[str, MessageFile] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def load(self, path: str) -> MessageFile:
+        """
+        Возвращает разобранный файл, перечитывая его только после изменения.
+
+        Raises:
+            OSError: файл недоступен.
+            ValueError: файл не является JSON-массивом (включая json.JSONDecodeError).
+        """
+        stat = os.stat(path)
+        key = os.path.abspath(path)
+        with self._lock:
+            cached = self._files.get(key)
+            if cached and cached.mtime_ns == stat.st_mtime_ns and cached.size == stat.st_size:
+                self._files.move_to_end(key)
+                return cached
+
+        parsed = self._parse(path, stat)
+        with self._lock:
+            self._files[key] = parsed
+            self._files.move_to_end(key)
+            while len(self._files) > self.maxsize:
+                self._files.popitem(last=False)
+        return parsed
+
+    def text_for_date(self, path: str, date: str) -> str | None:
+        """Возвращает текст для даты 'YYYY-MM-DD' или None, если записи нет."""
+        return self.load(path).by_date.get(date)
+
+    def iter_rows(self, path: str) -> Iterator:
+        """
+        Элементы массива в исходном порядке, по одному (для просмотра файла).
+        Большие файлы читаются потоково; в кэше элементы не сохраняются.
+
+        Raises:
+            OSError: файл недоступен.
+            ValueError: файл не является JSON-массивом (включая json.JSONDecodeError).
+        """
+        with open(path, "r", encoding="utf-8") as f:
+            yield from self._iter_file(f, os.fstat(f.fileno()).st_size)
+
+    def clear(self):
+        with self._lock:
+            self._files.clear()
+
+    def _iter_file(self, f, size: int) -> Iterator:
+        if size >= self.stream_bytes:
+            yield from iter_json_array(f)
+            return
+        rows = json.load(f)
+        if not isinstance(rows, list):
+            raise ValueError("содержимое файла должно быть массивом")
+        yield from rows
+
+    def _parse(self, path: str, stat: os.stat_result) -> MessageFile:
+        by_date = {}
+        count = 0
+        valid = True
+        with open(path, "r", encoding="utf-8") as f:
+            for item in self._iter_file(f, stat.st_size):
+                count += 1
+                if not isinstance(item, dict) or not isinstance(item.get("date"), str) or "text" not in item:
+                    valid = False
+                    continue
+                by_date.setdefault(item["date"], item["text"])
+        return MessageFile(by_date, count, valid, stat.st_mtime_ns, stat.st_size)
+
+
+# Общий кэш процесса
+message_files = MessageFileCache()
@@ -0,0 +1,447 @@
+import bisect
+import json
+import math
+import os
+import threading
+import time
+from contextlib import contextmanager
+from functools import wraps
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from typing import Callable
+
+# MIME-тип текстового формата Prometheus
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+# Границы корзин гистограмм по умолчанию, секунды
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+def _format_value(value: float) -> str:
+    if value == math.inf:
+        return "+Inf"
+    if value == -math.inf:
+        return "-Inf"
+    if isinstance(value, int) or float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names: tuple, values: tuple, extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+class Registry:
+    """Набор метрик процесса; render() отдаёт их в текстовом формате Prometheus."""
+
+    def __init__(self):
+        self._metrics: dict[str, "_Metric"] = {}
+        self._lock = threading.Lock()
+
+    def register(self, metric: "_Metric") -> "_Metric":
+        """Регистрирует метрику; метрика с тем же именем (повторный импорт модуля) заменяется."""
+        with self._lock:
+            self._metrics[metric.name] = metric
+        return metric
+
+    def get(self, name: str) -> "_Metric | None":
+        with self._lock:
+            return self._metrics.get(name)
+
+    def render(self) -> str:
+        with self._lock:
+            metrics = list(self._metrics.values())
+        return _render(metrics)
+
+    def dump(self) -> dict:
+        """Значения всех метрик в JSON-совместимом виде (для объединения процессов, см. ProcessMetricsDir)."""
+        with self._lock:
+            metrics = list(self._metrics.values())
+        return {metric.name: metric.dump() for metric in metrics}
+
+
+def _render(metrics) -> str:
+    lines = []
+    for metric in metrics:
+        lines.append(f"# HELP {metric.name} {metric.documentation}")
+        lines.append(f"# TYPE {metric.name} {metric.type}")
+        lines.extend(metric.samples())
+    return "\n".join(lines) + "\n"
+
+
+# Общий реестр процесса
+REGISTRY = Registry()
+
+
+class _Metric:
+    type = "untyped"
+
+    def __init__(self, name: str, documentation: str, labelnames: tuple = (), registry: Registry | None = REGISTRY):
+        self.name = name
+        self.documentation = documentation.replace("\\", "\\\\").replace("\n", "\\n")
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+        if registry is not None:
+            registry.register(self)
+
+    def _key(self, labels: dict) -> tuple:
+        if set(labels) != set(self.labelnames):
+            raise ValueError(f"метрика {self.name}: ожидаются метки {self.labelnames}, переданы {tuple(labels)}")
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def samples(self) -> list[str]:
+        raise NotImplementedError
+
+    def dump(self) -> dict:
+        return {"type": self.type, "documentation": self.documentation, "labelnames": list(self.labelnames)}
+
+    def merge(self, data: dict, source: str):
+        """Добавляет значения из dump() другого процесса source."""
+        raise NotImplementedError
+
+
+class Counter(_Metric):
+    """Монотонно растущий счётчик."""
+    type = "counter"
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._values: dict[tuple, float] = {}
+
+    def inc(self, amount: float = 1, **labels):
+        if amount < 0:
+            raise ValueError("счётчик не может уменьшаться")
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels) -> float:
+        with self._lock:
+            return self._values.get(self._key(labels), 0)
+
+    def samples(self) -> list[str]:
+        with self._lock:
+            values = sorted(self._values.items())
+        return [f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}" for key, value in values]
+
+    def dump(self) -> dict:
+        with self._lock:
+            values = [[list(key), value] for key, value in self._values.items()]
+        return {**super().dump(), "values": values}
+
+    def merge(self, data: dict, source: str):
+        with self._lock:
+            for key, value in data["values"]:
+                key = tuple(key)
+                self._values[key] = self._values.get(key, 0) + value
+
+
+class Gauge(_Metric):
+    """
+    Значение, которое может расти и уменьшаться.
+    set_function() задаёт функцию, вычисляющую значение при каждом чтении метрик
+    (например, глубину очереди), — тогда в горячем пути ничего обновлять не нужно.
+    """
+    type = "gauge"
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._values: dict[tuple, float] = {}
+        self._functions: dict[tuple, Callable[[], float]] = {}
+
+    def set(self, value: float, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def dec(self, amount: float = 1, **labels):
+        self.inc(-amount, **labels)
+
+    def set_function(self, function: Callable[[], float], **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._functions[key] = function
+
+    def value(self, **labels) -> float:
+        key = self._key(labels)
+        with self._lock:
+            function = self._functions.get(key)
+            if function is None:
+                return self._values.get(key, 0)
+        return function()
+
+    def samples(self) -> list[str]:
+        return [
+            f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}"
+            for key, value in sorted(self._current().items())
+        ]
+
+    def dump(self) -> dict:
+        return {**super().dump(), "values": [[list(key), value] for key, value in self._current().items()]}
+
+    def merge(self, data: dict, source: str):
+        # Значения gauge разных процессов не складываются: у каждого процесса свой ряд с меткой pid
+        with self._lock:
+            for key, value in data["values"]:
+                self._values[(*key, source)] = value
+
+    def _current(self) -> dict:
+        with self._lock:
+            values = dict(self._values)
+            functions = dict(self._functions)
+        for key, function in functions.items():
+            try:
+                values[key] = function()
+            except Exception:
+                values.pop(key, None)  # значение недоступно — метрику пропускаем
+        return values
+
+
+class Histogram(_Metric):
+    """Распределение значений (обычно длительностей в секундах) по корзинам buckets."""
+    type = "histogram"
+
+    def __init__(self, *args, buckets: tuple = DEFAULT_BUCKETS, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.buckets = tuple(sorted(float(bound) for bound in buckets if bound != math.inf))
+        # метки -> [счётчики по корзинам (последняя — +Inf), сумма]
+        self._values: dict[tuple, list] = {}
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                state = self._values[key] = [[0] * (len(self.buckets) + 1), 0.0]
+            state[0][index] += 1
+            state[1] += value
+
+    @contextmanager
+    def time(self, **labels):
+        """Измеряет длительность блока with."""
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started, **labels)
+
+    def count(self, **labels) -> int:
+        with self._lock:
+            state = self._values.get(self._key(labels))
+            return sum(state[0]) if state else 0
+
+    def samples(self) -> list[str]:
+        with self._lock:
+            values = sorted((key, list(counts), total) for key, (counts, total) in self._values.items())
+        lines = []
+        for key, counts, total in values:
+            cumulative = 0
+            for bound, count in zip((*self.buckets, math.inf), counts):
+                cumulative += count
+                le = _format_labels(self.labelnames, key, f'le="{_format_value(bound)}"')
+                lines.append(f"{self.name}_bucket{le} {cumulative}")
+            labels = _format_labels(self.labelnames, key)
+            lines.append(f"{self.name}_sum{labels} {_format_value(total)}")
+            lines.append(f"{self.name}_count{labels} {cumulative}")
+        return lines
+
+    def dump(self) -> dict:
+        with self._lock:
+            values = [[list(key), list(counts), total] for key, (counts, total) in self._values.items()]
+        return {**super().dump(), "buckets": list(self.buckets), "values": values}
+
+    def merge(self, data: dict, source: str):
+        if tuple(data["buckets"]) != self.buckets:
+            return  # процесс со старыми границами корзин (например, во время обновления) пропускаем
+        with self._lock:
+            for key, counts, total in data["values"]:
+                state = self._values.setdefault(tuple(key), [[0] * (len(self.buckets) + 1), 0.0])
+                state[0] = [a + b for a, b in zip(state[0], counts)]
+                state[1] += total
+
+
+def timed(histogram: Histogram, **labels):
+    """Декоратор: записывает длительность каждого вызова функции в histogram."""
+    def decorator(func):
+        @wraps(func)
+        def wrapped(*args, **kwargs):
+            started = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                histogram.observe(time.perf_counter() - started, **labels)
+        return wrapped
+    return decorator
+
+
+def write_textfile(path: str | Path, registry: Registry = REGISTRY):
+    """
+    Атомарно записывает метрики в файл (для textfile collector node_exporter):
+    читатель никогда не увидит наполовину записанный файл.
+    """
+    path = Path(path)
+    partial = path.with_name(f"{path.name}.{os.getpid()}.tmp")
+    partial.write_text(registry.render(), encoding="utf-8")
+    os.replace(partial, path)
+
+
+def merge_dumps(dumps: dict[str, dict]) -> list[_Metric]:
+    """
+    Объединяет результаты Registry.dump() нескольких процессов ({pid: dump}):
+    счётчики и гистограммы суммируются, значения gauge получают дополнительную метку pid.
+    """
+    merged: dict[str, _Metric] = {}
+    for source, dump in sorted(dumps.items()):
+        for name, data in dump.items():
+            metric = merged.get(name)
+            if metric is None:
+                kind = {"counter": Counter, "gauge": Gauge, "histogram": Histogram}.get(data.get("type"))
+                if kind is None:
+                    continue
+                labelnames = tuple(data["labelnames"]) + (("pid",) if kind is Gauge else ())
+                options = {"buckets": data["buckets"]} if kind is Histogram else {}
+                metric = merged[name] = kind(name, "", labelnames, registry=None, **options)
+                metric.documentation = data["documentation"]
+            elif metric.type != data.get("type"):
+                continue
+            metric.merge(data, source)
+    return list(merged.values())
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    registry: Registry = REGISTRY
+
+    def do_GET(self):
+        if self.path.split("?", 1)[0] not in ("/", "/metrics"):
+            self.send_error(404)
+            return
+        body = self.registry.render().encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", CONTENT_TYPE)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass  # запросы сборщика метрик не пишем в stderr
+
+
+class MetricsServer:
+    """HTTP-сервер метрик в фоновом потоке: GET /metrics отдаёт registry в формате Prometheus."""
+
+    def __init__(self, port: int, host: str = "127.0.0.1", registry: Registry = REGISTRY):
+        handler = type("MetricsHandler", (_MetricsHandler,), {"registry": registry})
+        self._server = ThreadingHTTPServer((host, port), handler)
+        self._server.daemon_threads = True
+        self._thread: threading.Thread | None = None
+
+    @property
+    def address(self) -> tuple[str, int]:
+        return self._server.server_address[:2]
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._server.serve_forever, name="metrics-http", daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        if self._thread is not None:
+            self._server.shutdown()
+            self._thread.join(timeout=1)
+            self._thread = None
+        self._server.server_close()
+
+
+class TextfileWriter:
+    """Фоновая запись метрик в файл раз в interval секунд (и при остановке)."""
+
+    def __init__(self, path: str | Path, interval: float = 15.0, registry: Registry = REGISTRY,
+                 on_error: Callable[[Exception], None] | None = None):
+        self.path = Path(path)
+        self.interval = max(1.0, interval)
+        self.registry = registry
+        self.on_error = on_error
+        self._stop = threading.Event()
+        self._thread: threading.Thread | None = None
+
+    def write(self):
+        try:
+            write_textfile(self.path, self.registry)
+        except OSError as e:
+            if self.on_error is not None:
+                self.on_error(e)
+
+    def start(self):
+        if self._thread is None:
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, name="metrics-textfile", daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        if self._thread is not None:
+            self._stop.set()
+            self._thread.join(timeout=1)
+            self._thread = None
+        self.write()
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            self.write()
+
+
+class ProcessMetricsDir(TextfileWriter):
+    """
+    Метрики нескольких процессов одного сервиса (воркеров gunicorn) в общем каталоге.
+
+    Каждый процесс раз в interval секунд (и при остановке) записывает Registry.dump() в
+    <каталог>/<prefix>_<pid>.json; render() перед чтением записывает и своё состояние и объединяет
+    файлы всех процессов (merge_dumps). Файлы завершившихся процессов остаются, поэтому счётчики
+    сервиса не уменьшаются при перезапуске воркера; каталог очищается при запуске сервиса
+    (clear_process_metrics, в gunicorn.conf.py — хук on_starting).
+    """
+
+    def __init__(self, directory: str | Path, prefix: str = "web", interval: float = 1.0,
+                 registry: Registry = REGISTRY, on_error: Callable[[Exception], None] | None = None):
+        super().__init__(directory, interval, registry, on_error)
+        self.prefix = prefix
+
+    def write(self):
+        # pid берётся при каждой записи: объект мог быть создан до fork воркера
+        target = self.path / f"{self.prefix}_{os.getpid()}.json"
+        try:
+            self.path.mkdir(parents=True, exist_ok=True)
+            partial = target.with_name(f"{target.name}.tmp")
+            partial.write_text(json.dumps(self.registry.dump()), encoding="utf-8")
+            os.replace(partial, target)
+        except OSError as e:
+            if self.on_error is not None:
+                self.on_error(e)
+
+    def render(self) -> str:
+        self.write()
+        dumps = {}
+        for path in self.path.glob(f"{self.prefix}_*.json"):
+            try:
+                dumps[path.stem.rsplit("_", 1)[-1]] = json.loads(path.read_text(encoding="utf-8"))
+            except (OSError, ValueError):
+                continue  # файл удалён при очистке каталога
+        return _render(merge_dumps(dumps))
+
+
+def clear_process_metrics(directory: str | Path, prefix: str = "web"):
+    """Удаляет файлы ProcessMetricsDir, оставшиеся от прошлого запуска сервиса."""
+    for path in Path(directory).glob(f"{prefix}_*.json*"):
+        path.unlink(missing_ok=True)
@@ -0,0 +1,151 @@
+import cProfile
+import os
+import pstats
+import re
+import sys
+import threading
+from datetime import datetime
+from pathlib import Path
+
+from .utils import get_environment_name, load_env
+
+# Load environment variables
+environment = get_environment_name()
+load_env(environment)
+
+# Каталог для .prof-файлов (по умолчанию — каталог логов)
+PROFILE_PATH = os.getenv("TLCR_PROFILE_PATH", "").strip() or os.getenv("TLCR_LOGPATH", ".")
+# Сколько последних профилей каждого вида хранить
+PROFILE_KEEP = max(1, int(os.getenv("TLCR_PROFILE_KEEP", "50")))
+# Сколько строк (функций) выводить в текстовую сводку рядом с .prof
+PROFILE_SUMMARY_LINES = int(os.getenv("TLCR_PROFILE_SUMMARY_LINES", "40"))
+
+# С Python 3.12 cProfile работает через sys.monitoring: в процессе может быть включён только
+# один профилировщик (второй enable() бросает ValueError), зато он видит все потоки.
+# До 3.12 профилировщик видит только свой поток, и их можно включать параллельно.
+_EXCLUSIVE = sys.version_info >= (3, 12)
+_exclusive_lock = threading.Lock()
+
+
+class _Stats:
+    """Статистика cProfile, полученная из другого потока или процесса, в виде, который принимает pstats.Stats."""
+
+    def __init__(self, stats: dict):
+        self.stats = stats
+
+    def create_stats(self):
+        pass
+
+
+def start_profiler() -> cProfile.Profile | None:
+    """
+    Включает cProfile в текущем потоке. Если в процессе уже работает профилировщик, который
+    не допускает второго (Python 3.12+, отладчик, coverage), ничего не делает и возвращает None:
+    профилирование — диагностика и не должно приводить к ошибкам.
+    """
+    if _EXCLUSIVE and not _exclusive_lock.acquire(blocking=False):
+        return None
+    profiler = cProfile.Profile()
+    try:
+        profiler.enable()
+    except ValueError:
+        if _EXCLUSIVE:
+            _exclusive_lock.release()
+        return None
+    return profiler
+
+
+def stop_profiler(profiler: cProfile.Profile):
+    """Выключает профилировщик, включённый start_profiler."""
+    profiler.disable()
+    if _EXCLUSIVE:
+        _exclusive_lock.release()
+
+
+def profile_call(func, *args, **kwargs) -> tuple:
+    """
+    Выполняет func под cProfile (без профилировщика, если его нельзя включить, см. start_profiler).
+
+    Returns:
+        tuple: (результат func, словарь статистики cProfile или None). Словарь сериализуется pickle,
+        поэтому его можно вернуть из процесса ProcessPoolExecutor и передать в save_profile.
+    """
+    profiler = start_profiler()
+    if profiler is None:
+        return func(*args, **kwargs), None
+    try:
+        result = func(*args, **kwargs)
+    finally:
+        stop_profiler(profiler)
+    profiler.create_stats()
+    return result, profiler.stats
+
+
+def _slug(text: str) -> str:
+    return re.sub(r"[^0-9A-Za-z_.-]+", "_", text).strip("_")[:60] or "root"
+
+
+def save_profile(kind: str, label: str, profiles: list, directory: str | Path = PROFILE_PATH) -> Path | None:
+    """
+    Объединяет профили (cProfile.Profile или словари из profile_call) и записывает
+    <kind>_<время>_<label>.prof и текстовую сводку .txt (по cumulative time).
+    Старые профили того же вида сверх TLCR_PROFILE_KEEP удаляются.
+
+    .prof открывается через `python -m pstats`, snakeviz или конвертируется во flamegraph (flameprof).
+
+    Returns:
+        Path | None: путь к .prof или None, если профилей нет.
+    """
+    sources = [profile if isinstance(profile, cProfile.Profile) else _Stats(profile) for profile in profiles if profile]
+    if not sources:
+        return None
+    directory = Path(directory)
+    directory.mkdir(parents=True, exist_ok=True)
+    name = f"{kind}_{datetime.now().strftime('%Y%m%d_%H%M%S_%f')}_{_slug(label)}"
+    path = directory / f"{name}.prof"
+
+    stats = pstats.Stats(*sources)
+    stats.dump_stats(path)
+    with open(directory / f"{name}.txt", "w", encoding="utf-8") as f:
+        pstats.Stats(str(path), stream=f).sort_stats(pstats.SortKey.CUMULATIVE).print_stats(PROFILE_SUMMARY_LINES)
+
+    for old in sorted(directory.glob(f"{kind}_*.prof"), reverse=True)[PROFILE_KEEP:]:
+        old.unlink(missing_ok=True)
+        old.with_suffix(".txt").unlink(missing_ok=True)
+    return path
+
+
+class TickProfiler:
+    """
+    Профилирование следующих N тиков демона по запросу (например, по сигналу SIGUSR1).
+
+    request() только увеличивает счётчик и безопасен для вызова из обработчика сигнала.
+    Пока счётчик нулевой (или профилировщик нельзя включить, см. start_profiler),
+    begin() возвращает None и тик выполняется без профилировщика.
+    """
+
+    def __init__(self, kind: str = "rund_tick", directory: str | Path = PROFILE_PATH):
+        self.kind = kind
+        self.directory = directory
+        self.remaining = 0
+        self._lock = threading.Lock()
+
+    @property
+    def active(self) -> bool:
+        return self.remaining > 0
+
+    def request(self, ticks: int):
+        self.remaining = max(self.remaining, ticks)
+
+    def begin(self) -> cProfile.Profile | None:
+        """Включает профилировщик в текущем потоке, если запрошено профилирование."""
+        if not self.remaining:
+            return None
+        return start_profiler()
+
+    def end(self, profiler: cProfile.Profile, label: str, extra: list | tuple = ()) -> Path | None:
+        """Останавливает профилировщик и сохраняет его вместе с профилями обработчиков extra."""
+        stop_profiler(profiler)
+        with self._lock:
+            self.remaining = max(0, self.remaining - 1)
+        return save_profile(self.kind, label, [profiler, *extra], self.directory)
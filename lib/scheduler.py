@@ -0,0 +1,147 @@
+import heapq
+import itertools
+from datetime import datetime
+
+from .cron_utils import VCron
+
+
+class FireScheduler:
+    """
+    Очередь ближайших срабатываний расписаний на основе min-heap.
+
+    Время следующего срабатывания каждого расписания вычисляется один раз
+    (через VCron.get_next_match) и пересчитывается только после срабатывания
+    или изменения cron/modifier. Устаревшие элементы кучи удаляются лениво.
+    Шаг срабатываний (час или минута) задаёт VCron.exact_minutes.
+    """
+
+    def __init__(self, vcron: VCron):
+        self.vcron = vcron
+        self._heap: list[tuple[datetime, int, int]] = []
+        self._seq = itertools.count()
+        # id расписания -> (время срабатывания, порядковый номер элемента кучи, расписание)
+        self._entries: dict[int, tuple[datetime, int, dict]] = {}
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def load(self, schedules: list[dict], now: datetime) -> list[tuple[dict, datetime | None]]:
+        """
+        Синхронизирует очередь с актуальным списком расписаний.
+        Расписания, которых нет в schedules, удаляются из очереди.
+
+        Для расписаний с неизменными cron/modifier время срабатывания не пересчитывается,
+        для расписаний с изменённым правилом — всегда вычисляется заново.
+        Для новых используется сохранённый в БД next_fire (unix timestamp), если он
+        не раньше начала текущего часа (минуты в режиме exact_minutes); иначе время вычисляется заново.
+
+        Returns:
+            list[tuple[dict, datetime | None]]: расписания с заново вычисленными временами
+            срабатывания, которые стоит сохранить в БД.
+        """
+        previous, self._entries = self._entries, {}
+        computed = self._place(schedules, now, previous)
+        # Куча может накопить много устаревших элементов — пересобираем её при необходимости
+        if len(self._heap) > 2 * len(self._entries) + 64:
+            self._heap = [(fire_at, seq, schedule_id) for schedule_id, (fire_at, seq, _) in self._entries.items()]
+            heapq.heapify(self._heap)
+        return computed
+
+    def merge(self, schedules: list[dict], now: datetime) -> list[tuple[dict, datetime | None]]:
+        """
+        Добавляет или обновляет расписания, не трогая остальные элементы очереди.
+        Правила выбора времени срабатывания — как в load().
+        """
+        return self._place(schedules, now, self._entries)
+
+    def retain(self, schedule_ids: set[int]) -> int:
+        """Удаляет из очереди расписания, id которых нет в schedule_ids; возвращает их количество."""
+        removed = [schedule_id for schedule_id in self._entries if schedule_id not in schedule_ids]
+        for schedule_id in removed:
+            del self._entries[schedule_id]
+        return len(removed)
+
+    def _place(self, schedules: list[dict], now: datetime, previous: dict) -> list[tuple[dict, datetime | None]]:
+        computed = []
+        period_start = self.vcron.period_start(now).timestamp()
+        for schedule in schedules:
+            current = previous.get(schedule["id"])
+            if current and self._same_rule(current[2], schedule):
+                fire_at, seq, _ = current
+                self._entries[schedule["id"]] = (fire_at, seq, schedule)
+                continue
+            # Правило изменилось — сохранённому next_fire не доверяем: он мог быть
+            # вычислен по старому cron/modifier
+            stored = schedule.get("next_fire") if current is None else None
+            if stored is not None and stored >= period_start:
+                fire_at = datetime.fromtimestamp(stored, self.vcron.timezone)
+            else:
+                fire_at = self._next_fire(schedule, now)
+                computed.append((schedule, fire_at))
+            if fire_at is None:
+                self._entries.pop(schedule["id"], None)
+                continue
+            seq = next(self._seq)
+            self._entries[schedule["id"]] = (fire_at, seq, schedule)
+            heapq.heappush(self._heap, (fire_at, seq, schedule["id"]))
+        return computed
+
+    def next_fire_time(self) -> datetime | None:
+        """Возвращает время ближайшего срабатывания или None, если очередь пуста."""
+        self._drop_stale()
+        return self._heap[0][0] if self._heap else None
+
+    def pop_due(self, now: datetime) -> list[dict]:
+        """Извлекает из очереди все расписания, время срабатывания которых наступило."""
+        return [schedule for _, schedules in self.pop_due_by_time(now) for schedule in schedules]
+
+    def pop_due_by_time(self, now: datetime) -> list[tuple[datetime, list[dict]]]:
+        """
+        Извлекает из очереди все расписания, время срабатывания которых наступило,
+        сгруппированные по времени срабатывания (по возрастанию).
+        """
+        groups = []
+        while True:
+            self._drop_stale()
+            if not self._heap or self._heap[0][0] > now:
+                return groups
+            fire_at, _, schedule_id = heapq.heappop(self._heap)
+            schedule = self._entries.pop(schedule_id)[2]
+            if groups and groups[-1][0] == fire_at:
+                groups[-1][1].append(schedule)
+            else:
+                groups.append((fire_at, [schedule]))
+
+    def reschedule(self, schedule: dict, fired_at: datetime) -> datetime | None:
+        """
+        Возвращает расписание в очередь со временем следующего срабатывания,
+        начиная со следующего после fired_at часа (минуты в режиме exact_minutes),
+        поэтому повторно в том же часе (минуте) расписание не срабатывает.
+        Возвращает это время (None — срабатываний больше не найдено).
+        """
+        after = self.vcron.timezone.normalize(self.vcron.period_start(fired_at) + self.vcron.step)
+        fire_at = self._next_fire(schedule, after)
+        if fire_at is None:
+            return None
+        seq = next(self._seq)
+        self._entries[schedule["id"]] = (fire_at, seq, schedule)
+        heapq.heappush(self._heap, (fire_at, seq, schedule["id"]))
+        return fire_at
+
+    def _next_fire(self, schedule: dict, after: datetime) -> datetime | None:
+        try:
+            return self.vcron.get_next_match(schedule["cron"], schedule.get("modifier"), start_time=after)
+        except (ValueError, KeyError):
+            return None
+
+    def _drop_stale(self):
+        while self._heap:
+            _, seq, schedule_id = self._heap[0]
+            entry = self._entries.get(schedule_id)
+            if entry is not None and entry[1] == seq:
+                return
+            heapq.heappop(self._heap)
+
+    @staticmethod
+    def _same_rule(old: dict, new: dict) -> bool:
+        return old["cron"] == new["cron"] and old.get("modifier") == new.get("modifier")
@@ -7,15 +7,24 @@ import time
 import requests
 import pytz
 from datetime import datetime
-import multiprocessing
 import json
+import select
 import signal
-import sys
-
-from lib.cron_utils import VCron
+import socket
+import threading
+from functools import partial
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, wait
+
+from lib.cron_utils import MATCH_MANY_MIN_ROWS, VCron
+from lib.message_files import message_files
+from lib.delivery import DeliveryQueue, RetryAfter, TokenBucket, client as http_client
+from lib.scheduler import FireScheduler
+from lib.backup_replication import BackupReplicator, ReplicationJob
+from lib.metrics import Counter, Gauge, Histogram, MetricsServer, TextfileWriter
+from lib.profiling import TickProfiler, profile_call
 from lib.db_utils import (
-    update_last_fired, get_chats, get_schedules as db_get_schedules,
-    get_ntfy_channel, backup_database,
+    LastFiredWriter, get_tick_snapshot, get_revisions, get_schedule_ids,
+    migrate_add_next_fire, migrate_add_revisions, REV_SCHEDULES, REV_CHANNELS, backup_database, close_connections,
     DB_PATH, LOGPATH, LOGLEVEL
 )
 from lib.utils import get_environment_name, init_log, load_env
@@ -32,6 +41,30 @@ CHECK_MINUTES = int(os.getenv("TLCR_CHECK_MINUTES", "60"))
 BACKUP_HOURS = int(os.getenv("TLCR_BACKUP_INTERVAL", "24"))
 BACKUP_DIR = os.getenv("TLCR_BACKUP_PATH", "static/db.bak")
 
+# Настройки пула обработчиков расписаний
+WORKER_MODE = os.getenv("TLCR_WORKER_MODE", "thread").strip().lower()  # thread | process
+WORKERS = max(1, int(os.getenv("TLCR_WORKERS", "4")))
+WORKER_BATCH = max(1, int(os.getenv("TLCR_WORKER_BATCH", "100")))
+WORKER_TIMEOUT = int(os.getenv("TLCR_WORKER_TIMEOUT", "60"))
+# С какого размера пачки расписания проверяются через numpy (VCron.match_many)
+MATCH_MANY_ROWS = int(os.getenv("TLCR_MATCH_MANY_MIN_ROWS", str(MATCH_MANY_MIN_ROWS)))
+# Учитывать минуты cron (иначе расписание срабатывает один раз в подходящий час)
+EXACT_MINUTES = os.getenv("TLCR_EXACT_MINUTES", "false").strip().lower() in ("1", "true", "yes")
+# На сколько секунд после окончания своего часа (минуты) срабатывание может опоздать, прежде чем будет пропущено
+FIRE_GRACE = float(os.getenv("TLCR_FIRE_GRACE", "300"))
+
+# Ограничения скорости отправки в Telegram
+TELEGRAM_RATE = float(os.getenv("TLCR_TELEGRAM_RATE", "30"))  # сообщений в секунду всего
+TELEGRAM_CHAT_RATE = float(os.getenv("TLCR_TELEGRAM_CHAT_RATE", "1"))  # в секунду в личный чат
+TELEGRAM_GROUP_RATE = float(os.getenv("TLCR_TELEGRAM_GROUP_RATE", "20"))  # в минуту в группу
+DELIVERY_THREADS = max(1, int(os.getenv("TLCR_DELIVERY_THREADS", "4")))
+DELIVERY_MAX_ATTEMPTS = max(1, int(os.getenv("TLCR_DELIVERY_MAX_ATTEMPTS", "5")))
+DELIVERY_DRAIN_SECONDS = float(os.getenv("TLCR_DELIVERY_DRAIN_SECONDS", "10"))
+
+# Пакетная запись last_fired
+LAST_FIRED_BATCH = int(os.getenv("TLCR_LAST_FIRED_BATCH", "100"))
+LAST_FIRED_FLUSH_SECONDS = float(os.getenv("TLCR_LAST_FIRED_FLUSH_SECONDS", "5"))
+
 # Настройки scp-репликации бэкапов
 BACKUP_SCP_ODD = os.getenv("TLCR_BACKUP_SCP_ODD", "").strip()
 BACKUP_SCP_EVEN = os.getenv("TLCR_BACKUP_SCP_EVEN", "").strip()
@@ -40,82 +73,198 @@ BACKUP_SSH_PORT_ODD = int(os.getenv("TLCR_BACKUP_SSH_PORT_ODD", "22"))
 BACKUP_SSH_PORT_EVEN = int(os.getenv("TLCR_BACKUP_SSH_PORT_EVEN", "22"))
 BACKUP_SCP_ERROR_NTFY_URL = os.getenv("TLCR_ERROR_NTFY_URL", "https://ntfy.sh/HELOR_tg_cron_notify_1956GH7y")
 
+# Метрики: HTTP-эндпоинт (порт 0 — выключен) и/или файл для textfile collector node_exporter
+METRICS_PORT = int(os.getenv("TLCR_METRICS_PORT", "0"))
+METRICS_HOST = os.getenv("TLCR_METRICS_HOST", "127.0.0.1")
+METRICS_TEXTFILE = os.getenv("TLCR_METRICS_TEXTFILE", "").strip()
+METRICS_TEXTFILE_SECONDS = float(os.getenv("TLCR_METRICS_TEXTFILE_SECONDS", "15"))
+
+# Сколько тиков профилировать после сигнала SIGUSR1 (профили пишутся в TLCR_PROFILE_PATH)
+PROFILE_TICKS = max(1, int(os.getenv("TLCR_PROFILE_TICKS", "5")))
+
 # Initialize logger
 log = init_log('rmndr', LOGPATH, LOGLEVEL)
 
 # Initialize VCron
-myVCron = VCron(TIMEZONE)
+myVCron = VCron(TIMEZONE, EXACT_MINUTES)
+
+# Метрики демона (lib.metrics)
+TICK_SECONDS = Histogram(
+    "tlcr_tick_duration_seconds", "Длительность тика: проверка сработавших расписаний и постановка в очереди доставки",
+    buckets=(0.001, 0.005, 0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60),
+)
+LAST_TICK = Gauge("tlcr_last_tick_timestamp_seconds", "Время последнего тика")
+SCHEDULES_EVALUATED = Counter("tlcr_schedules_evaluated_total", "Проверено расписаний")
+SCHEDULES_FIRED = Counter("tlcr_schedules_fired_total", "Сработавших расписаний, поставленных в очередь доставки")
+SCHEDULER_QUEUE = Gauge("tlcr_scheduler_queue_size", "Расписаний в очереди ближайших срабатываний")
+WORKER_POOL_SIZE = Gauge("tlcr_worker_pool_size", "Размер пула обработчиков расписаний")
+WORKER_POOL_PENDING = Gauge("tlcr_worker_pool_pending_batches", "Пачек расписаний в работе и в очереди пула")
+WORKER_POOL_TIMEOUTS = Counter(
+    "tlcr_worker_pool_timeouts_total", "Пачек расписаний, не обработанных за TLCR_WORKER_TIMEOUT"
+)
+DELIVERY_HTTP_ERRORS = Counter(
+    "tlcr_delivery_http_errors_total",
+    "Ошибочные ответы Telegram и ntfy по коду ответа (network — ошибка сети)", ("channel", "status"),
+)
+
+def _telegram_chat_bucket(chat_id: int) -> TokenBucket:
+    """Лимит на чат: группы (отрицательный chat_id) — в минуту, личные чаты — в секунду."""
+    if int(chat_id) < 0:
+        return TokenBucket(TELEGRAM_GROUP_RATE / 60, capacity=1)
+    return TokenBucket(TELEGRAM_CHAT_RATE, capacity=1)
+
+
+# Очереди доставки (работают в основном процессе демона)
+telegram_queue = DeliveryQueue(
+    "telegram", global_rate=TELEGRAM_RATE, key_bucket=_telegram_chat_bucket,
+    threads=DELIVERY_THREADS, max_attempts=DELIVERY_MAX_ATTEMPTS,
+)
+ntfy_queue = DeliveryQueue("ntfy", threads=DELIVERY_THREADS, max_attempts=DELIVERY_MAX_ATTEMPTS)
+# Срабатывания записываются в БД пачками, а не по одной транзакции на уведомление
+last_fired_writer = LastFiredWriter(DB_PATH, LAST_FIRED_BATCH, LAST_FIRED_FLUSH_SECONDS)
+
 
 # Глобальная переменная для отслеживания состояния работы
 running = True
-# Список активных процессов
-active_processes: list[multiprocessing.Process] = []
+# shutdown() уже выполнен
+stopped = False
+# Пул обработчиков расписаний (создаётся один раз в main)
+worker_pool: ThreadPoolExecutor | ProcessPoolExecutor | None = None
+# scp-репликация бэкапов (создаётся в main, см. create_backup_replicator)
+backup_replicator: BackupReplicator | None = None
+# Резервное копирование выполняется в отдельном потоке, не задерживая срабатывания
+backup_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="backup")
+# Состояние обработчика: VCron и временная зона создаются один раз на поток/процесс
+_worker_state = threading.local()
+# Экспорт метрик (MetricsServer, TextfileWriter), запускается в main
+metrics_exporters: list = []
+# Профилирование тиков по SIGUSR1
+tick_profiler = TickProfiler("rund_tick")
+# Пара сокетов для пробуждения sleep_until сигналами (создаётся в main, см. install_wakeup)
+wakeup_socket: tuple[socket.socket, socket.socket] | None = None
 
 
 def signal_handler(signum, frame):
     """
     Обработчик сигналов для корректного завершения работы.
+    Только снимает флаг running: сигнал может прийти, когда главный поток находится внутри
+    FireScheduler, LastFiredWriter или транзакции БД, поэтому shutdown() вызывается из main(),
+    а не отсюда. sleep_until просыпается сразу (см. install_wakeup).
     """
     global running
-    if signum == signal.SIGINT:
-        log.info("Получен сигнал прерывания (Ctrl-C). Завершаем работу...")
+    if signum in (signal.SIGINT, signal.SIGTERM):
+        if not running:
+            return  # повторный сигнал во время остановки не прерывает доставку очередей
+        if signum == signal.SIGINT:
+            log.info("Получен сигнал прерывания (Ctrl-C). Завершаем работу...")
+        else:
+            log.info("Получен сигнал SIGTERM. Завершаем работу...")
         running = False
-        for p in active_processes:
-            if p.is_alive():
-                log.debug(f"Завершаем процесс {p.pid}")
-                p.terminate()
-                p.join(timeout=5)
-                if p.is_alive():
-                    log.warning(f"Процесс {p.pid} не завершился корректно, убиваем принудительно")
-                    p.kill()
-        sys.exit(0)
+
+
+def install_wakeup():
+    """
+    Сигналы будят sleep_until: интерпретатор записывает номер сигнала в сокет
+    (signal.set_wakeup_fd), который sleep_until ждёт через select.
+    """
+    global wakeup_socket
+    reader, writer = socket.socketpair()
+    reader.setblocking(False)
+    writer.setblocking(False)
+    signal.set_wakeup_fd(writer.fileno(), warn_on_full_buffer=False)
+    wakeup_socket = (reader, writer)
+
+
+def profile_signal_handler(signum, frame):
+    """SIGUSR1: профилировать следующие TLCR_PROFILE_TICKS тиков."""
+    tick_profiler.request(PROFILE_TICKS)
+    log.info(f"Получен SIGUSR1: профилируем следующие {PROFILE_TICKS} тиков")
+
+
+def shutdown(wait: bool = True):
+    """
+    Останавливает пул обработчиков, дожидается доставки уже поставленных
+    в очередь уведомлений (не дольше TLCR_DELIVERY_DRAIN_SECONDS)
+    и записывает в БД накопленные last_fired.
+    Выполняется один раз, повторные вызовы ничего не делают.
+    """
+    global stopped
+    if stopped:
+        return
+    stopped = True
+    if worker_pool is not None:
+        worker_pool.shutdown(wait=wait, cancel_futures=not wait)
+    backup_executor.shutdown(wait=wait, cancel_futures=True)
+    if backup_replicator is not None:
+        backup_replicator.stop()
+    for exporter in metrics_exporters:
+        exporter.stop()
+    metrics_exporters.clear()
+    for queue in (telegram_queue, ntfy_queue):
+        if left := queue.stop(timeout=DELIVERY_DRAIN_SECONDS):
+            log.warning(f"Очередь {queue.name}: не доставлено {left} уведомлений при остановке")
+    http_client.close()
+    last_fired_writer.close()
+    close_connections()
 
 
 def get_message_from_json(message: str) -> str:
     """
     Если сообщение имеет формат '#!/path/to/file.json' или '#!path/to/file.json',
-    пытается загрузить JSON файл и найти сообщение для текущей даты.
+    ищет в JSON файле сообщение для текущей даты.
+    Файл разбирается один раз и кэшируется до изменения (lib.message_files).
     """
     if not message.startswith('#!'):
         return message
 
+    json_path = message[2:].strip()
     try:
-        json_path = message[2:].strip()
-        if not os.path.isfile(json_path):
-            log.error(f"Файл {json_path} не найден")
-            return message
-
-        with open(json_path, 'r', encoding='utf-8') as f:
-            messages = json.load(f)
-
-        if not isinstance(messages, list):
-            log.error(f"Содержимое файла {json_path} должно быть массивом")
-            return message
-
         today = datetime.now().strftime('%Y-%m-%d')
-
-        for item in messages:
-            if not isinstance(item, dict) or 'date' not in item or 'text' not in item:
-                continue
-            if item['date'] == today:
-                log.debug(f"Найдено сообщение для даты {today} в файле {json_path}")
-                return item['text']
+        text = message_files.text_for_date(json_path, today)
+        if text is not None:
+            log.debug(f"Найдено сообщение для даты {today} в файле {json_path}")
+            return text
 
         log.warning(f"В файле {json_path} не найдено сообщение для даты {today}")
         return ""
 
+    except FileNotFoundError:
+        log.error(f"Файл {json_path} не найден")
+        return message
     except json.JSONDecodeError as e:
         log.error(f"Ошибка при разборе JSON файла {json_path}: {e}")
         return message
+    except ValueError as e:
+        log.error(f"Файл {json_path}: {e}")
+        return message
     except Exception as e:
         log.error(f"Непредвиденная ошибка при обработке файла {json_path}: {e}")
         return message
 
 
-def send_telegram_message(message: str, chat_id: int):
+def _retry_after(response: requests.Response) -> float | None:
+    """Извлекает retry_after из ответа Telegram (parameters.retry_after) или заголовка Retry-After."""
+    try:
+        return float(response.json()["parameters"]["retry_after"])
+    except (ValueError, KeyError, TypeError):
+        pass
+    try:
+        return float(response.headers["Retry-After"])
+    except (KeyError, ValueError):
+        return None
+
+
+def send_telegram_message(message: str, chat_id: int) -> bool:
     """
     Отправляет сообщение в Telegram.
     Принимает уже обработанный текст (без shebang).
+
+    Returns:
+        bool: True, если сообщение доставлено; False при окончательной ошибке.
+
+    Raises:
+        RetryAfter: Telegram ответил 429/5xx или сеть недоступна — отправку нужно повторить
+            (для 429 — через retry_after, не засчитывая попытку).
     """
     today = datetime.now().strftime('%d-%m-%Y')
     formatted_message = f"{today}\n{message}"
@@ -123,16 +272,39 @@ def send_telegram_message(message: str, chat_id: int):
     url = f"https://api.telegram.org/bot{TELEGRAM_TOKEN}/sendMessage"
     data = {"chat_id": chat_id, "text": formatted_message}
     try:
-        response = requests.post(url, data=data)
-        response.raise_for_status()
-        log.debug(f"Сообщение успешно отправлено chat_id={chat_id}: {formatted_message}")
+        response = http_client.post(url, data=data)
     except requests.exceptions.RequestException as e:
-        log.error("Ошибка при отправке сообщения: %s, ошибка: %s", formatted_message, e)
+        log.warning("Ошибка сети при отправке сообщения chat_id=%s: %s, повторим позже", chat_id, e)
+        DELIVERY_HTTP_ERRORS.inc(channel="telegram", status="network")
+        raise RetryAfter() from e
 
+    if not response.ok:
+        DELIVERY_HTTP_ERRORS.inc(channel="telegram", status=response.status_code)
 
-def send_ntfy_message(url: str, message: str, title: str | None = None):
+    if response.status_code == 429 or response.status_code >= 500:
+        # Отсрочка по retry_after — только для 429; 5xx — ошибка, попытка засчитывается
+        retry_after = _retry_after(response) if response.status_code == 429 else None
+        log.warning(
+            "Telegram ответил %s для chat_id=%s, повтор через %s с",
+            response.status_code, chat_id, retry_after if retry_after is not None else "?",
+        )
+        raise RetryAfter(retry_after)
+    if not response.ok:
+        log.error(
+            "Ошибка при отправке сообщения: %s, ошибка: %s %s",
+            formatted_message, response.status_code, response.text,
+        )
+        return False
+
+    log.debug(f"Сообщение успешно отправлено chat_id={chat_id}: {formatted_message}")
+    return True
+
+
+def send_ntfy_message(url: str, message: str, title: str | None = None) -> bool:
     """
     Отправляет уведомление в ntfy.sh топик.
+    Возвращает True при успешной отправке, False при окончательной ошибке;
+    при ошибке сети или ответе 429/5xx бросает RetryAfter.
 
     ВАЖНО: HTTP-заголовки должны быть совместимы с latin-1.
     Если title содержит не-ASCII символы, заголовок Title не отправляется.
@@ -158,27 +330,41 @@ def send_ntfy_message(url: str, message: str, title: str | None = None):
             )
 
     try:
-        response = requests.post(url, data=message.encode("utf-8"), headers=headers)
-        response.raise_for_status()
-        log.debug(f"ntfy уведомление отправлено на {url}")
+        response = http_client.post(url, data=message.encode("utf-8"), headers=headers)
     except requests.exceptions.RequestException as e:
-        log.error("Ошибка при отправке ntfy на %s: %s", url, e)
+        log.warning("Ошибка сети при отправке ntfy на %s: %s, повторим позже", url, e)
+        DELIVERY_HTTP_ERRORS.inc(channel="ntfy", status="network")
+        raise RetryAfter() from e
+
+    if not response.ok:
+        DELIVERY_HTTP_ERRORS.inc(channel="ntfy", status=response.status_code)
+
+    if response.status_code == 429 or response.status_code >= 500:
+        log.warning("ntfy ответил %s для %s, повторим позже", response.status_code, url)
+        raise RetryAfter(_retry_after(response) if response.status_code == 429 else None)
+    if not response.ok:
+        log.error("Ошибка при отправке ntfy на %s: %s %s", url, response.status_code, response.text)
+        return False
+
+    log.debug(f"ntfy уведомление отправлено на {url}")
+    return True
 
 
 def replicate_backup_via_scp(backup_file_path: str):
     """
-    Копирует файл бэкапа по scp на один из двух удалённых хостов
-    в зависимости от чётности номера дня года.
+    Ставит файл бэкапа в очередь scp-репликации на один из двух удалённых хостов
+    в зависимости от чётности номера дня года. Отправка выполняется в фоне
+    (lib.backup_replication.BackupReplicator) с повторными попытками и контрольной суммой sha256.
 
     Требуется настроенная беспарольная авторизация ssh (ключ монтируется в контейнер
     и путь задаётся через TLCR_BACKUP_SSH_KEY_PATH).
 
-    TLCR_BACKUP_SCP_ODD       - scp-цель для нечётных дней (user@host:/path)
+    TLCR_BACKUP_SCP_ODD       - scp-цель для нечётных дней (user@host:/dir/ или user@host:/path/file)
     TLCR_BACKUP_SCP_EVEN      - scp-цель для чётных дней
     TLCR_BACKUP_SSH_PORT_ODD  - порт ssh/scp для нечётных дней (по умолчанию 22)
     TLCR_BACKUP_SSH_PORT_EVEN - порт ssh/scp для чётных дней
 
-    При неудаче отправляет уведомление в резервный ntfy-топик BACKUP_SCP_ERROR_NTFY_URL.
+    Если все попытки отправки неудачны, отправляет уведомление в резервный ntfy-топик BACKUP_SCP_ERROR_NTFY_URL.
 
     ВАЖНО: выполняется только в режиме prod (environment == "prod").
     """
@@ -207,55 +393,31 @@ def replicate_backup_via_scp(backup_file_path: str):
         )
         return
 
-    ssh_opts = "-o StrictHostKeyChecking=no -o UserKnownHostsFile=/dev/null"
-    key_part = f"-i {BACKUP_SSH_KEY_PATH}" if BACKUP_SSH_KEY_PATH else ""
-    port_part = f"-P {port}" if port else ""
-    cmd = f"scp {ssh_opts} {key_part} {port_part} {backup_file_path} {target}"
-
     log.info(
-        "Отправка бэкапа по scp (day_of_year=%d, %s день, port=%s): %s",
+        "Бэкап %s поставлен в очередь scp-репликации (day_of_year=%d, %s день): %s, port=%s",
+        backup_file_path,
         day_of_year,
         "нечётный" if is_odd else "чётный",
+        target,
         port,
-        cmd,
     )
-
-    try:
-        exit_code = os.system(cmd)
-        if exit_code == 0:
-            log.info("Бэкап %s успешно скопирован на %s", backup_file_path, target)
-        else:
-            msg = (
-                f"Ошибка scp бэкапа\n"
-                f"Файл: {backup_file_path}\n"
-                f"Цель: {target}\n"
-                f"Порт: {port}\n"
-                f"Код выхода: {exit_code}"
-            )
-            log.error(msg)
-            send_ntfy_message(BACKUP_SCP_ERROR_NTFY_URL, msg, title="Backup SCP ERROR")
-    except Exception as e:
-        msg = (
-            f"Исключение при scp бэкапа\n"
-            f"Файл: {backup_file_path}\n"
-            f"Цель: {target}\n"
-            f"Порт: {port}\n"
-            f"Ошибка: {e}"
-        )
-        log.error("Ошибка при отправке бэкапа по scp: %s", e)
-        send_ntfy_message(BACKUP_SCP_ERROR_NTFY_URL, msg, title="Backup SCP ERROR")
-
-
-def get_chat_id(chat_id_from_schedule):
-    chats = get_chats(DB_PATH)
-    return next(
-        (
-            chat['chat_id']
-            for chat in chats
-            if chat['id'] == chat_id_from_schedule
-        ),
-        None,
+    if backup_replicator is None:
+        log.warning("Репликация бэкапов не запущена, пропускаем scp для бэкапа %s", backup_file_path)
+        return
+    backup_replicator.put(backup_file_path, target, port)
+
+
+def backup_replication_failed(job: ReplicationJob):
+    """Отправляет аварийное уведомление, если бэкап так и не удалось реплицировать."""
+    msg = (
+        f"Ошибка scp бэкапа\n"
+        f"Файл: {job.file}\n"
+        f"Цель: {job.target}\n"
+        f"Порт: {job.port}\n"
+        f"Попыток: {job.attempts}\n"
+        f"Ошибка: {job.error}"
     )
+    ntfy_queue.put(partial(send_ntfy_message, BACKUP_SCP_ERROR_NTFY_URL, msg, "Backup SCP ERROR"))
 
 
 def calculate_age(birth_date: datetime, today: datetime) -> int:
@@ -268,12 +430,19 @@ def calculate_age(birth_date: datetime, today: datetime) -> int:
     return years
 
 
-def check_and_send(schedule, myVCron: VCron, timezone):
+def prepare_delivery(schedule, myVCron: VCron, timezone, now: datetime | None = None) -> dict | None:
     """
-    Проверяет расписание и отправляет уведомление, если необходимо.
-    Эта функция предназначена для запуска в отдельном процессе.
+    Проверяет расписание на момент now (по умолчанию — текущий) и готовит уведомление,
+    если оно должно сработать.
+    schedule — строка снимка get_tick_snapshot (с tg_chat_id и ntfy_url/ntfy_title),
+    поэтому обращений к БД здесь нет.
+    Сама отправка выполняется очередью доставки в основном процессе.
+
+    Returns:
+        dict | None: {"schedule_id", "chat_id", "text", "ntfy_url", "ntfy_title"}
+        или None, если отправлять нечего.
     """
-    now = datetime.now(timezone)
+    now = now or datetime.now(timezone)
     cron_expr = schedule["cron"]
     message = schedule["message"]
     modifier = schedule.get("modifier", "")
@@ -297,12 +466,10 @@ def check_and_send(schedule, myVCron: VCron, timezone):
             )
 
     if myVCron.check_cron(cron_expr, now) and myVCron.check_modifier(modifier, now):
-        log.info("Телеграфирую: %s", message)
-
-        chat_id = get_chat_id(schedule["chat_id"])
+        chat_id = schedule.get("tg_chat_id")
         if chat_id is None:
             log.error(f"Не найден chat_id для schedule_id={record_key}")
-            return
+            return None
 
         # Один раз формируем итоговый текст (учитывая shebang)
         actual_message = get_message_from_json(message)
@@ -313,92 +480,373 @@ def check_and_send(schedule, myVCron: VCron, timezone):
                 "после обработки shebang/message текст пустой",
                 record_key,
             )
-            return
+            return None
 
-        send_telegram_message(actual_message, chat_id)
-
-        update_last_fired(record_key, DB_PATH)
-        print(f"{now} уведомление по расписанию № {record_key}")
+        delivery = {
+            "schedule_id": record_key,
+            "chat_id": chat_id,
+            "text": actual_message,
+            "ntfy_url": None,
+            "ntfy_title": None,
+        }
 
         # Дублируем в ntfy, если канал назначен
         ntfy_id = schedule.get("ntfy_id")
         if ntfy_id:
-            ntfy = get_ntfy_channel(ntfy_id, DB_PATH)
-            if ntfy:
-                send_ntfy_message(ntfy["url"], actual_message, ntfy.get("title"))
+            if schedule.get("ntfy_url"):
+                delivery["ntfy_url"] = schedule["ntfy_url"]
+                delivery["ntfy_title"] = schedule.get("ntfy_title")
             else:
                 log.warning(f"ntfy канал id={ntfy_id} не найден для schedule_id={record_key}")
+        return delivery
+
+    log.debug(
+        f"Сообщение не отправлено: {message} "
+        f"(не соответствует условиям CRON:{cron_expr}({modifier})"
+    )
+    return None
+
+
+def mark_fired(schedule_id: int):
+    """Фиксирует срабатывание расписания после доставки в Telegram (запись в БД — отложенная)."""
+    last_fired_writer.add(schedule_id)
+    print(f"{datetime.now(pytz.timezone(TIMEZONE))} уведомление по расписанию № {schedule_id}")
+
+
+def dispatch(delivery: dict):
+    """Ставит подготовленное уведомление в очереди доставки Telegram и ntfy."""
+    telegram_queue.put(
+        partial(send_telegram_message, delivery["text"], delivery["chat_id"]),
+        key=delivery["chat_id"],
+        on_success=partial(mark_fired, delivery["schedule_id"]),
+    )
+    if delivery["ntfy_url"]:
+        ntfy_queue.put(partial(send_ntfy_message, delivery["ntfy_url"], delivery["text"], delivery["ntfy_title"]))
+
+
+def _init_worker(timezone_name: str, ignore_signals: bool = False, exact_minutes: bool = EXACT_MINUTES):
+    """
+    Инициализирует состояние обработчика пула (выполняется один раз на поток/процесс).
+    В режиме process процессы-обработчики игнорируют Ctrl-C и SIGTERM: завершением управляет main.
+    """
+    if ignore_signals:
+        signal.signal(signal.SIGINT, signal.SIG_IGN)
+        signal.signal(signal.SIGTERM, signal.SIG_IGN)
+    _worker_state.vcron = VCron(timezone_name, exact_minutes)
+    _worker_state.timezone = pytz.timezone(timezone_name)
+
+
+def check_batch(batch: list[dict], at: datetime | None = None) -> tuple[int, list[dict]]:
+    """
+    Проверяет пачку расписаний в обработчике пула на момент at (по умолчанию — текущий).
+
+    Returns:
+        tuple[int, list[dict]]: (проверено расписаний, подготовленные уведомления)
+    """
+    if not hasattr(_worker_state, "vcron"):
+        _init_worker(TIMEZONE)
+    # Сначала отбираем сработавшие расписания одной проверкой всей пачки
+    now = at or datetime.now(_worker_state.timezone)
+    due = _worker_state.vcron.match_many(batch, now, min_rows=MATCH_MANY_ROWS)
+    deliveries = []
+    for schedule in (batch[index] for index in due):
+        try:
+            if delivery := prepare_delivery(schedule, _worker_state.vcron, _worker_state.timezone, now):
+                deliveries.append(delivery)
+        except Exception as e:
+            log.error(f"Ошибка при обработке расписания {schedule.get('id')}: {e}")
+    return len(batch), deliveries
+
+
+def check_batch_profiled(batch: list[dict], at: datetime | None = None) -> tuple[int, list[dict], dict]:
+    """check_batch под cProfile: к результату добавляется статистика профилировщика обработчика."""
+    (evaluated, deliveries), stats = profile_call(check_batch, batch, at)
+    return evaluated, deliveries, stats
+
+
+def create_backup_replicator() -> BackupReplicator:
+    """
+    Создаёт очередь scp-репликации бэкапов. Очередь хранится рядом с бэкапами
+    и переживает перезапуск; оставшиеся в ней бэкапы отправляются после start().
+    """
+    return BackupReplicator(
+        os.path.join(BACKUP_DIR, "replication_queue.json"),
+        os.path.join(BACKUP_DIR, "outgoing"),
+        ssh_key_path=BACKUP_SSH_KEY_PATH,
+        on_failure=backup_replication_failed,
+    )
+
+
+def create_worker_pool() -> ThreadPoolExecutor | ProcessPoolExecutor:
+    """
+    Создаёт долгоживущий пул обработчиков расписаний.
+    Тип пула задаётся TLCR_WORKER_MODE (thread|process), размер — TLCR_WORKERS.
+    """
+    if WORKER_MODE == "process":
+        pool = ProcessPoolExecutor(
+            max_workers=WORKERS, initializer=_init_worker, initargs=(TIMEZONE, True, EXACT_MINUTES)
+        )
     else:
-        log.debug(
-            f"Сообщение не отправлено: {message} "
-            f"(не соответствует условиям CRON:{cron_expr}({modifier})"
+        if WORKER_MODE != "thread":
+            log.warning(f"Неизвестный TLCR_WORKER_MODE={WORKER_MODE!r}, используется thread")
+        pool = ThreadPoolExecutor(
+            max_workers=WORKERS, thread_name_prefix="rund-worker",
+            initializer=_init_worker, initargs=(TIMEZONE, False, EXACT_MINUTES)
+        )
+    log.info(f"Пул обработчиков: mode={WORKER_MODE}, workers={WORKERS}, batch={WORKER_BATCH}")
+    WORKER_POOL_SIZE.set(WORKERS)
+    return pool
+
+
+def run_tick(pool, schedules: list[dict], at: datetime | None = None) -> tuple[int, int]:
+    """
+    Раздаёт расписания пулу пачками по TLCR_WORKER_BATCH, ждёт результатов
+    и ставит подготовленные уведомления в очереди доставки.
+    Расписания проверяются на момент at (по умолчанию — текущий в каждом обработчике).
+    Логирует пропускную способность тика. Если запрошено профилирование (SIGUSR1),
+    тик выполняется под cProfile: в основном потоке и в каждом обработчике пула.
+
+    Returns:
+        tuple[int, int]: (проверено расписаний, поставлено в очередь уведомлений)
+    """
+    profiler = tick_profiler.begin()
+    worker = check_batch if profiler is None else check_batch_profiled
+    worker_stats = []
+    started = time.perf_counter()
+    futures = []
+    for i in range(0, len(schedules), WORKER_BATCH):
+        WORKER_POOL_PENDING.inc()
+        future = pool.submit(worker, schedules[i:i + WORKER_BATCH], at)
+        future.add_done_callback(lambda _: WORKER_POOL_PENDING.dec())
+        futures.append(future)
+    done, not_done = wait(futures, timeout=WORKER_TIMEOUT)
+    if not_done:
+        log.warning(f"{len(not_done)} пачек расписаний не обработаны за {WORKER_TIMEOUT} секунд")
+        WORKER_POOL_TIMEOUTS.inc(len(not_done))
+
+    evaluated = fired = 0
+    for future in done:
+        try:
+            batch_evaluated, deliveries, *stats = future.result()
+        except Exception as e:
+            log.error(f"Ошибка в обработчике пула: {e}")
+            continue
+        evaluated += batch_evaluated
+        worker_stats.extend(stats)
+        for delivery in deliveries:
+            log.info("Телеграфирую: %s", delivery["text"])
+            dispatch(delivery)
+        fired += len(deliveries)
+
+    elapsed = time.perf_counter() - started
+    rate = evaluated / elapsed if elapsed > 0 else 0.0
+    TICK_SECONDS.observe(elapsed)
+    LAST_TICK.set(int(time.time()))
+    SCHEDULES_EVALUATED.inc(evaluated)
+    SCHEDULES_FIRED.inc(fired)
+    log.info(
+        f"Тик: проверено {evaluated} расписаний, в очередь доставки {fired} "
+        f"за {elapsed:.3f} с ({rate:.0f} расп./с), очередь Telegram: {telegram_queue.depth}"
+    )
+    if profiler is not None:
+        try:
+            path = tick_profiler.end(profiler, f"{evaluated}sched_{elapsed * 1000:.0f}ms", worker_stats)
+            log.info(f"Профиль тика записан в {path} (осталось тиков: {tick_profiler.remaining})")
+        except Exception as e:
+            log.error(f"Не удалось сохранить профиль тика: {e}")
+    return evaluated, fired
+
+
+def start_metrics_exporters():
+    """Запускает HTTP-эндпоинт метрик (TLCR_METRICS_PORT) и запись в файл (TLCR_METRICS_TEXTFILE)."""
+    if METRICS_PORT:
+        try:
+            server = MetricsServer(METRICS_PORT, METRICS_HOST)
+        except OSError as e:
+            log.error(f"Не удалось запустить HTTP-эндпоинт метрик на {METRICS_HOST}:{METRICS_PORT}: {e}")
+        else:
+            server.start()
+            metrics_exporters.append(server)
+            log.info(f"Метрики доступны на http://{METRICS_HOST}:{METRICS_PORT}/metrics")
+    if METRICS_TEXTFILE:
+        writer = TextfileWriter(
+            METRICS_TEXTFILE, METRICS_TEXTFILE_SECONDS,
+            on_error=lambda e: log.warning(f"Не удалось записать метрики в {METRICS_TEXTFILE}: {e}"),
         )
+        writer.start()
+        metrics_exporters.append(writer)
+        log.info(f"Метрики записываются в {METRICS_TEXTFILE} раз в {writer.interval:g} с")
+
+
+def run_backup():
+    """
+    Создаёт резервную копию БД и реплицирует её по scp.
+    Выполняется в потоке backup_executor; если БД не менялась, копия не создаётся.
+    """
+    backup_file = backup_database(backup_dir=BACKUP_DIR, db_path=DB_PATH)
+    if backup_file:
+        replicate_backup_via_scp(str(backup_file))
+    close_connections()
+
+
+def sleep_until(wake_at: float):
+    """
+    Спит до момента wake_at (timestamp), просыпаясь раз в секунду для проверки running,
+    а после install_wakeup — сразу по сигналу.
+    """
+    while running:
+        remaining = wake_at - time.time()
+        if remaining <= 0:
+            return
+        if wakeup_socket is None:
+            time.sleep(min(1.0, remaining))
+            continue
+        reader = wakeup_socket[0]
+        if select.select([reader], [], [], min(1.0, remaining))[0]:
+            try:
+                while reader.recv(64):
+                    pass
+            except BlockingIOError:
+                pass
+
+
+def persist_next_fire(items):
+    """
+    Ставит новые времена срабатывания в отложенную запись next_fire.
+    items — пары (расписание из снимка, время); ревизия расписания защищает
+    от перезаписи next_fire, сохранённого при редактировании в веб-приложении.
+    """
+    for schedule, fire_at in items:
+        last_fired_writer.add_next_fire(
+            schedule["id"], int(fire_at.timestamp()) if fire_at else None, schedule.get("revision", 0)
+        )
+
+
+def run_due(scheduler: FireScheduler, now: datetime):
+    """
+    Обрабатывает наступившие срабатывания по группам с одинаковым временем.
+    Каждая группа проверяется на момент своего срабатывания, а не на момент пробуждения демона,
+    поэтому пробуждение, опоздавшее за границу часа (минуты в режиме TLCR_EXACT_MINUTES), не приводит
+    к пропуску. Срабатывания, опоздавшие больше чем на TLCR_FIRE_GRACE секунд после окончания
+    своего часа (минуты), пропускаются с предупреждением. Следующее время ищется с часа (минуты),
+    следующего за срабатыванием, поэтому в один час (минуту) расписание срабатывает не больше одного раза.
+    """
+    vcron = scheduler.vcron
+    for fire_at, due in scheduler.pop_due_by_time(now):
+        late = (now - vcron.period_start(fire_at) - vcron.step).total_seconds()
+        if late > FIRE_GRACE:
+            log.warning(
+                f"Пропущено срабатывание {fire_at.strftime('%d-%m-%Y %H:%M')} "
+                f"({len(due)} расписаний): опоздание {late:.0f} с"
+            )
+            # Следующее срабатывание ищем с текущего часа (минуты), а не перебираем пропущенные
+            resume_from = now - vcron.step
+        else:
+            run_tick(worker_pool, due, at=fire_at)
+            resume_from = fire_at
+        persist_next_fire((schedule, scheduler.reschedule(schedule, resume_from)) for schedule in due)
+
+
+def sync_schedules(scheduler, now, until: int, revisions: dict | None, window_until: int | None) -> dict:
+    """
+    Синхронизирует очередь срабатываний с БД, читая только изменившееся.
+
+    Полная загрузка (расписания с next_fire <= until) выполняется при первом вызове
+    и при изменении чатов или ntfy-каналов. Иначе подгружаются только расписания,
+    изменённые после известной ревизии, и те, чей next_fire попал в окно (window_until, until].
+
+    Returns:
+        dict: ревизии БД, соответствующие загруженному состоянию.
+    """
+    latest = get_revisions(DB_PATH)
+    if revisions is None or window_until is None or latest[REV_CHANNELS] != revisions[REV_CHANNELS]:
+        log.info(f"Загрузка расписаний ({now.strftime('%d-%m-%Y %H:%M:%S')})")
+        persist_next_fire(scheduler.load(get_tick_snapshot(DB_PATH, until=until), now))
+        return latest
+
+    if latest[REV_SCHEDULES] != revisions[REV_SCHEDULES]:
+        changed = get_tick_snapshot(DB_PATH, changed_since=revisions[REV_SCHEDULES])
+        removed = scheduler.retain(get_schedule_ids(DB_PATH))
+        persist_next_fire(scheduler.merge(changed, now))
+        log.info(f"Изменения расписаний: обновлено {len(changed)}, удалено {removed}")
+    else:
+        log.debug("Расписания в БД не изменились")
+
+    if until > window_until:
+        persist_next_fire(scheduler.merge(get_tick_snapshot(DB_PATH, until=until, since=window_until), now))
+    return latest
 
 
 def main():
     """Основная функция демона напоминаний."""
-    global running, active_processes
+    global worker_pool, backup_replicator
 
-    # Устанавливаем обработчик Ctrl-C
+    # Ctrl-C и SIGTERM (systemd, docker stop): главный цикл завершается, shutdown() доставляет
+    # очереди и записывает last_fired перед выходом
     signal.signal(signal.SIGINT, signal_handler)
+    signal.signal(signal.SIGTERM, signal_handler)
+    install_wakeup()
+    # kill -USR1 <pid> — профилировать следующие тики (сигнала нет в Windows)
+    if hasattr(signal, "SIGUSR1"):
+        signal.signal(signal.SIGUSR1, profile_signal_handler)
 
     timezone = pytz.timezone(TIMEZONE)
-    myVCron_local = VCron(TIMEZONE)
-    last_backup_time = time.time()
+    migrate_add_next_fire(DB_PATH)
+    migrate_add_revisions(DB_PATH)
+    worker_pool = create_worker_pool()
+    backup_replicator = create_backup_replicator()
+    backup_replicator.start()
+    scheduler = FireScheduler(VCron(TIMEZONE, EXACT_MINUTES))
+    SCHEDULER_QUEUE.set_function(lambda: len(scheduler))
+    start_metrics_exporters()
+    reload_interval = CHECK_MINUTES * 60
+    next_reload_at = next_backup_at = time.time()
+    revisions = window_until = None
+    backup_future = None
 
     log.info("Демон напоминаний запущен. Для завершения нажмите Ctrl-C")
 
-    while running:
-        try:
-            now = datetime.now(timezone)
-            log.info(f"Проверка расписаний ({now.strftime('%d-%m-%Y %H:%M:%S')})")
-
-            # Проверяем необходимость создания резервной копии
-            current_time = time.time()
-            work_time = int(current_time - last_backup_time)
-            if work_time >= BACKUP_HOURS * 3600 or work_time == 0:
-                try:
-                    backup_file = backup_database(backup_dir=BACKUP_DIR, db_path=DB_PATH)
-                    last_backup_time = current_time
-                    if backup_file:
-                        replicate_backup_via_scp(str(backup_file))
-                except Exception as e:
-                    log.error(f"Ошибка при создании резервной копии: {e}")
-
-            # Чистим список активных процессов от завершённых
-            active_processes = [p for p in active_processes if p.is_alive()]
-
-            if schedules := db_get_schedules(DB_PATH):
-                for schedule in schedules:
-                    if not running:
-                        break
-                    p = multiprocessing.Process(
-                        target=check_and_send,
-                        args=(schedule, myVCron_local, timezone),
+    try:
+        while running:
+            try:
+                # Резервная копия создаётся в фоне; при ошибке повторяем через TLCR_CHECK_MINUTES
+                current_time = time.time()
+                if backup_future is not None and backup_future.done():
+                    if (error := backup_future.exception()) is not None:
+                        log.error(f"Ошибка при создании резервной копии: {error}")
+                        next_backup_at = min(next_backup_at, current_time + reload_interval)
+                    backup_future = None
+                if current_time >= next_backup_at and backup_future is None:
+                    backup_future = backup_executor.submit(run_backup)
+                    next_backup_at = current_time + BACKUP_HOURS * 3600
+
+                # Раз в TLCR_CHECK_MINUTES проверяем ревизии БД и подхватываем изменения расписаний.
+                # В памяти держим только расписания, которые сработают до следующей проверки (по индексу next_fire)
+                if current_time >= next_reload_at:
+                    next_reload_at = current_time + reload_interval
+                    until = int(next_reload_at)
+                    revisions = sync_schedules(scheduler, datetime.now(timezone), until, revisions, window_until)
+                    window_until = until if window_until is None else max(window_until, until)
+
+                now = datetime.now(timezone)
+                run_due(scheduler, now)
+
+                if running:
+                    wake_at = min(next_reload_at, next_backup_at)
+                    if (next_fire := scheduler.next_fire_time()) is not None:
+                        wake_at = min(wake_at, next_fire.timestamp())
+                    log.info(
+                        f"Следующая проверка через {max(0, int(wake_at - time.time()))} секунд "
+                        f"(расписаний в очереди: {len(scheduler)})"
                     )
-                    log.debug(f"Выполнение расписания {schedule}")
-                    active_processes.append(p)
-                    p.start()
-
-                # Ждём завершения с таймаутом, чтобы не зависнуть
-                for p in active_processes:
-                    p.join(timeout=10)
-                    if p.is_alive():
-                        log.warning(f"Процесс {p.pid} не завершился вовремя")
-
-            if running:
-                CHECK_INTERVAL = CHECK_MINUTES * 60
-                log.info(f"Следующая проверка через {CHECK_INTERVAL} секунд")
-                for _ in range(CHECK_INTERVAL):
-                    if not running:
-                        break
-                    time.sleep(1)
-
-        except Exception as e:
-            log.error(f"Неожиданная ошибка в главном цикле: {e}")
-            if running:
-                time.sleep(60)
-
+                    sleep_until(wake_at)
+
+            except Exception as e:
+                log.error(f"Неожиданная ошибка в главном цикле: {e}")
+                if running:
+                    sleep_until(time.time() + 60)
+    finally:
+        shutdown()
     log.info("Демон напоминаний завершил работу")
 
 
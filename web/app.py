@@ -1,24 +1,104 @@
+import atexit
+import csv
+import hashlib
+import hmac
+import io
 import os
 import json
-import tempfile
-from datetime import datetime, timedelta
+import time
+from datetime import datetime, timezone
 from flask import (
-    Flask, request, jsonify, render_template,
-    redirect, url_for, abort, send_file, session, flash
+    Flask, request, jsonify, render_template, stream_template,
+    Response, make_response, redirect, url_for, abort, session, flash, g
 )
-from lib.cron_utils import VCron
+from lib.cron_utils import NextMatchCache, VCron
 from lib.db_utils import (
     DB_PATH, LOGLEVEL, LOGPATH,
-    add_schedule, delete_schedule, get_schedule, get_schedules,
-    init_db, init_log, update_schedule,
+    EXACT_MINUTES, SCHEDULE_FIELDS, add_schedule, add_schedules_many, delete_schedule, get_schedule, get_schedules, get_schedules_page, iter_schedules,
+    init_db, init_log, update_schedule, get_revisions, get_revisions_modified, REV_SCHEDULES,
     add_chat, get_chats, delete_chat,
     add_ntfy_channel, get_ntfy_channels, delete_ntfy_channel, migrate_add_ntfy,
+    migrate_add_next_fire, migrate_add_revisions, migrate_add_schedule_indexes,
     update_ntfy_channel, get_ntfy_channel
 )
-from lib.utils import get_environment_name, load_env as load_utils_env
+from lib.message_files import message_files
+from lib.metrics import CONTENT_TYPE as METRICS_CONTENT_TYPE, REGISTRY, Counter, Histogram, ProcessMetricsDir
+from lib.profiling import save_profile, start_profiler, stop_profiler
+from lib.utils import MyError, get_environment_name, load_env as load_utils_env
 
 
 WEB_LOG = None
+# Типы тела запроса /schedules_all, которые читаются построчно (одно расписание в строке)
+IMPORT_NDJSON_MIMETYPES = ("application/x-ndjson", "application/ndjson", "application/jsonl")
+IMPORT_READ_BUFFER = 64 * 1024
+# Сколько ошибок импорта возвращать в ответе
+IMPORT_ERRORS_LIMIT = 100
+# Размер страницы GET /schedules по умолчанию и максимальный
+SCHEDULES_PAGE_SIZE = 100
+SCHEDULES_MAX_PAGE_SIZE = 1000
+# Сколько строк выгрузки /export собирать в один фрагмент ответа
+EXPORT_CHUNK_ROWS = 500
+
+# Метрики веб-приложения (lib.metrics); endpoint — шаблон маршрута, а не фактический путь
+HTTP_REQUESTS = Counter(
+    "tlcr_http_requests_total", "HTTP-запросы по маршруту и коду ответа", ("method", "endpoint", "status")
+)
+HTTP_REQUEST_SECONDS = Histogram(
+    "tlcr_http_request_duration_seconds", "Длительность обработки HTTP-запросов (без отдачи потоковых ответов)",
+    ("endpoint",),
+)
+
+
+def _chunked(lines, size: int = EXPORT_CHUNK_ROWS):
+    """Объединяет строки выгрузки во фрагменты ответа по size строк."""
+    chunk = []
+    for line in lines:
+        chunk.append(line)
+        if len(chunk) >= size:
+            yield "".join(chunk)
+            chunk = []
+    if chunk:
+        yield "".join(chunk)
+
+
+def _export_json(rows):
+    """JSON-массив (формат POST /schedules_all), по одному расписанию в строке."""
+    yield "["
+    yield from _chunked(("," if n else "") + "\n" + json.dumps(row, ensure_ascii=False) for n, row in enumerate(rows))
+    yield "\n]\n"
+
+
+def _export_ndjson(rows):
+    """NDJSON: по одному расписанию в строке."""
+    yield from _chunked(json.dumps(row, ensure_ascii=False) + "\n" for row in rows)
+
+
+def _export_csv(rows):
+    """CSV с заголовком из SCHEDULE_FIELDS."""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+
+    def lines():
+        for row in rows:
+            writer.writerow(row.get(field) for field in SCHEDULE_FIELDS)
+            line = buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+            yield line
+
+    writer.writerow(SCHEDULE_FIELDS)
+    yield buffer.getvalue()
+    buffer.seek(0)
+    buffer.truncate()
+    yield from _chunked(lines())
+
+
+# Форматы /export: имя -> (MIME-тип, генератор фрагментов ответа)
+EXPORT_FORMATS = {
+    "json": ("application/json", _export_json),
+    "ndjson": ("application/x-ndjson", _export_ndjson),
+    "csv": ("text/csv", _export_csv),
+}
 
 
 class WebApp:
@@ -33,10 +113,24 @@ class WebApp:
         self.log = WEB_LOG
 
         self.load_env(env_file)
-        self.myVCron = VCron(timezone=self.timezone)
+        self.myVCron = VCron(timezone=self.timezone, exact_minutes=EXACT_MINUTES)
+        # Общий для всех запросов кэш get_next_match
+        self.next_match_cache = NextMatchCache(self.myVCron, maxsize=self.next_match_cache_size)
+        # Несколько процессов (воркеры gunicorn) сводят метрики через общий каталог,
+        # иначе GET /metrics отдавал бы счётчики одного случайного воркера
+        self.metrics_store = None
+        if self.metrics_dir:
+            self.metrics_store = ProcessMetricsDir(
+                self.metrics_dir, on_error=lambda e: self.log.error(f"Не удалось записать метрики: {e}")
+            )
+            self.metrics_store.start()
+            atexit.register(self.metrics_store.stop)
         self.setup_routes()
         init_db(drop_table=False)
         migrate_add_ntfy(self.db_path)
+        migrate_add_next_fire(self.db_path)
+        migrate_add_revisions(self.db_path)
+        migrate_add_schedule_indexes(self.db_path)
 
     def setup_app(self):
         self.app.config["def_chat_id"] = os.getenv("TLCR_TELEGRAM_CHAT_ID")
@@ -52,11 +146,18 @@ class WebApp:
 
         self.db_path = DB_PATH
         self.timezone = os.getenv("TLCR_TZ", "UTC")
+        self.next_match_cache_size = int(os.getenv("TLCR_NEXT_MATCH_CACHE_SIZE", "10000"))
 
         # Настройки аутентификации
         self.auth_user = os.getenv("TLCR_WEB_USER")
         self.auth_password = os.getenv("TLCR_WEB_PASSWORD")
         self.auth_enabled = bool(self.auth_user and self.auth_password)
+        # Если задан, GET /metrics требует заголовок Authorization: Bearer <токен>
+        self.metrics_token = os.getenv("TLCR_METRICS_TOKEN", "").strip()
+        # Общий каталог метрик процессов веб-приложения (задаётся gunicorn.conf.py)
+        self.metrics_dir = os.getenv("TLCR_METRICS_DIR", "").strip()
+        # Профилировать запросы (0 — выключено) и сохранять профили тех, что дольше порога, мс
+        self.profile_slow_ms = float(os.getenv("TLCR_PROFILE_SLOW_MS", "0"))
 
     @staticmethod
     def _calculate_age_for_date(birth_date: datetime, at_date: datetime) -> int:
@@ -65,23 +166,101 @@ class WebApp:
             years -= 1
         return years
 
-    def _validate_schedule_data(self, data):
-        if not data or "cron" not in data or "message" not in data:
-            abort(400, description="Неверный формат данных")
+    def _schedule_data_error(self, data) -> str | None:
+        """Возвращает описание ошибки в данных расписания или None, если данные корректны."""
+        if not isinstance(data, dict) or "cron" not in data or "message" not in data:
+            return "Неверный формат данных"
+        if not isinstance(data["cron"], str) or not isinstance(data["message"], str) or not data["message"]:
+            return "Неверный формат данных"
 
         if not self.myVCron.valid(data["cron"]):
-            abort(400, description=f'Invalid CRON expression: "{data["cron"]}"')
+            return f'Invalid CRON expression: "{data["cron"]}"'
 
-        # Валидация модификатора через VCron.check_modifier
+        # Проверяется только синтаксис модификатора: совпадение с текущей датой не требуется
         modifier = data.get("modifier", "") or ""
-        if modifier:
-            try:
-                now = datetime.now(tz=self.myVCron.timezone)
-                # check_modifier возвращает bool: False трактуем как неверный модификатор
-                if not self.myVCron.check_modifier(modifier, now):
-                    abort(400, description=f'Invalid modifier expression "{modifier}"')
-            except Exception:
-                abort(400, description=f'Invalid modifier expression "{modifier}"')
+        if not isinstance(modifier, str) or not self.myVCron.valid_modifier(modifier):
+            return f'Invalid modifier expression "{modifier}"'
+        return None
+
+    def _validate_schedule_data(self, data):
+        if error := self._schedule_data_error(data):
+            abort(400, description=error)
+
+    def _schedule_row(self, data, chat_ids: set, ntfy_ids: set) -> tuple:
+        """
+        Проверяет расписание из JSON API и возвращает кортеж (cron, message, modifier, chat_id, ntfy_id).
+        chat_id — id записи таблицы chats; если не указан, используется первый чат.
+
+        Raises:
+            ValueError: данные некорректны.
+        """
+        if error := self._schedule_data_error(data):
+            raise ValueError(error)
+        if not chat_ids:
+            raise ValueError("Нельзя добавить расписание: таблица chats пуста.")
+        try:
+            chat_id = int(data["chat_id"]) if data.get("chat_id") not in (None, "") else min(chat_ids)
+            ntfy_id = int(data["ntfy_id"]) if data.get("ntfy_id") not in (None, "") else None
+        except (TypeError, ValueError):
+            raise ValueError("chat_id и ntfy_id должны быть целыми числами")
+        if chat_id not in chat_ids:
+            raise ValueError(f"Чат с id={chat_id} не найден")
+        if ntfy_id is not None and ntfy_id not in ntfy_ids:
+            raise ValueError(f"ntfy-канал с id={ntfy_id} не найден")
+        return data["cron"], data["message"], data.get("modifier", "") or "", chat_id, ntfy_id
+
+    @staticmethod
+    def _schedules_query(args) -> dict:
+        """
+        Разбирает параметры GET /schedules в аргументы get_schedules_page.
+        Страница ограничивается, если задан limit или after (по умолчанию SCHEDULES_PAGE_SIZE).
+        """
+        query = {}
+        try:
+            for name, arg in (("after_id", "after"), ("chat_id", "chat_id"), ("ntfy_id", "ntfy_id"), ("limit", "limit")):
+                if args.get(arg, "") != "":
+                    query[name] = int(args[arg])
+            for name, arg in (("fired_from", "fired_from"), ("fired_to", "fired_to")):
+                if args.get(arg, "") != "":
+                    fired = datetime.fromisoformat(args[arg])
+                    # last_fired хранится в локальном времени сервера без зоны
+                    query[name] = fired.astimezone().replace(tzinfo=None) if fired.tzinfo else fired
+        except ValueError:
+            abort(400, description="Неверные параметры запроса: after, limit, chat_id, ntfy_id — целые числа, "
+                                   "fired_from, fired_to — дата и время в формате ISO 8601")
+        if "after_id" in query or "limit" in query:
+            query["limit"] = min(max(1, query.get("limit", SCHEDULES_PAGE_SIZE)), SCHEDULES_MAX_PAGE_SIZE)
+        if args.get("fields"):
+            fields = {field.strip() for field in args["fields"].split(",") if field.strip()}
+            if unknown := fields - set(SCHEDULE_FIELDS):
+                abort(400, description=f"Неизвестные поля: {', '.join(sorted(unknown))}")
+            query["fields"] = fields
+        return query
+
+    @staticmethod
+    def _import_records():
+        """
+        Возвращает записи импорта из тела запроса: пары (номер, данные или исключение разбора).
+        Для application/x-ndjson тело читается потоково по строкам (номер — номер строки),
+        иначе ожидается JSON-массив (номер — индекс элемента).
+        """
+        if request.mimetype in IMPORT_NDJSON_MIMETYPES:
+            def ndjson():
+                # LimitedStream читает строки побайтно — буферизуем
+                stream = io.BufferedReader(request.stream, IMPORT_READ_BUFFER)
+                for line_no, line in enumerate(stream, start=1):
+                    if not line.strip():
+                        continue
+                    try:
+                        yield line_no, json.loads(line)
+                    except ValueError as e:
+                        yield line_no, e
+            return "line", ndjson()
+
+        list_data = request.get_json()
+        if not isinstance(list_data, list):
+            abort(400, description="Ожидался массив расписаний")
+        return "index", enumerate(list_data)
 
     # --- Аутентификация (через сессию) ---
 
@@ -113,7 +292,88 @@ class WebApp:
 
         return wrapped
 
+    def conditional(self, view_func):
+        """
+        Декоратор условных GET-запросов (ETag / Last-Modified).
+
+        ETag строится по счётчикам ревизий БД, часу (ближайшие срабатывания
+        сдвигаются со временем; в режиме TLCR_EXACT_MINUTES — по минуте), версии приложения и запросу (путь и параметры).
+        Если клиент прислал совпадающий If-None-Match (или If-Modified-Since не раньше
+        последнего изменения), сразу отвечаем 304, не обращаясь к данным. If-None-Match сравнивается
+        слабо (RFC 7232): прокси со сжатием, например nginx с gzip, переписывают ETag в W/"...".
+        """
+        from functools import wraps
+
+        @wraps(view_func)
+        def wrapped(*args, **kwargs):
+            if request.method not in ("GET", "HEAD"):
+                return view_func(*args, **kwargs)
+
+            revisions, modified = get_revisions_modified(self.db_path)
+            period_start = self.myVCron.period_start(datetime.now(tz=self.myVCron.timezone))
+            query = "&".join(f"{key}={value}" for key, value in sorted(request.args.items(multi=True)))
+            key = "|".join((
+                *(f"{name}={value}" for name, value in sorted(revisions.items())),
+                str(int(period_start.timestamp())),
+                os.getenv("TAG", "dev"),
+                request.path,
+                query,
+            ))
+            etag = hashlib.blake2b(key.encode("utf-8"), digest_size=16).hexdigest()
+            last_modified = datetime.fromtimestamp(
+                max(modified or 0, int(period_start.timestamp())), tz=timezone.utc
+            )
+
+            if request.if_none_match:
+                not_modified = request.if_none_match.contains_weak(etag)
+            else:
+                not_modified = request.if_modified_since is not None and last_modified <= request.if_modified_since
+            if not_modified:
+                response = Response(status=304)
+            else:
+                response = make_response(view_func(*args, **kwargs))
+                if response.status_code != 200:
+                    return response
+            response.set_etag(etag)
+            response.last_modified = last_modified
+            # Кэшировать можно, но перед использованием копию нужно проверить
+            response.headers["Cache-Control"] = "no-cache"
+            return response
+
+        return wrapped
+
     def setup_routes(self):
+        @self.app.before_request
+        def start_timer():
+            g.request_started = time.perf_counter()
+            # Одновременно профилируется один запрос (см. lib.profiling.start_profiler): остальные
+            # выполняются как обычно, а не падают с ошибкой
+            if self.profile_slow_ms > 0 and (profiler := start_profiler()) is not None:
+                g.profiler = profiler
+
+        @self.app.teardown_request
+        def save_slow_profile(error=None):
+            profiler = g.pop("profiler", None)
+            if profiler is None:
+                return
+            stop_profiler(profiler)
+            elapsed_ms = (time.perf_counter() - g.request_started) * 1000
+            if elapsed_ms < self.profile_slow_ms:
+                return
+            try:
+                path = save_profile("web", f"{elapsed_ms:.0f}ms_{request.method}_{request.path}", [profiler])
+                self.log.info(f"Медленный запрос {request.method} {request.full_path} ({elapsed_ms:.0f} мс), профиль: {path}")
+            except Exception as e:
+                self.log.error(f"Не удалось сохранить профиль запроса: {e}")
+
+        @self.app.after_request
+        def record_metrics(response):
+            endpoint = request.url_rule.rule if request.url_rule is not None else "unmatched"
+            HTTP_REQUESTS.inc(method=request.method, endpoint=endpoint, status=response.status_code)
+            if (started := g.get("request_started")) is not None:
+                HTTP_REQUEST_SECONDS.observe(time.perf_counter() - started, endpoint=endpoint)
+            return response
+
         @self.app.route('/test')
         def test_route():
             return 'ok'
@@ -162,6 +422,7 @@ class WebApp:
 
         @self.app.route("/", methods=["GET", "POST"])
         @self.require_login
+        @self.conditional
         def schedules_view():
             if request.method == "POST":
                 cron = request.form.get("cron")
@@ -177,6 +438,7 @@ class WebApp:
                     ntfy_id_str = request.form.get("ntfy_id", "")
                     ntfy_id = int(ntfy_id_str) if ntfy_id_str else None
                     add_schedule(cron, message, modifier, int(chat_id), self.db_path, ntfy_id=ntfy_id)
+                    self.next_match_cache.invalidate()
                 except ValueError as e:
                     return render_template("error.html", text=str(e)), 400
                 return redirect(url_for("schedules_view"))
@@ -186,8 +448,15 @@ class WebApp:
             chats = get_chats(self.db_path)
             chat_map = {chat['id']: chat['name'] for chat in chats}
 
+            # next_fire хранится в БД; отсутствующие и устаревшие значения берём из кэша
+            self.next_match_cache.sync(get_revisions(self.db_path)[REV_SCHEDULES])
+            now = datetime.now(tz=self.myVCron.timezone)
+            period_start = self.myVCron.period_start(now).timestamp()
             for item in schedules:
-                next_match = self.myVCron.get_next_match(item['cron'], item['modifier'])
+                if item['next_fire'] is not None and item['next_fire'] >= period_start:
+                    next_match = datetime.fromtimestamp(item['next_fire'], self.myVCron.timezone)
+                else:
+                    next_match = self.next_match_cache.get_next_match(item['cron'], item['modifier'])
                 item['next'] = next_match.isoformat() if next_match else None
                 item['chat_name'] = chat_map.get(item['chat_id'])
 
@@ -221,49 +490,72 @@ class WebApp:
                 abort(404, description=f"Файл не найден: {file_path}")
 
             try:
-                with open(file_path, "r", encoding="utf-8") as f:
-                    rows = json.load(f)
-                if not isinstance(rows, list) or not all(
-                    isinstance(row, dict) and "date" in row and "text" in row for row in rows
-                ):
-                    abort(400, description="Файл должен содержать список словарей с ключами 'date' и 'text'")
+                message_file = message_files.load(file_path)
             except Exception as e:
                 abort(400, description=f"Ошибка чтения JSON файла: {e}")
+            if not message_file.valid:
+                abort(400, description="Файл должен содержать список словарей с ключами 'date' и 'text'")
+            # Элементы читаются из файла по мере отрисовки страницы, а не держатся в кэше
+            rows = message_files.iter_rows(file_path) if message_file.count else []
 
             tag = os.getenv("TAG", "dev")
-            return render_template("message_file.html", rows=rows, schedule=schedule, tag=tag)
+            return stream_template("message_file.html", rows=rows, schedule=schedule, tag=tag)
 
         @self.app.route("/schedules", methods=["GET"])
         @self.require_login
+        @self.conditional
         def list_schedules():
-            return jsonify(get_schedules(self.db_path))
+            # Без параметров возвращаются все расписания, как и раньше
+            query = self._schedules_query(request.args)
+            schedules, next_cursor = get_schedules_page(self.db_path, **query)
+            response = jsonify(schedules)
+            if next_cursor is not None:
+                response.headers["X-Next-Cursor"] = str(next_cursor)
+            return response
 
         @self.app.route("/schedules_all", methods=["POST"])
         @self.require_login
         def create_schedules_by_list():
-            list_data = request.get_json()
-            if isinstance(list_data, list):
-                if len(list_data) == 0:
-                    abort(400, description="Получен пустой массив")
-            else:
-                abort(400, description="Ожидался массив расписаний")
-
-            for data in list_data:
+            # Сначала проверяются все записи, затем они добавляются одной транзакцией
+            key, records = self._import_records()
+            chat_ids = {chat["id"] for chat in get_chats(self.db_path)}
+            ntfy_ids = {channel["id"] for channel in get_ntfy_channels(self.db_path)}
+            rows, errors = [], []
+            for position, data in records:
                 try:
-                    self._validate_schedule_data(data)
-                    add_schedule(data["cron"], data["message"], data.get("modifier", ""), self.db_path)
+                    if isinstance(data, Exception):
+                        raise ValueError(f"Ошибка разбора JSON: {data}")
+                    rows.append(self._schedule_row(data, chat_ids, ntfy_ids))
                 except ValueError as e:
-                    abort(400, description=str(e))
+                    errors.append({key: position, "error": str(e)})
+
+            if errors:
+                return jsonify({
+                    "status": "error",
+                    "error_count": len(errors),
+                    "errors": errors[:IMPORT_ERRORS_LIMIT],
+                }), 400
+            if not rows:
+                abort(400, description="Получен пустой массив")
+
+            try:
+                inserted = add_schedules_many(rows, self.db_path)
+            except MyError as e:
+                abort(500, description=str(e))
+            self.next_match_cache.invalidate()
 
-            return jsonify({"status": "success"}), 201
+            return jsonify({"status": "success", "inserted": inserted}), 201
 
         @self.app.route("/schedules", methods=["POST"])
         @self.require_login
         def create_schedule():
             data = request.get_json()
             try:
-                self._validate_schedule_data(data)
-                add_schedule(data["cron"], data["message"], data.get("modifier", ""), self.db_path)
+                chat_ids = {chat["id"] for chat in get_chats(self.db_path)}
+                ntfy_ids = {channel["id"] for channel in get_ntfy_channels(self.db_path)}
+                cron, message, modifier, chat_id, ntfy_id = self._schedule_row(data, chat_ids, ntfy_ids)
+                add_schedule(cron, message, modifier, chat_id, self.db_path, ntfy_id=ntfy_id)
+                self.next_match_cache.invalidate()
                 return jsonify({"status": "success"}), 201
             except ValueError as e:
                 abort(400, description=str(e))
@@ -272,12 +564,14 @@ class WebApp:
         @self.require_login
         def remove_schedule(schedule_id: int):
             delete_schedule(schedule_id, self.db_path)
+            self.next_match_cache.invalidate()
             return jsonify({"status": "deleted"})
 
         @self.app.route('/schedules/<int:schedule_id>/delete', methods=['POST'])
         @self.require_login
         def delete_schedule_post(schedule_id: int):
             delete_schedule(schedule_id, self.db_path)
+            self.next_match_cache.invalidate()
             return redirect(url_for('schedules_view'))
 
         @self.app.route("/schedules/<int:schedule_id>", methods=["POST"])
@@ -297,6 +591,7 @@ class WebApp:
                     int(data["chat_id"]),
                     self.db_path
                 )
+                self.next_match_cache.invalidate()
                 return jsonify({"status": "success"}), 200
             except ValueError as e:
                 abort(400, description=str(e))
@@ -333,12 +628,14 @@ class WebApp:
                     schedule_id, cron, message, modifier,
                     int(chat_id), self.db_path, ntfy_id=ntfy_id
                 )
+                self.next_match_cache.invalidate()
             except ValueError as e:
                 return render_template("error.html", text=str(e)), 400
             return redirect(url_for("schedules_view"))
 
         @self.app.route('/list/<int:schedule_id>', methods=['GET'])
         @self.require_login
+        @self.conditional
         def list_nexts(schedule_id: int):
             NEXT = int(os.getenv("TLCR_LIST_ITEMS", "10"))
             schedule = get_schedule(schedule_id, self.db_path)
@@ -362,7 +659,7 @@ class WebApp:
                     is_birthday = False
 
             for _ in range(NEXT):
-                next_match = self.myVCron.get_next_match(
+                next_match = self.next_match_cache.get_next_match(
                     cron_expression, modifier, start_time=current_time
                 )
                 if next_match is None:
@@ -375,10 +672,32 @@ class WebApp:
                     text = message
 
                 rows.append({"dt": next_match, "text": text})
-                current_time = next_match + timedelta(hours=1)
+                current_time = self.myVCron.timezone.normalize(
+                    self.myVCron.period_start(next_match) + self.myVCron.step
+                )
 
             return render_template("list.html", rows=rows, schedule=schedule)
 
+        @self.app.route("/stats", methods=["GET"])
+        @self.require_login
+        def stats():
+            """Статистика внутренних кэшей веб-приложения."""
+            return jsonify({"next_match_cache": self.next_match_cache.stats()})
+
+        @self.app.route("/metrics", methods=["GET"])
+        def metrics():
+            """
+            Метрики в текстовом формате Prometheus: всех воркеров при TLCR_METRICS_DIR, иначе текущего процесса.
+            Вход через сессию не требуется (сборщик метрик не умеет логиниться);
+            доступ можно ограничить токеном TLCR_METRICS_TOKEN.
+            """
+            if self.metrics_token:
+                expected = f"Bearer {self.metrics_token}".encode("utf-8")
+                if not hmac.compare_digest(request.headers.get("Authorization", "").encode("utf-8"), expected):
+                    abort(401)
+            body = self.metrics_store.render() if self.metrics_store is not None else REGISTRY.render()
+            return Response(body, mimetype=None, content_type=METRICS_CONTENT_TYPE)
+
         @self.app.route("/chats", methods=["GET", "POST"])
         @self.require_login
         def chats_view():
@@ -402,6 +721,7 @@ class WebApp:
         def delete_this_chat(chat_id: int):
             try:
                 delete_chat(chat_id, self.db_path)
+                self.next_match_cache.invalidate()
             except Exception as e:
                 self.log.error(f"Ошибка при удалении чата: {e}")
                 return render_template("error.html", text=f"Ошибка при удалении чата: {e}"), 500
@@ -464,17 +784,15 @@ class WebApp:
         @self.app.route('/export', methods=['GET'])
         @self.require_login
         def export_json():
-            schedules = get_schedules(self.db_path)
-            json_data = json.dumps(schedules, indent=4, ensure_ascii=False)
-            with tempfile.NamedTemporaryFile(delete=False, mode='w+', suffix='.json', encoding='utf-8') as temp_file:
-                temp_file.write(json_data)
-                temp_file.flush()
-
-            return send_file(
-                temp_file.name,
-                mimetype='application/json',
-                as_attachment=True,
-                download_name='schedules_export.json'
+            # Выгрузка идёт потоком из курсора БД: память не зависит от размера таблицы
+            export_format = request.args.get("format", "json").lower()
+            if export_format not in EXPORT_FORMATS:
+                abort(400, description=f"Неизвестный формат выгрузки: {export_format}")
+            mimetype, generate = EXPORT_FORMATS[export_format]
+            return Response(
+                generate(iter_schedules(self.db_path)),
+                mimetype=mimetype,
+                headers={"Content-Disposition": f"attachment; filename=schedules_export.{export_format}"},
             )
 
         @self.app.route("/drop_db", methods=["GET"])
@@ -483,6 +801,10 @@ class WebApp:
             try:
                 init_db(self.db_path)
                 migrate_add_ntfy(self.db_path)
+                migrate_add_next_fire(self.db_path)
+                migrate_add_revisions(self.db_path)
+                migrate_add_schedule_indexes(self.db_path)
+                self.next_match_cache.invalidate()
                 return redirect(url_for("schedules_view"))
             except Exception as e:
                 self.log.error("Ошибка при переинициализации БД: %s", str(e))